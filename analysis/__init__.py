@@ -0,0 +1 @@
+from .table import load_logs, read_tsv, concatenate, select
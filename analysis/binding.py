@@ -0,0 +1,159 @@
+'''
+Intentional binding across subjects: how much earlier the stimulus that
+follows a keypress is perceived on operant than on baseline trials, with
+and without masking. Run e.g.::
+
+    python -m analysis.binding logs
+
+to load every subject's clock-task logs and print the group results.
+'''
+import numpy as np
+import argparse
+
+from .table import load_logs, select
+
+def _flag(table, field, fill):
+    '''
+    a boolean column, with masked entries set to `fill`
+    '''
+    return table[field].filled(fill).astype(bool)
+
+def trial_filter(table, exclude_aware = True):
+    '''
+    Which rows of a loaded table are usable clock trials: not practice, not
+    catch trials, with a response, and (if `exclude_aware`) not masked
+    trials on which the subject reported seeing the stimulus.
+    '''
+    keep = np.isin(table['task'].data, ('masked', 'unmasked'))
+    keep &= ~_flag(table, 'practice', True)
+    keep &= ~_flag(table, 'catch', True)
+    keep &= ~np.ma.getmaskarray(table['overest_t'])
+    if exclude_aware:
+        keep &= ~(_flag(table, 'masked', False) & _flag(table, 'aware', False))
+    return keep
+
+def catch_detection(table):
+    '''
+    Each subject's rate of reporting masked catch trials (at full contrast)
+    as seen, which should be high if they were doing the task.
+
+    Returns
+    ----------
+    subs : np.ndarray
+        Subject IDs, sorted.
+    rate : np.ma.MaskedArray
+        Hit rate per subject (masked if they had no catch trials).
+    '''
+    subs, sub_idx = np.unique(table['sub'].data, return_inverse = True)
+    catch = _flag(table, 'catch', False) & ~_flag(table, 'practice', True)
+    catch &= _flag(table, 'masked', False)
+    n = np.bincount(sub_idx[catch], minlength = len(subs))
+    hits = np.bincount(
+        sub_idx[catch],
+        weights = _flag(table, 'aware', False)[catch],
+        minlength = len(subs)
+        )
+    rate = np.ma.masked_array(hits / np.maximum(n, 1), mask = n == 0)
+    return subs, rate
+
+def binding_effects(table, exclude_aware = True, min_catch_rate = None):
+    '''
+    Mean `overest_t` of each subject in each masked x operant condition,
+    computed for all subjects at once as grouped sums over the trials kept
+    by `trial_filter`.
+
+    Arguments
+    ----------
+    table : dict
+        As returned by `load_logs`.
+    exclude_aware : bool, default: True
+        Drop masked trials on which the stimulus was seen.
+    min_catch_rate : float, default: None
+        If given, drop subjects who reported seeing fewer than this
+        fraction of masked catch trials (see `catch_detection`).
+
+    Returns
+    ----------
+    results : dict
+        `subs`, the subject IDs; `mean` and `n`, (n_subs, 2, 2) arrays of
+        mean overestimation (in seconds) and trial counts, indexed by
+        [subject, masked, operant]; and `binding`, an (n_subs, 2) array of
+        baseline minus operant overestimation, indexed by [subject, masked],
+        so positive values mean the stimulus was perceived earlier after
+        an operant keypress. Empty cells are masked.
+    '''
+    subs, rate = catch_detection(table)
+    keep = trial_filter(table, exclude_aware)
+    if min_catch_rate is not None:
+        good = subs[rate.filled(0.) >= min_catch_rate]
+        keep &= np.isin(table['sub'].data, good)
+        subs = good
+    kept = select(table, keep)
+    sub_idx = np.searchsorted(subs, kept['sub'].data)
+    masked = _flag(kept, 'masked', False).astype(int)
+    operant = _flag(kept, 'operant', False).astype(int)
+    group = 4*sub_idx + 2*masked + operant
+    n_groups = 4*len(subs)
+    n = np.bincount(group, minlength = n_groups).reshape(-1, 2, 2)
+    total = np.bincount(
+        group,
+        weights = kept['overest_t'].data,
+        minlength = n_groups
+        ).reshape(-1, 2, 2)
+    mean = np.ma.masked_array(total / np.maximum(n, 1), mask = n == 0)
+    return dict(
+        subs = subs,
+        mean = mean,
+        n = n,
+        binding = mean[:, :, 0] - mean[:, :, 1]
+        )
+
+def summarize(results):
+    '''
+    prints group means of each condition and of the binding effect, with
+    standard errors and one-sample t statistics across subjects
+    '''
+    def stats(x):
+        x = x.compressed()
+        if len(x) < 2:
+            return len(x), np.mean(x) if len(x) else np.nan, np.nan, np.nan
+        sem = x.std(ddof = 1) / np.sqrt(len(x))
+        return len(x), x.mean(), sem, x.mean() / sem
+    row = '%-28s %6s %10s %10s %8s'
+    print(row%('', 'subs', 'mean (s)', 'sem', 't'))
+    for m, masked in enumerate(('unmasked', 'masked')):
+        for o, operant in enumerate(('baseline', 'operant')):
+            n, mean, sem, t = stats(results['mean'][:, m, o])
+            print(row%('%s %s'%(masked, operant), n,
+                        '%.4f'%mean, '%.4f'%sem, '%.2f'%t))
+    binding = results['binding']
+    for m, masked in enumerate(('unmasked', 'masked')):
+        n, mean, sem, t = stats(binding[:, m])
+        print(row%('binding, %s'%masked, n, '%.4f'%mean, '%.4f'%sem, '%.2f'%t))
+    n, mean, sem, t = stats(binding[:, 0] - binding[:, 1])
+    print(row%('binding, unmasked - masked', n,
+                '%.4f'%mean, '%.4f'%sem, '%.2f'%t))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.split('\n\n')[0])
+    parser.add_argument('log_dir', nargs = '?', default = 'logs')
+    parser.add_argument('--keep-aware', action = 'store_true',
+                        help = 'keep masked trials on which the stimulus was seen')
+    parser.add_argument('--min-catch-rate', type = float, default = None)
+    parser.add_argument('--workers', type = int, default = None)
+    parser.add_argument('--no-cache', action = 'store_true')
+    args = parser.parse_args()
+    table = load_logs(
+        args.log_dir,
+        tasks = ['masked', 'unmasked'],
+        workers = args.workers,
+        use_cache = not args.no_cache
+        )
+    results = binding_effects(
+        table,
+        exclude_aware = not args.keep_aware,
+        min_catch_rate = args.min_catch_rate
+        )
+    print('\n%d subjects\n'%len(results['subs']))
+    summarize(results)
@@ -0,0 +1,219 @@
+'''
+Loads every subject's behavioral logs (the TSV files TSVLogger writes to
+`logs/sub-*/beh`) into one columnar table: a dict of equal-length NumPy
+masked arrays, one per field, with 'n/a' entries masked, plus 'sub',
+'task' and 'run' columns saying where each row came from. Files are
+parsed in a process pool, and parsed files are cached in a .npz file in
+the log directory, keyed on their modification times, so loading again
+only parses files that are new or have changed.
+'''
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import glob
+import json
+import re
+import os
+
+CACHE_FNAME = 'beh_cache.npz'
+_FNAME = re.compile(r'sub-([^_]+)_task-([^_]+)_beh\.tsv$')
+
+def _parse_column(vals):
+    '''
+    converts a column of strings to the narrowest type that fits them all:
+    bool, int, float or str, with 'n/a' masked
+    '''
+    vals = np.asarray(vals, dtype = str)
+    mask = vals == 'n/a'
+    present = vals[~mask]
+    if len(present) == 0: # type unknown until merged with other files
+        return np.ma.masked_all(len(vals), dtype = float)
+    if np.isin(present, ('True', 'False')).all():
+        data = vals == 'True'
+    else:
+        filled = np.where(mask, '0', vals)
+        width = np.char.str_len(present).max()
+        for dtype in (np.int64, np.float64, 'U%d'%width):
+            try:
+                data = filled.astype(dtype)
+                break
+            except ValueError:
+                continue
+    return np.ma.masked_array(data, mask = mask)
+
+def read_tsv(fpath):
+    '''
+    Parses one TSVLogger file.
+
+    Returns
+    ----------
+    table : dict
+        A masked array for each field, and a 'run' column that counts
+        blocks within the file (a new one starts whenever the trial
+        number goes down).
+    '''
+    with open(fpath) as f:
+        header, *rows = f.read().split('\n')
+    fields = header.split('\t')
+    rows = [row.split('\t') for row in rows if row]
+    if rows:
+        cols = np.array(rows, dtype = str).T
+    else:
+        cols = np.empty((len(fields), 0), dtype = str)
+    table = {field: _parse_column(col) for field, col in zip(fields, cols)}
+    if 'trial' in table and len(rows):
+        trial = table['trial'].filled(0)
+        table['run'] = np.ma.masked_array(
+            np.concatenate([[1], 1 + np.cumsum(np.diff(trial) < 0)])
+            )
+    return table
+
+def n_rows(table):
+    return len(next(iter(table.values()))) if table else 0
+
+def _common_dtype(arrays):
+    '''
+    the dtype that all (not entirely masked) columns can be cast to
+    '''
+    dtypes = [a.dtype for a in arrays if a.count()] or [arrays[0].dtype]
+    if any(dt.kind == 'U' for dt in dtypes):
+        return np.dtype(str)
+    return np.result_type(*dtypes)
+
+def concatenate(tables):
+    '''
+    Stacks the rows of several tables, taking the union of their columns
+    (masked in tables that don't have them).
+    '''
+    tables = [table for table in tables if n_rows(table)]
+    if not tables:
+        return dict()
+    fields = []
+    for table in tables:
+        fields += [field for field in table if field not in fields]
+    merged = dict()
+    for field in fields:
+        have = [table[field] for table in tables if field in table]
+        dtype = _common_dtype(have)
+        if dtype.kind == 'U': # no common width
+            dtype = np.dtype('U%d'%max(
+                a.dtype.itemsize//4 for a in have if a.dtype.kind == 'U'))
+        pieces = []
+        for table in tables:
+            n = n_rows(table)
+            if field in table and table[field].count():
+                col = table[field]
+                pieces.append(np.ma.masked_array(
+                    col.data.astype(dtype), mask = np.ma.getmaskarray(col)
+                    ))
+            else:
+                pieces.append(np.ma.masked_all(n, dtype = dtype))
+        merged[field] = np.ma.concatenate(pieces)
+    return merged
+
+def select(table, rows):
+    '''
+    the given rows (a boolean mask or indices) of every column
+    '''
+    return {field: col[rows] for field, col in table.items()}
+
+def find_logs(log_dir = 'logs'):
+    '''
+    paths of all subjects' behavioral TSV files, by subject and task
+    '''
+    pattern = os.path.join(log_dir, 'sub-*', 'beh', 'sub-*_task-*_beh.tsv')
+    paths = glob.glob(pattern)
+    return sorted(p for p in paths if _FNAME.match(os.path.basename(p)))
+
+def _read_log(fpath):
+    '''
+    a file's table, labeled with its subject and task
+    '''
+    table = read_tsv(fpath)
+    n = n_rows(table)
+    sub, task = _FNAME.match(os.path.basename(fpath)).groups()
+    table['sub'] = np.ma.masked_array(np.full(n, sub))
+    table['task'] = np.ma.masked_array(np.full(n, task))
+    if 'run' not in table:
+        table['run'] = np.ma.masked_all(n, dtype = np.int64)
+    return table
+
+def _read_cache(fpath):
+    '''
+    Returns the cached table (of all files that were cached, one after
+    another), and the modification time and rows of each file in it.
+    '''
+    if not os.path.exists(fpath):
+        return dict(), dict()
+    with np.load(fpath) as npz:
+        index = json.loads(str(npz['index']))
+        table = {
+            field: np.ma.masked_array(
+                npz['data/' + field], mask = npz['mask/' + field]
+                )
+            for field in index['fields']
+            }
+    return table, {path: tuple(entry) for path, entry in index['files'].items()}
+
+def _write_cache(fpath, table, files):
+    arrays = dict()
+    for field, col in table.items():
+        arrays['data/' + field] = col.data
+        arrays['mask/' + field] = np.ma.getmaskarray(col)
+    index = dict(fields = list(table), files = files)
+    tmp = fpath + '.tmp.npz'
+    np.savez(tmp, index = np.array(json.dumps(index)), **arrays)
+    os.replace(tmp, fpath) # so an interrupted save doesn't break the cache
+
+def load_logs(log_dir = 'logs', tasks = None, workers = None, use_cache = True):
+    '''
+    Loads all subjects' behavioral logs into a single table.
+
+    Arguments
+    ----------
+    log_dir : str, default: 'logs'
+        The root log directory, as in experiment.py.
+    tasks : list of str, default: None
+        Only return these tasks (e.g. ['masked', 'unmasked']); all if None.
+    workers : int, default: None
+        Number of processes to parse files with; by default, one per CPU.
+    use_cache : bool, default: True
+        Whether to reuse (and update) the table cached in `log_dir`, which
+        holds all files that were found. Only files that aren't in it yet,
+        or that changed since, are parsed again.
+
+    Returns
+    ----------
+    table : dict
+        A masked array for each field, plus 'sub', 'task' and 'run'.
+    '''
+    paths = find_logs(log_dir)
+    mtimes = {p: os.path.getmtime(p) for p in paths}
+    cache_path = os.path.join(log_dir, CACHE_FNAME)
+    cached, files = _read_cache(cache_path) if use_cache else (dict(), dict())
+    fresh = [p for p in files if p in mtimes and files[p][0] == mtimes[p]]
+    stale = [p for p in paths if p not in fresh]
+    if stale or len(fresh) < len(files): # rebuild the table
+        rows = np.zeros(n_rows(cached), dtype = bool)
+        for p in fresh:
+            rows[files[p][1]:files[p][2]] = True
+        tables = [select(cached, rows)] if fresh else []
+        if stale:
+            with ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+                tables += list(pool.map(_read_log, stale))
+        table = concatenate(tables)
+        # fresh files keep their order, so just count rows again
+        start = 0
+        new_files = dict()
+        for p, n in zip(fresh, [files[p][2] - files[p][1] for p in fresh]):
+            new_files[p] = (files[p][0], start, start + n)
+            start += n
+        for p, t in zip(stale, tables[1 if fresh else 0:]):
+            new_files[p] = (mtimes[p], start, start + n_rows(t))
+            start += n_rows(t)
+        if use_cache:
+            _write_cache(cache_path, table, new_files)
+    else:
+        table = cached
+    if tasks is not None and table:
+        table = select(table, np.isin(table['task'].data, tasks))
+    return table
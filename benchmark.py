@@ -0,0 +1,195 @@
+'''
+Micro-benchmarks for constructing the trial components and for their
+per-frame draw calls, run in a hidden window (see util.simulation; on a
+machine without a display, run under e.g. `xvfb-run`)::
+
+    python benchmark.py                  # report, and compare to baseline
+    python benchmark.py --save-baseline  # store this run as the baseline
+
+For each benchmark this reports percentiles of wall-clock and CPU time
+(in ms) and the memory allocated per call (in KB, traced in a separate
+pass). The script exits with status 1 when any benchmark's median or
+95th percentile, of either time, is more than TOLERANCE slower than in
+the baseline. Timings depend on the machine, so the baseline isn't kept
+in the repo: save one with `--save-baseline` on the machine (or CI
+runner) before making changes. Without a baseline, the script reports
+the timings and exits with status 1, since there's nothing to check.
+'''
+from functools import partial
+import numpy as np
+import tracemalloc
+import json
+import time
+import sys
+import os
+
+from util.cfs import CFSMask, MaskedStimulus
+from util.clock import LibetClock
+from util.input.scripted import ScriptedKeyboard
+from util.simulation import offscreen_window
+
+BASELINE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                        'benchmark_baseline.json')
+TOLERANCE = .2 # fraction slower than baseline that counts as a regression
+MIN_SLOWDOWN = .05 # ms; ignore smaller differences, which are just noise
+N_CONSTRUCT = 20
+N_FRAMES = 600
+MASK_SIZE = 370
+RED = (1, 0, 0)
+BLUE = (0, 0, 1)
+
+def measure(func, n, between = None, cleanup = None):
+    '''
+    Times `n` calls of `func`, running `between` (untimed) after each.
+    Whatever `func` returns is kept until all calls are timed, so that
+    timings don't include cleaning up the previous call's objects, and is
+    then passed to `cleanup` (e.g. to stop it autodrawing during later
+    benchmarks).
+
+    Returns
+    ----------
+    times : np.ndarray
+        Wall-clock milliseconds per call.
+    cpu : np.ndarray
+        Milliseconds of this process's CPU time per call.
+    alloc : float
+        Mean KB allocated per call, from a second, traced pass.
+    '''
+    def run(traced):
+        times = np.empty(n)
+        cpu = np.empty(n)
+        allocated = 0
+        kept = []
+        for i in range(n):
+            if traced:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+            t0, c0 = time.perf_counter(), time.process_time()
+            kept.append(func())
+            cpu[i] = (time.process_time() - c0) * 1000
+            times[i] = (time.perf_counter() - t0) * 1000
+            if traced:
+                allocated += tracemalloc.get_traced_memory()[1] - before
+            if between is not None:
+                between()
+        if cleanup is not None:
+            for obj in kept:
+                cleanup(obj)
+        return times, cpu, allocated / n / 1024
+    times, cpu, _ = run(traced = False)
+    tracemalloc.start()
+    _, _, alloc = run(traced = True)
+    tracemalloc.stop()
+    return times, cpu, alloc
+
+def summarize(times, cpu, alloc):
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    cpu_p50, cpu_p95 = np.percentile(cpu, [50, 95])
+    return dict(
+        p50 = p50, p95 = p95, p99 = p99, max = times.max(),
+        cpu_p50 = cpu_p50, cpu_p95 = cpu_p95, kb = alloc
+        )
+
+def _closed_clock(win, kb, radius):
+    clock = LibetClock(win, kb, radius)
+    clock.close()
+    return clock
+
+def run_benchmarks(win):
+    kb = ScriptedKeyboard(lambda: []) # never presses anything
+    radius = np.sqrt(2*(MASK_SIZE/2)**2)
+    results = dict()
+    # so each benchmark's masks stop autodrawing before the next one
+    hide = lambda mask: mask.hide()
+
+    ## construction
+    # load the textures first, so we time the rest
+    CFSMask(win, RED, size = MASK_SIZE).hide()
+    results['CFSMask()'] = measure(
+        lambda: CFSMask(win, RED, size = MASK_SIZE),
+        N_CONSTRUCT,
+        cleanup = hide
+        )
+    results['LibetClock()'] = measure(
+        partial(_closed_clock, win, kb, radius),
+        N_CONSTRUCT
+        )
+    clock = LibetClock(win, kb, radius)
+    results['LibetClock.reset()'] = measure(clock.reset, N_CONSTRUCT)
+    clock.close()
+    results['MaskedStimulus()'] = measure(
+        lambda: MaskedStimulus(win, BLUE, MASK_SIZE, contrast = 1.),
+        N_CONSTRUCT
+        )
+
+    ## per-frame draws
+    mask = CFSMask(win, RED, size = MASK_SIZE)
+    results['CFSMask.draw'] = measure(mask.draw, N_FRAMES, between = win.flip)
+    mask.hide()
+    del mask
+    clock = LibetClock(win, kb, radius)
+    clock.start()
+    results['LibetClock.draw'] = measure(
+        partial(clock.draw, 60.), N_FRAMES,
+        between = win.flip
+        )
+    clock.close()
+    del clock
+    stim = MaskedStimulus(win, BLUE, MASK_SIZE, contrast = 1.)
+    stim.present(time_from_now = 0., duration = 3600.)
+    results['MaskedStimulus.draw'] = measure(
+        stim.draw, N_FRAMES,
+        between = win.flip
+        )
+    return {name: summarize(*res) for name, res in results.items()}
+
+def compare(results, baseline):
+    '''
+    returns a list of descriptions of regressions against the baseline
+    '''
+    regressions = []
+    for name, res in results.items():
+        if name not in baseline:
+            continue
+        for stat in ('p50', 'p95', 'cpu_p50', 'cpu_p95'):
+            if stat not in baseline[name]: # saved by an older version
+                continue
+            old, new = baseline[name][stat], res[stat]
+            if new > old*(1 + TOLERANCE) and new - old > MIN_SLOWDOWN:
+                regressions.append(
+                    '%s %s: %.3f ms -> %.3f ms'%(name, stat, old, new)
+                    )
+    return regressions
+
+
+if __name__ == '__main__':
+    win = offscreen_window(size = (800, 800), units = 'pix')
+    results = run_benchmarks(win)
+    win.close()
+
+    row = '%-22s' + ' %9s'*6 + ' %10s'
+    print(row%('', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms',
+                'cpu p50', 'cpu p95', 'KB/call'))
+    for name, res in results.items():
+        print(row%(
+            name,
+            '%.3f'%res['p50'], '%.3f'%res['p95'],
+            '%.3f'%res['p99'], '%.3f'%res['max'],
+            '%.3f'%res['cpu_p50'], '%.3f'%res['cpu_p95'],
+            '%.1f'%res['kb']
+            ))
+
+    if '--save-baseline' in sys.argv:
+        with open(BASELINE, 'w') as f:
+            json.dump(results, f, indent = 2)
+        print('\nSaved baseline to %s'%BASELINE)
+    elif not os.path.exists(BASELINE):
+        print('\nNo baseline at %s! Save one with --save-baseline.'%BASELINE)
+        sys.exit(1)
+    else:
+        with open(BASELINE) as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            print('\nSlower than baseline:\n    ' + '\n    '.join(regressions))
+            sys.exit(1)
+        print('\nNo regressions against baseline.')
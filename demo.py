@@ -6,6 +6,7 @@ from psychopy import core, visual
 
 from util.cfs import init_window, CFSMask, MaskedStimulus
 from util.clock import LibetClock
+from util.capture import FrameCapture
 
 
 SIZE = 370 # size of mask in pixels
@@ -41,6 +42,7 @@ class MockKeyboard:
 
 kb = MockKeyboard()
 win = init_window(size = WIN_SIZE, units = 'pix')
+capture = FrameCapture(win, 'side-by-side.mp4', fps = 60.)
 
 # masks on one side ...
 mask = CFSMask(win, RED, size = SIZE, pos = MASK_POS)
@@ -79,7 +81,7 @@ while clock1.spinning:
     mask.draw()
     divider.draw()
     win.flip()
-    win.getMovieFrame()
+    capture.grab()
 mask.terminate()
 timer = core.Clock()
 timer.reset()
@@ -90,7 +92,7 @@ while timer.getTime() < 5.:
     mask.draw()
     divider.draw()
     win.flip()
-    win.getMovieFrame()
+    capture.grab()
 
 del clock1
 del clock2
@@ -99,6 +101,5 @@ del _mask
 del divider
 del stim 
 
-fname = 'side-by-side.mp4'
-win.saveMovieFrames(fname)
+capture.close()
 win.close()
@@ -1,8 +1,11 @@
-from util.trials import discrimination_trial, clock_trial
+from util.trials import discrimination_trial, clock_trial, TrialPipeline
 from util.input import get_keyboard
 from util.cfs import init_window
-from util.logging import TSVLogger
-from util.bopt import QuestObject
+from util.logging import TSVLogger, FlipTimingLogger, FrameLogger
+from util.timeline import FRAME_TIMING_FIELDS
+from util.bopt import JointQuest
+from util.plan import compile_session, SessionPlan
+from util.cfs.cache import get_texture_cache
 from util.instructions import (
     discrimination_instructions,
     clock_instructions_masked,
@@ -14,6 +17,7 @@ from util.instructions import (
 )
 from psychopy import core
 import numpy as np
+import sys
 import os
 
 MASK_SIZE = 370 # size of mask in pixels
@@ -23,14 +27,38 @@ FRAME_RATE = 60.
 SCREEN_SIZE = (1920, 1080) # in pixels
 LOG_DIRECTORY = 'logs'
 KB_NAME = 'Dell Dell USB Keyboard'
+RECORD_FRAME_TIMING = False # log per-flip timing alongside trial logs
+RECORD_FRAMES = False # log what was on screen on every flip, likewise
 
-CALIBRATION_BLOCK_TRIALS = 100
+CALIBRATION_BLOCK_TRIALS = 100 # at most
+# stop calibrating early once the posterior's 90% credible interval for the
+# threshold is narrower than this (in log10 units), or None to run all trials;
+# see `python -m util.calibration --stop-width ...` to check the trade-off
+CALIBRATION_STOP_WIDTH = None
+MIN_CALIBRATION_TRIALS = 40
 CLOCK_BLOCK_TRIALS = 40 # per block; there are four blocks
 PRACTICE_TRIALS = 5
 CATCH_TRIALS = 5
 
+# `python experiment.py --plan <plan file>` reruns a saved session plan
+PLAN_FILE = sys.argv[sys.argv.index('--plan') + 1] if '--plan' in sys.argv else None
+
+# `python experiment.py --simulate <subject number>` runs the whole protocol
+# with a simulated observer, offscreen and in virtual time (see util.simulation)
+SIMULATE = '--simulate' in sys.argv
+if SIMULATE:
+    from util.simulation import (
+        install_virtual_time,
+        offscreen_window,
+        SimulatedObserver
+        )
+    install_virtual_time() # before any clocks are created
+
 ## experimenter inputs subject identifier from Terminal
-sub_num = input("Enter subject number: ")
+if SIMULATE:
+    sub_num = sys.argv[sys.argv.index('--simulate') + 1]
+else:
+    sub_num = input("Enter subject number: ")
 sub_num = int(sub_num)
 sub_id = '%02d'%sub_num
 sub_dir = os.path.join(LOG_DIRECTORY, 'sub-%s'%sub_id)
@@ -41,21 +69,70 @@ if os.path.exists(sub_dir):
 timer = core.Clock()
 timer.reset(0.)
 
-win = init_window(
-    size = SCREEN_SIZE,
-    units = 'pix',
-    screen = -1,
-    allowGUI = False
-    )
-kb = get_keyboard(KB_NAME)
+if SIMULATE:
+    win = offscreen_window(FRAME_RATE, size = SCREEN_SIZE, units = 'pix')
+    kb = SimulatedObserver(frame_rate = FRAME_RATE)
+    kb.install()
+else:
+    win = init_window(
+        size = SCREEN_SIZE,
+        units = 'pix',
+        screen = -1,
+        allowGUI = False
+        )
+    kb = get_keyboard(KB_NAME, threaded = True)
 trial_params = dict(
     win = win,
     kb = kb,
     mask_color = RED,
     mask_size = MASK_SIZE,
     stim_color = BLUE,
-    frame_rate = FRAME_RATE
+    frame_rate = FRAME_RATE,
+    frame_timing = RECORD_FRAME_TIMING
 )
+# builds each trial's stimuli while the previous one waits for a response
+pipeline = TrialPipeline()
+
+## plan the whole session up front, and save the plan with the logs
+if PLAN_FILE is None:
+    textures = get_texture_cache(win)
+    plan = compile_session(
+        sub_id,
+        n_mondrians = len(textures.mondrians),
+        n_masks = len(textures.masks),
+        calibration_trials = CALIBRATION_BLOCK_TRIALS,
+        clock_block_trials = CLOCK_BLOCK_TRIALS,
+        practice_trials = PRACTICE_TRIALS,
+        catch_trials = CATCH_TRIALS
+        )
+else:
+    plan = SessionPlan.load(PLAN_FILE)
+os.makedirs(os.path.join(sub_dir, 'beh'))
+plan.save(os.path.join(sub_dir, 'beh', 'sub-%s_plan.json'%sub_id))
+np.random.seed(plan.seed % 2**32) # for anything left to chance at run time
+
+def queue_first_trial(block, **params):
+    '''
+    prepares a block's first trial, e.g. before showing its instructions
+    '''
+    pipeline.queue(**params, **block.trials[0].trial_kwargs())
+    pipeline.prefetch()
+
+def timing_log(task, run = None):
+    '''
+    opens a sidecar for raw flip times, if we're recording them
+    '''
+    if not RECORD_FRAME_TIMING:
+        return None
+    return FlipTimingLogger(sub_id, task, run, LOG_DIRECTORY)
+
+def frame_log(task, run = None):
+    '''
+    opens a per-frame record of a block, if we're recording one
+    '''
+    if not RECORD_FRAMES:
+        return None
+    return FrameLogger(sub_id, task, run, LOG_DIRECTORY)
 
 ## CALIBRATION BLOCK ##########################################################
 # initialize logger
@@ -63,20 +140,28 @@ fields = [
     'trial', 'onset',
     'contrast', 'stimulus_position',
     'response', 'correct',
-    'logC_5th_perc', 'logC_mean', 'logC_95th_perc'
+    'logC_5th_perc', 'logC_mean', 'logC_95th_perc',
+    'stop_reason'
     ]
+if RECORD_FRAME_TIMING:
+    fields += FRAME_TIMING_FIELDS
 log = TSVLogger(sub_id, 'discrimination', fields, LOG_DIRECTORY)
+flip_log = timing_log('discrimination')
+frames = frame_log('discrimination')
 # initialize QUEST with log-scale priors for threshold location
 tGuess, tGuessSd = -.5, .5 # approximately mean ~ .6, sd ~ 1. on linear scale
 # psychometric function params
 pThreshold = 0.525 # threshold criterion (i.e. minimum accuracy of interest)
-beta = 3.5 # slope to use during optimization (3.5 if on log10 scale)
+beta = 3.5 # prior guess at slope (3.5 if on log10 scale), which is fit as we go
 delta = 0.01 # lapse rate, usually 0.01
 gamma = 0.5 # chance performance
-quest = QuestObject(tGuess, tGuessSd, pThreshold, beta, delta, gamma)
+quest = JointQuest(tGuess, tGuessSd, pThreshold, beta, delta, gamma)
 
+block = plan.block('discrimination')
+queue_first_trial(block, **trial_params)
 discrimination_instructions(win, kb)
-for trial in range(1, CALIBRATION_BLOCK_TRIALS + 1):
+for trial_plan, next_plan in zip(block.trials, block.trials[1:] + [None]):
+    trial = trial_plan.trial
     # record trial onset time
     t0 = timer.getTime()
     # get descriptive stats of current posterior for records
@@ -86,11 +171,30 @@ for trial in range(1, CALIBRATION_BLOCK_TRIALS + 1):
     # next contrast drawn from mean-truncated posterior, i.e. Thompson sampling
     contrast = 10**quest.draw_from_post(lower_cutoff = post_mean)
     contrast = np.clip(contrast, a_min = 0., a_max = 1.) # enforce range
+    # next trial's stimuli don't depend on its contrast, so can be prepared now
+    if next_plan is not None:
+        pipeline.queue(**trial_params, **next_plan.trial_kwargs())
     # now see if subject can tell us what side masked stim is on
-    trial_data = discrimination_trial(stim_contrast = contrast, **trial_params)
+    if frames is not None:
+        frames.begin_trial(trial)
+    trial_data = discrimination_trial(
+        stim_contrast = contrast,
+        pipeline = pipeline,
+        frame_log = frames,
+        **trial_params,
+        **trial_plan.trial_kwargs()
+        )
     accuracy = trial_data['correct']
     # and update posterior accordingly
     quest.update(np.log10(contrast), int(accuracy))
+    # then check whether we've learned enough to stop
+    stop_reason = 'n/a'
+    ci_width = quest.quantile(.95) - quest.quantile(.05)
+    if CALIBRATION_STOP_WIDTH is not None and trial >= MIN_CALIBRATION_TRIALS \
+        and ci_width < CALIBRATION_STOP_WIDTH:
+        stop_reason = 'converged'
+    elif next_plan is None:
+        stop_reason = 'max_trials'
     # then add everything to experiment log
     log.write(
         trial = trial,
@@ -98,15 +202,27 @@ for trial in range(1, CALIBRATION_BLOCK_TRIALS + 1):
         logC_mean = post_mean,
         logC_5th_perc = post_5th_perc,
         logC_95th_perc = post_95th_perc,
+        stop_reason = stop_reason,
         **trial_data
         )
+    if flip_log is not None:
+        flip_log.write(trial = trial, **trial_data)
+    if stop_reason != 'n/a':
+        print('\n\nCalibration stopped after %d trials (%s).\n\n'%(
+            trial, stop_reason))
+        break
+pipeline.clear() # in case we stopped early
 log.close()
+if flip_log is not None:
+    flip_log.close()
+if frames is not None:
+    frames.close()
 post_block_instructions(win, kb)
 
 ## based on behavioral results above, #########################################
 ## pick stimulation intensity for the rest of the experiment... ###############
-quest.beta_analysis() # Re-fit with slope as free parameter,
-contrast = 10**quest.quantile(.05) # and use lower edge of .9 credible interval
+# posterior already accounts for uncertainty in slope, so no need to re-fit;
+contrast = 10**quest.quantile(.05) # use lower edge of .9 credible interval
 print('\n\nBelow-threshold contrast is %.03f.\n\n'%contrast)
 contrast = np.min([contrast, 1.]) # clip back to range
 
@@ -118,74 +234,79 @@ fields = [
     'event_t', 'event_angle', 'resp_angle', 'overest_t', 'overest_angle',
     'initial_offset_angle', 'aware'
 ]
-# pick a position for operant stimulus
-trial_params['stim_position'] = np.random.choice([
-    'upper_left', 'upper_right',
-    'lower_left', 'lower_right'
-    ])
+if RECORD_FRAME_TIMING:
+    fields += FRAME_TIMING_FIELDS
 
-def clock_block(mask, operant, contrast, params, log):
+def clock_params(block, contrast, params):
     '''
-    define how a single block will go
+    shared arguments to `clock_trial` for every trial in a planned block
     '''
-    # set stim intensity to zero for baseline trials
-    if not operant:
-        contrast = 0. # for baseline condition
-    # figure out trial order (i.e. which will be catch trials)
-    if mask:
-        _catch = CATCH_TRIALS*[True] + CLOCK_BLOCK_TRIALS*[False]
-    else: # no catch trials needed if no masking
-        _catch = CLOCK_BLOCK_TRIALS*[False]
-    np.random.shuffle(_catch)
-    # add practice trials to order
-    _practice = PRACTICE_TRIALS*[True] + len(_catch)*[False]
-    if mask:
-        catch_practice = [True] + (PRACTICE_TRIALS - 1)*[False]
-    else:
-        catch_practice = PRACTICE_TRIALS*[False]
-    np.random.shuffle(catch_practice)
-    _catch = catch_practice + _catch
+    return dict(
+        # set stim intensity to zero for baseline trials
+        stim_contrast = contrast if block.operant else 0.,
+        show_mask = block.masked,
+        **params
+        )
 
+def clock_block(block, contrast, params, log, flip_log = None, frames = None):
+    '''
+    define how a single block will go, following its plan
+    '''
+    params = clock_params(block, contrast, params)
     # now loop through trials
-    trial_nums = range(1, len(_catch) + 1)
-    for trial, practice, catch in zip(trial_nums, _practice, _catch):
-        if trial <= PRACTICE_TRIALS:
-            feedback = True
-        else:
-            feedback = False
+    trials = block.trials
+    for trial_plan, next_plan in zip(trials, trials[1:] + [None]):
+        trial = trial_plan.trial
         if trial == PRACTICE_TRIALS + 1:
             post_practice_trial_instructions(win, kb)
+        if next_plan is not None: # prepare next trial during this one
+            pipeline.queue(**params, **next_plan.trial_kwargs())
         t0 = timer.getTime()
+        if frames is not None:
+            frames.begin_trial(trial)
         trial_data = clock_trial(
-            stim_contrast = contrast,
-            show_mask = mask,
-            catch = catch,
-            feedback = feedback,
-            **params
+            pipeline = pipeline,
+            frame_log = frames,
+            **params,
+            **trial_plan.trial_kwargs()
             )
         log.write(
             trial = trial,
             onset = t0,
-            practice = practice,
-            operant = operant,
+            practice = trial_plan.practice,
+            operant = block.operant,
             **trial_data
             )
+        if flip_log is not None:
+            flip_log.write(trial = trial, **trial_data)
+    if flip_log is not None:
+        flip_log.close()
+    if frames is not None:
+        frames.close()
+    log.sync() # make sure the whole block is on disk
     post_block_instructions(win, kb)
     return log
 
-masked = (True, False)
-operant = [True, False]
-np.random.shuffle(operant)
+def run_clock_block(task, run, instructions, log):
+    '''
+    prepares a planned block's first trial during its instructions, then
+    runs it
+    '''
+    block = plan.block(task, run)
+    queue_first_trial(block, **clock_params(block, contrast, trial_params))
+    instructions(win, kb)
+    clock_block(
+        block, contrast, trial_params, log,
+        timing_log(task, run),
+        frame_log(task, run)
+        )
+
 log = TSVLogger(sub_id, 'masked', fields, LOG_DIRECTORY)
-clock_instructions_masked(win, kb)
-clock_block(masked[0], operant[0], contrast, trial_params, log)
-same_as_previous_instructions(win, kb)
-clock_block(masked[0], operant[1], contrast, trial_params, log)
+run_clock_block('masked', 1, clock_instructions_masked, log)
+run_clock_block('masked', 2, same_as_previous_instructions, log)
 log.close()
 log = TSVLogger(sub_id, 'unmasked', fields, LOG_DIRECTORY)
-clock_instructions_unmasked(win, kb)
-clock_block(masked[1], operant[0], contrast, trial_params, log)
-same_as_previous_instructions(win, kb)
-clock_block(masked[1], operant[1], contrast, trial_params, log)
+run_clock_block('unmasked', 1, clock_instructions_unmasked, log)
+run_clock_block('unmasked', 2, same_as_previous_instructions, log)
 log.close()
 post_experiment_instructions(win, kb)
@@ -0,0 +1,76 @@
+'''
+Measures key-to-photon latency of the operant stimulus: how long it takes
+from the (scripted) space press in a clock trial to the first flip that
+shows the circle, which is cued for .15 s after the press. Run e.g.::
+
+    python latency.py 1000
+
+and compare the summary against a previous run to catch regressions.
+
+By default, trials run offscreen in virtual time (see util.simulation),
+which checks how presses are scheduled onto flips and takes well under a
+second per trial. `python latency.py 100 --real-time` instead runs them
+on a visible window at the monitor's pace, to include the display
+pipeline; each clock trial then takes 7-9 s, so 100 trials take about
+15 minutes.
+'''
+import numpy as np
+import sys
+
+REAL_TIME = '--real-time' in sys.argv
+if not REAL_TIME:
+    from util.simulation import install_virtual_time, offscreen_window
+    install_virtual_time() # before any clocks are created
+
+from util.cfs import init_window
+from util.input.scripted import ScriptedKeyboard
+from util.trials import clock_trial
+
+args = [arg for arg in sys.argv[1:] if arg != '--real-time']
+N_TRIALS = int(args[0]) if args else 1000
+MASK_SIZE = 370
+RED = (1, 0, 0)
+BLUE = (0, 0, 1)
+FRAME_RATE = 60.
+PERIOD = 2.56 # of the Libet clock, i.e. LibetClock's default
+CUE_DELAY = .15 # scheduled delay from press to stimulus in clock_trial
+FNAME = 'latency.tsv'
+
+def script():
+    '''
+    press space at a random time after the first rotation, then submit
+    the initial cursor position once it appears (at most 3 s later)
+    '''
+    press_t = np.random.uniform(PERIOD + .1, 2*PERIOD)
+    return [(press_t, 'space'), (press_t + 3.5, 'space')]
+
+if REAL_TIME:
+    win = init_window(size = (800, 800), units = 'pix')
+else:
+    win = offscreen_window(FRAME_RATE, size = (800, 800), units = 'pix')
+kb = ScriptedKeyboard(script)
+
+latencies = []
+for trial in range(N_TRIALS):
+    trial_data = clock_trial(
+        win, kb,
+        mask_color = RED,
+        mask_size = MASK_SIZE,
+        stim_color = BLUE,
+        stim_contrast = 1.,
+        feedback = False,
+        frame_rate = FRAME_RATE
+        )
+    latencies.append(trial_data['stim_latency'])
+win.close()
+
+missed = sum(lat == 'n/a' for lat in latencies)
+latencies = np.array([lat for lat in latencies if lat != 'n/a'])
+np.savetxt(FNAME, latencies, header = 'stim_latency', comments = '')
+excess = (latencies - CUE_DELAY) * 1000 # ms beyond the scheduled delay
+print('\n%d trials, stimulus never shown on %d'%(N_TRIALS, missed))
+print('key-to-photon latency beyond the %d ms cue delay (ms):'%(CUE_DELAY*1000))
+print('    mean %.2f, sd %.2f'%(excess.mean(), excess.std()))
+for q in (5, 50, 95, 99, 100):
+    print('    %3dth percentile %.2f'%(q, np.percentile(excess, q)))
+print('raw latencies saved to %s'%FNAME)
@@ -0,0 +1,93 @@
+import numpy as np
+import os
+
+from analysis import load_logs, read_tsv
+from analysis.binding import binding_effects, catch_detection
+
+FIELDS = ['trial', 'masked', 'operant', 'catch', 'practice', 'aware', 'overest_t']
+
+def _write_log(log_dir, sub, task, rows):
+    beh = os.path.join(str(log_dir), 'sub-%s'%sub, 'beh')
+    os.makedirs(beh, exist_ok = True)
+    fpath = os.path.join(beh, 'sub-%s_task-%s_beh.tsv'%(sub, task))
+    with open(fpath, 'w') as f:
+        f.write('\n'.join(['\t'.join(FIELDS)] + [
+            '\t'.join(str(row.get(field, 'n/a')) for field in FIELDS)
+            for row in rows
+            ]))
+    return fpath
+
+def _trial(trial, masked, operant, overest_t, catch = False, aware = False):
+    return dict(trial = trial, masked = masked, operant = operant,
+                catch = catch, practice = False, aware = aware,
+                overest_t = overest_t)
+
+def test_read_tsv_types_and_runs(tmp_path):
+    fpath = _write_log(tmp_path, '01', 'masked', [
+        dict(trial = 1, masked = True, overest_t = .5),
+        dict(trial = 2, masked = True),
+        dict(trial = 1, masked = False, overest_t = -.25), # next block
+        ])
+    table = read_tsv(fpath)
+    assert table['trial'].dtype == np.int64
+    assert table['masked'].dtype == bool
+    assert table['overest_t'].dtype == np.float64
+    assert table['overest_t'].mask.tolist() == [False, True, False]
+    assert table['operant'].mask.all()
+    assert table['run'].tolist() == [1, 1, 2]
+
+def test_binding_effects(tmp_path):
+    _write_log(tmp_path, '01', 'unmasked', [
+        _trial(1, False, False, .10), _trial(2, False, True, .04),
+        _trial(3, False, True, .02), _trial(4, False, False, .9, catch = True)
+        ])
+    _write_log(tmp_path, '01', 'masked', [
+        _trial(1, True, False, .08), _trial(2, True, True, .06),
+        _trial(3, True, True, -.5, aware = True), # seen, so excluded
+        _trial(4, True, False, 0., catch = True, aware = True)
+        ])
+    _write_log(tmp_path, '02', 'masked', [
+        _trial(1, True, False, .2), _trial(2, True, True, .1),
+        _trial(3, True, False, 0., catch = True) # missed the catch trial
+        ])
+    table = load_logs(str(tmp_path), workers = 1)
+    subs, rate = catch_detection(table)
+    assert subs.tolist() == ['01', '02']
+    assert rate.tolist() == [1., 0.]
+    res = binding_effects(table)
+    assert np.allclose(res['mean'][0].filled(np.nan), [[.10, .03], [.08, .06]])
+    assert res['n'][0].tolist() == [[1, 2], [1, 1]]
+    assert res['binding'].mask[1].tolist() == [True, False] # no unmasked data
+    assert np.allclose(res['binding'][:, 1], [.02, .1])
+    res = binding_effects(table, exclude_aware = False)
+    assert np.isclose(res['mean'][0, 1, 1], (.06 - .5)/2)
+    res = binding_effects(table, min_catch_rate = .5)
+    assert res['subs'].tolist() == ['01']
+
+def _sorted_rows(table):
+    return sorted(zip(*[table[f].filled(-9).tolist() for f in ('sub', 'trial')]))
+
+def test_load_logs_cache_invalidation(tmp_path):
+    a = _write_log(tmp_path, '01', 'masked', [_trial(1, True, False, .1)])
+    b = _write_log(tmp_path, '02', 'masked', [_trial(1, True, False, .2)])
+    first = load_logs(str(tmp_path), workers = 1)
+    assert os.path.exists(os.path.join(str(tmp_path), 'beh_cache.npz'))
+    cached = load_logs(str(tmp_path), workers = 1)
+    for field in first:
+        assert cached[field].tolist() == first[field].tolist()
+    # a changed file is parsed again
+    _write_log(tmp_path, '01', 'masked', [
+        _trial(1, True, False, .1), _trial(2, True, True, .3)
+        ])
+    mtime = os.path.getmtime(a) + 10
+    os.utime(a, (mtime, mtime))
+    table = load_logs(str(tmp_path), workers = 1)
+    assert _sorted_rows(table) == [('01', 1), ('01', 2), ('02', 1)]
+    # a deleted one disappears
+    os.remove(b)
+    table = load_logs(str(tmp_path), workers = 1)
+    assert _sorted_rows(table) == [('01', 1), ('01', 2)]
+    uncached = load_logs(str(tmp_path), workers = 1, use_cache = False)
+    assert set(uncached) == set(table)
+    for field in table:
+        assert table[field].tolist() == uncached[field].tolist()
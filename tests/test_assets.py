@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+import os
+
+from util.cfs import assets
+from util.cfs.assets import write_packed, load_packed, pad_rgb
+
+def _arrays():
+    rng = np.random.default_rng(0)
+    return dict(
+        mondrians = rng.integers(0, 256, (3, 8, 8, 3), dtype = np.uint8),
+        masks = rng.integers(0, 256, (2, 4, 4), dtype = np.uint8)
+        )
+
+def test_packed_round_trip(tmp_path):
+    path = str(tmp_path/'assets.pack')
+    arrays = _arrays()
+    write_packed(arrays, path)
+    store = load_packed(path, verify = True)
+    assert set(store) == set(arrays)
+    for name in arrays:
+        np.testing.assert_array_equal(store[name], arrays[name])
+
+def test_missing_store_is_none(tmp_path):
+    assert load_packed(str(tmp_path/'nothing.pack')) is None
+
+def test_verify_catches_corruption(tmp_path):
+    path = str(tmp_path/'assets.pack')
+    write_packed(_arrays(), path)
+    with open(path, 'r+b') as f:
+        f.write(b'\x00\x01\x02')
+    with pytest.raises(Exception):
+        load_packed(path, verify = True)
+
+def test_pad_rgb_wraps_without_copy(tmp_path):
+    from PIL import Image
+    path = str(tmp_path/'assets.pack')
+    frames = _arrays()['mondrians']
+    write_packed(dict(mondrians = pad_rgb(frames)), path)
+    store = load_packed(path)
+    np.testing.assert_array_equal(store['mondrians'][..., :3], frames)
+    assert (store['mondrians'][..., 3] == 255).all()
+    image = Image.fromarray(store['mondrians'][0])
+    # the image reads from the map, so it sees changes to the file
+    writable = np.memmap(path, dtype = np.uint8, mode = 'r+')
+    writable[:4] = 7
+    writable.flush()
+    assert image.getpixel((0, 0)) == (7, 7, 7, 7)
+
+def _loose_files(root, n):
+    os.makedirs(os.path.join(root, 'masks'))
+    for i in range(n):
+        with open(os.path.join(root, 'masks', 'mask_%d.png'%i), 'wb') as f:
+            f.write(b'')
+
+def test_stale_section_left_out(tmp_path, monkeypatch):
+    monkeypatch.setattr(assets, 'THIS_DIR', str(tmp_path))
+    _loose_files(str(tmp_path), 2)
+    arrays = _arrays()
+    path = str(tmp_path/'assets.pack')
+    write_packed(arrays, path, dict(masks = assets.source_mtimes('masks')))
+    assert set(load_packed(path)) == {'mondrians', 'masks'}
+    fpath = str(tmp_path/'masks'/'mask_1.png')
+    mtime = os.path.getmtime(fpath) + 10
+    os.utime(fpath, (mtime, mtime))
+    write_packed(arrays, path, dict(masks = {'mask_0.png': 0.}))
+    with pytest.warns(UserWarning):
+        store = load_packed(path)
+    assert set(store) == {'mondrians'} # masks fall back to the loose files
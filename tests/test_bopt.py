@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('psychopy')
+from util.bopt import JointQuest
+
+PARAMS = dict(tGuess = -.5, tGuessSd = .5, pThreshold = .525, beta = 3.5,
+                delta = .01, gamma = .5)
+
+def test_prior_is_centered_on_guess():
+    quest = JointQuest(**PARAMS)
+    assert abs(quest.mean() - PARAMS['tGuess']) < .01
+    assert abs(quest.sd() - PARAMS['tGuessSd']) < .01
+    assert abs(quest.quantile(.5) - PARAMS['tGuess']) < .02
+
+def test_threshold_accuracy_is_pThreshold_for_every_slope():
+    quest = JointQuest(**PARAMS)
+    i = len(quest.x) // 3
+    p = quest.p_correct(quest.x[i])[i] # at each slope
+    np.testing.assert_allclose(p, PARAMS['pThreshold'])
+
+def test_posterior_converges_on_true_threshold():
+    np.random.seed(0)
+    quest = JointQuest(**PARAMS)
+    true = JointQuest(**dict(PARAMS, tGuess = -1., tGuessSd = 1e-3))
+    for _ in range(300):
+        intensity = quest.draw_from_post()
+        p = true.p_correct(intensity)[len(true.x)//2, len(true.beta)//2]
+        quest.update(intensity, int(np.random.uniform() < p))
+    assert quest.n_trials == 300
+    assert abs(quest.mean() - -1.) < .2
+    assert quest.quantile(.05) < -1. < quest.quantile(.95)
+
+def test_draw_from_post_respects_lower_cutoff():
+    np.random.seed(1)
+    quest = JointQuest(**PARAMS)
+    draws = [quest.draw_from_post(lower_cutoff = quest.mean()) for _ in range(200)]
+    assert min(draws) >= quest.mean() - .01
@@ -0,0 +1,54 @@
+import pytest
+import weakref
+import gc
+
+pytest.importorskip('psychopy')
+from util.cfs import cache
+
+class FakeCache:
+
+    def __init__(self, win):
+        self.released = False
+
+    def release(self):
+        self.released = True
+
+class FakeWindow:
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+def test_one_cache_per_window_released_on_close(monkeypatch):
+    monkeypatch.setattr(cache, 'TextureCache', FakeCache)
+    win, other = FakeWindow(), FakeWindow()
+    shared = cache.get_texture_cache(win)
+    assert cache.get_texture_cache(win) is shared
+    assert cache.get_texture_cache(other) is not shared
+    win.close()
+    assert win.closed and shared.released
+    assert cache.get_texture_cache(win) is not shared # loaded again
+    cache.release_texture_cache(win)
+    cache.release_texture_cache(other)
+
+def test_unclosed_window_is_freed(monkeypatch):
+    monkeypatch.setattr(cache, 'TextureCache', FakeCache)
+    win = FakeWindow()
+    textures = weakref.ref(cache.get_texture_cache(win))
+    ref = weakref.ref(win)
+    del win
+    gc.collect()
+    assert ref() is None and textures() is None # nothing kept them alive
+    assert cache.get_texture_cache(FakeWindow()).released is False
+
+def test_sections_load_on_first_use(monkeypatch):
+    loaded = []
+    monkeypatch.setattr(cache.TextureCache, '_load',
+                        lambda self, name: loaded.append(name) or [name])
+    textures = cache.TextureCache(FakeWindow())
+    assert textures.masks == ['masks'] and textures.masks == ['masks']
+    assert loaded == ['masks'] # Mondrians weren't needed
+    textures.release()
+    assert textures.masks == []
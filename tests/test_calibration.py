@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('psychopy') # for util.bopt
+from util.calibration import QUEST_PARAMS, p_correct, simulate_batch
+
+def _batch(seed = 0, n = 20, **kwargs):
+    thresholds = np.full(n, -1.)
+    betas = np.full(n, QUEST_PARAMS['beta'])
+    return simulate_batch(seed, thresholds, betas, 60, [20, 60], **kwargs)
+
+def test_p_correct_at_threshold():
+    p = p_correct(-1., -1., 3.5, .525, .01, .5)
+    assert np.isclose(p, .525)
+
+def test_batch_is_seeded():
+    est1, n1 = _batch(seed = 3)
+    est2, n2 = _batch(seed = 3)
+    assert est1.shape == (2, 20)
+    np.testing.assert_array_equal(est1, est2)
+    assert (n1 == 60).all()
+
+def test_estimates_are_just_below_true_threshold():
+    est, _ = _batch(n = 200)
+    # the chosen contrast is the 5th percentile, so below the threshold,
+    # and gets closer to it as trials accumulate
+    assert (est[-1] < -1.).mean() > .9
+    assert -1.4 < est[0].mean() < est[-1].mean() < -1.
+    assert (est <= 0.).all()
+
+def test_early_stopping():
+    _, n_used = _batch(stop_width = 10., min_trials = 15)
+    assert (n_used == 15).all() # interval is always narrower than that
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('pyglet')
+from util.capture import _RawSink, read_capture
+
+def test_raw_capture_round_trip(tmp_path):
+    fname = str(tmp_path/'capture.raw')
+    rng = np.random.default_rng(0)
+    # as read back from GL: bottom row first
+    frames = rng.integers(0, 256, size = (7, 4, 5, 3), dtype = np.uint8)
+    sink = _RawSink(fname, 4, 5, 60., chunk_frames = 3)
+    for frame in frames:
+        sink.write(frame)
+    sink.close()
+    captured = read_capture(fname)
+    assert captured.shape == (7, 4, 5, 3)
+    np.testing.assert_array_equal(captured, frames[:, ::-1])
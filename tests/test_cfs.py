@@ -0,0 +1,70 @@
+import pytest
+
+pytest.importorskip('psychopy')
+from util.cfs import cfs
+
+class FakeStim:
+    '''
+    records which attributes are set on it, and how often it's drawn
+    '''
+
+    def __init__(self):
+        object.__setattr__(self, 'sets', [])
+        object.__setattr__(self, 'draws', 0)
+
+    def __setattr__(self, name, value):
+        self.sets.append(name)
+        object.__setattr__(self, name, value)
+
+    def draw(self):
+        object.__setattr__(self, 'draws', self.draws + 1)
+
+class FakeCache:
+
+    def __init__(self):
+        self.mondrians = [FakeStim()]
+        self.masks = [FakeStim()]
+        self.applied = dict()
+
+@pytest.fixture
+def textures(monkeypatch):
+    textures = FakeCache()
+    monkeypatch.setattr(cfs, 'get_texture_cache', lambda win: textures)
+    monkeypatch.setattr(cfs.CFSMask, 'init_border', lambda self: FakeStim())
+    monkeypatch.setattr(cfs.CFSMask, 'init_fixation', lambda self: FakeStim())
+    return textures
+
+def test_shared_stimulus_settings_applied_on_change(textures):
+    left = cfs.CFSMask(None, pos = (-1, 0), autodraw = False)
+    right = cfs.CFSMask(None, pos = (1, 0), autodraw = False)
+    stim = textures.mondrians[0]
+    for _ in range(12): # two updates
+        left.draw()
+    assert stim.draws == 12
+    assert stim.sets == ['pos', 'size', 'color'] # applied once
+    right.draw()
+    left.draw()
+    assert stim.sets == ['pos', 'size', 'color']*3
+    assert stim.pos == (-1, 0)
+
+def test_settings_applied_every_frame_if_not_cached(textures):
+    mask = cfs.CFSMask(None, cache_settings = False, autodraw = False)
+    for _ in range(3):
+        mask.draw()
+    assert textures.mondrians[0].sets == ['pos', 'size', 'color']*3
+
+def test_backward_mask_keeps_its_colors(textures):
+    mask = cfs.CFSMask(None, autodraw = False)
+    mask.draw(terminate = True) # shown from the first update on
+    for _ in range(5):
+        mask.draw()
+    assert mask.mask_index == cfs.BACKWARD_MASK
+    assert textures.masks[0].sets == ['pos', 'size']
+    mask.draw()
+    assert mask.completed
+
+def test_hide_stops_autodraw(textures):
+    mask = cfs.CFSMask(None)
+    assert mask._border.autoDraw and mask._fixation.autoDraw
+    mask.hide()
+    assert not mask._border.autoDraw and not mask._fixation.autoDraw
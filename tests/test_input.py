@@ -0,0 +1,79 @@
+import threading
+import time
+import pytest
+
+pytest.importorskip('psychopy')
+pytest.importorskip('psychtoolbox')
+from util.input import ThreadedKeyboard
+
+class FakeKey:
+
+    def __init__(self, name, t):
+        self.name = name
+        self.tDown = t
+        self.duration = None
+
+class FakeClock:
+
+    def getLastResetTime(self):
+        return 0.
+
+class FakeDevice:
+    '''
+    stands in for a psychopy Keyboard that keys can be pressed on
+    '''
+
+    def __init__(self):
+        self.clock = FakeClock()
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def press(self, name):
+        with self._lock:
+            self._pending.append(FakeKey(name, time.time()))
+
+    def getKeys(self, **kwargs):
+        with self._lock:
+            keys, self._pending = self._pending, []
+        return keys
+
+    def drained(self):
+        with self._lock:
+            return not self._pending
+
+def _press_and_drain(dev, name):
+    dev.press(name)
+    while not dev.drained(): # wait for the capture thread to queue it
+        time.sleep(.001)
+    time.sleep(.01)
+
+def _press_later(dev, name, delay = .05):
+    threading.Timer(delay, dev.press, (name,)).start()
+
+def test_waitKeys_clear_discards_earlier_presses():
+    dev = FakeDevice()
+    kb = ThreadedKeyboard(dev)
+    _press_and_drain(dev, 'left') # e.g. still queued from the clock cursor
+    _press_later(dev, 'right')
+    keys = kb.waitKeys(maxWait = 2., keyList = ['left', 'right'],
+                        waitRelease = False, clear = True)
+    kb.stop()
+    assert [key.name for key in keys] == ['right']
+
+def test_waitKeys_without_clear_returns_earlier_presses():
+    dev = FakeDevice()
+    kb = ThreadedKeyboard(dev)
+    _press_and_drain(dev, 'left')
+    keys = kb.waitKeys(maxWait = 2., keyList = ['left', 'right'],
+                        waitRelease = False, clear = False)
+    kb.stop()
+    assert [key.name for key in keys] == ['left']
+
+def test_getKeys_clear_consumes_keys():
+    dev = FakeDevice()
+    kb = ThreadedKeyboard(dev)
+    _press_and_drain(dev, 'space')
+    assert len(kb.getKeys(waitRelease = False, clear = False)) == 1
+    assert len(kb.getKeys(waitRelease = False, clear = True)) == 1
+    assert kb.getKeys(waitRelease = False) == []
+    kb.stop()
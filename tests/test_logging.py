@@ -0,0 +1,92 @@
+import numpy as np
+import atexit
+import pytest
+import os
+
+from util.logging import TSVLogger, recover_tsv, FrameLogger, read_frames
+
+def _read(fpath):
+    with open(fpath) as f:
+        return f.read().split('\n')
+
+def test_tsv_logger_writes_rows(tmp_path):
+    log = TSVLogger('01', 'test', ['trial', 'resp'], str(tmp_path))
+    log.write(trial = 1, resp = 'yes')
+    log.write(trial = 2) # missing field
+    log.close()
+    assert _read(log.fpath) == ['trial\tresp', '1\tyes', '2\tn/a']
+    assert not os.path.exists(log.fpath + '.journal')
+    assert recover_tsv(log.fpath) is None # nothing to recover
+
+def _crash(log):
+    '''
+    leaves a logger as if the process had died: nothing more is flushed
+    '''
+    log._queue.join() # rows have reached the writer thread
+    atexit.unregister(log.close)
+    log._closed = True
+
+def test_recover_tsv_after_crash(tmp_path):
+    log = TSVLogger('01', 'test', ['trial', 'resp'], str(tmp_path),
+                    sync_interval = 1e6)
+    for trial in (1, 2):
+        log.write(trial = trial, resp = 'a')
+    log.sync()
+    for trial in (3, 4):
+        log.write(trial = trial, resp = 'b')
+    _crash(log)
+    with open(log.fpath + '.journal', 'a') as f:
+        f.write('\n5\tc') # cut off in its last field, before the checksum
+    assert recover_tsv(log.fpath) == 4
+    assert _read(log.fpath) == [
+        'trial\tresp', '1\ta', '2\ta', '3\tb', '4\tb'
+        ]
+    assert not os.path.exists(log.fpath + '.journal')
+
+def test_recover_tsv_before_first_row(tmp_path):
+    log = TSVLogger('01', 'test', ['trial', 'resp'], str(tmp_path))
+    _crash(log)
+    assert recover_tsv(log.fpath) == 0
+    assert _read(log.fpath) == ['trial\tresp']
+
+def test_writer_errors_are_raised(tmp_path):
+    log = TSVLogger('01', 'test', ['trial', 'resp'], str(tmp_path))
+    log._f.close() # so the writer thread fails
+    log.write(trial = 1)
+    with pytest.raises(ValueError):
+        log.sync() # instead of waiting forever
+    with pytest.raises(ValueError):
+        log.write(trial = 2)
+    with pytest.raises(ValueError):
+        log.close()
+    assert recover_tsv(log.fpath) == 1 # the row made it to the journal
+
+def test_frame_logger_round_trip(tmp_path):
+    log = FrameLogger('01', 'masked', 1, str(tmp_path), chunk_size = 4)
+    for trial, n in ((1, 10), (2, 3)):
+        log.begin_trial(trial)
+        for flip in range(n):
+            log.record(flip, flip/60., mask_index = flip % 5,
+                        stim_visible = flip > 1)
+    log.close()
+    frames = read_frames(log.fpath)
+    assert len(frames) == 13
+    first = read_frames(log.fpath, 1)
+    np.testing.assert_array_equal(first['flip'], np.arange(10))
+    np.testing.assert_array_equal(first['mask_index'], np.arange(10) % 5)
+    assert np.isnan(first['hand_angle']).all()
+    second = read_frames(log.fpath, 2)
+    assert (second['trial'] == 2).all()
+    np.testing.assert_array_equal(second['stim_visible'], [False, False, True])
+
+def test_frame_logger_records_feedback(tmp_path):
+    log = FrameLogger('01', 'masked', 1, str(tmp_path))
+    log.begin_trial(1)
+    log.record(0, 0., cursor_angle = 1.)
+    log.record(1, 1/60., cursor_angle = 1., feedback_angle = 2.,
+                trial_ended = True)
+    log.close()
+    frames = read_frames(log.fpath, 1)
+    assert frames['trial_ended'].tolist() == [False, True]
+    assert np.isnan(frames['feedback_angle'][0])
+    assert frames['feedback_angle'][1] == 2.
@@ -0,0 +1,35 @@
+import numpy as np
+
+from util.cfs.mondrian import make_mondrian, generate_mondrians
+
+def test_make_mondrian_is_seeded():
+    a = make_mondrian(np.random.default_rng(1), size = 64)
+    b = make_mondrian(np.random.default_rng(1), size = 64)
+    c = make_mondrian(np.random.default_rng(2), size = 64)
+    assert a.shape == (64, 64, 3) and a.dtype == np.uint8
+    np.testing.assert_array_equal(a, b)
+    assert (a != c).any()
+
+def test_make_mondrian_is_gray():
+    frame = make_mondrian(np.random.default_rng(0), size = 64)
+    assert (frame[..., 0] == frame[..., 1]).all()
+    assert (frame[..., 0] == frame[..., 2]).all()
+
+def test_last_square_is_on_top():
+    # one square over the whole frame, then one small one in the middle
+    class Rng:
+        def uniform(self, lo, hi, n):
+            if lo == -1: # luminance
+                return np.array([-1., 1.])
+            return np.array([1000., 30.]) # sides
+        def integers(self, lo, hi, shape):
+            return np.zeros(shape, dtype = int)
+    frame = make_mondrian(Rng(), size = 370, n_squares = 2)
+    assert frame[0, 0, 0] == 0 # big black square
+    assert frame[185, 185, 0] == 255 # small white one drawn over it
+
+def test_generate_mondrians_independent_of_workers():
+    one = generate_mondrians(n_frames = 4, size = 32, seed = 3, workers = 1)
+    two = generate_mondrians(n_frames = 4, size = 32, seed = 3, workers = 2)
+    assert one.shape == (4, 32, 32, 3)
+    np.testing.assert_array_equal(one, two)
@@ -0,0 +1,40 @@
+from util.plan import SessionPlan, compile_session
+
+def _plan(seed = 1):
+    return compile_session('01', n_mondrians = 10, n_masks = 3,
+                            calibration_trials = 20, clock_block_trials = 10,
+                            seed = seed)
+
+def test_plan_is_seeded():
+    assert _plan(seed = 1) == _plan(seed = 1)
+    assert _plan(seed = 1) != _plan(seed = 2)
+
+def test_json_round_trip(tmp_path):
+    plan = _plan()
+    fpath = str(tmp_path/'plan.json')
+    plan.save(fpath)
+    assert SessionPlan.load(fpath) == plan
+
+def test_block_structure():
+    plan = _plan()
+    assert [(b.task, b.run) for b in plan.blocks] == [
+        ('discrimination', None),
+        ('masked', 1), ('masked', 2), ('unmasked', 1), ('unmasked', 2)
+        ]
+    assert len(plan.block('discrimination').trials) == 20
+    masked = plan.block('masked', 1)
+    practice = [t for t in masked.trials if t.practice]
+    main = [t for t in masked.trials if not t.practice]
+    assert len(practice) == 5 and len(main) == 10 + 5
+    assert sum(t.catch for t in practice) == 1
+    assert sum(t.catch for t in main) == 5
+    assert not any(t.catch for t in plan.block('unmasked', 1).trials)
+    # operant and baseline in the same order for masked and unmasked
+    assert plan.block('masked', 1).operant == plan.block('unmasked', 1).operant
+    assert plan.block('masked', 1).operant != plan.block('masked', 2).operant
+
+def test_trial_kwargs_drop_unset_fields():
+    trial = _plan().block('discrimination').trials[0]
+    kwargs = trial.trial_kwargs()
+    assert 'trial' not in kwargs and 'catch_t' not in kwargs
+    assert set(kwargs) >= {'stim_position', 'stim_onset', 'mask_sequence'}
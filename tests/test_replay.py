@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('psychopy')
+from util.logging import FrameLogger, read_frames
+from util.plan import TrialPlan
+from util.replay import TrialRenderer, read_contrasts
+
+def test_read_contrasts_splits_blocks(tmp_path):
+    fpath = str(tmp_path/'log.tsv')
+    with open(fpath, 'w') as f:
+        f.write('\n'.join([
+            'trial\tcontrast\tresp',
+            '1\t0.5\tyes', '2\t0.25\tn/a',
+            '1\t1.0\tno',
+            ]))
+    assert read_contrasts(fpath) == [{1: .5, 2: .25}, {1: 1.}]
+
+@pytest.fixture
+def renderer():
+    from util.simulation import offscreen_window
+    try:
+        win = offscreen_window(size = (200, 200), units = 'pix')
+    except Exception as e:
+        pytest.skip("can't open a window: %s"%e)
+    yield TrialRenderer(win, mask_size = 100)
+    win.close()
+
+def _log_trial(tmp_path):
+    log = FrameLogger('01', 'masked', 1, str(tmp_path))
+    log.begin_trial(1)
+    for flip in range(8):
+        log.record(flip, flip/60., mask_index = 0, hand_angle = 1.,
+                    stim_visible = 2 <= flip < 4)
+    log.record(8, 8/60., cursor_angle = 2., feedback_angle = 1.5,
+                trial_ended = True)
+    log.close()
+    return read_frames(log.fpath, 1)
+
+def test_render_logged_trial(tmp_path, renderer):
+    frames = _log_trial(tmp_path)
+    plan = TrialPlan(1, stim_position = 'upper_right',
+                    catch_position = 'lower_left', backward_mask = 0)
+    w, h = renderer.win.size
+    out = np.zeros((len(frames), h, w, 3), dtype = np.uint8)
+    renderer.render(frames, plan, 1., True, out)
+    assert out.shape == (9, h, w, 3)
+    # the same state renders the same frame, and the stimulus changes it
+    np.testing.assert_array_equal(out[0], out[1])
+    np.testing.assert_array_equal(out[2], out[3])
+    assert (out[2] != out[1]).any()
+    np.testing.assert_array_equal(out[4], out[1])
+    # the feedback frame is there too
+    assert (out[8] != out[7]).any()
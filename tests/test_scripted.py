@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip('psychopy')
+from util.input.scripted import ScriptedKeyboard
+from util.simulation import VirtualClock, advance
+
+def _keyboard(script):
+    kb = ScriptedKeyboard(script)
+    kb.clock = VirtualClock()
+    return kb
+
+def test_keys_appear_at_scripted_times():
+    kb = _keyboard(lambda: [(1., 'space', .1), (2., 'space')])
+    assert kb.getKeys(waitRelease = False) == []
+    advance(1.05)
+    assert kb.getKeys() == [] # still held down
+    keys = kb.getKeys(waitRelease = False, clear = False)
+    assert [(k.name, k.rt) for k in keys] == [('space', 1.)]
+    advance(.1)
+    keys = kb.getKeys()
+    assert len(keys) == 1 and keys[0].duration == .1
+    assert kb.getKeys(waitRelease = False) == [] # consumed
+    advance(1.)
+    assert [k.rt for k in kb.getKeys(waitRelease = False)] == [2.]
+
+def test_reset_restarts_script():
+    kb = _keyboard(lambda: [(.5, 'space')])
+    advance(1.)
+    assert len(kb.getKeys(waitRelease = False)) == 1
+    kb.clock.reset()
+    assert kb.getKeys(waitRelease = False) == []
+    advance(.5)
+    assert len(kb.getKeys(waitRelease = False)) == 1
+
+def test_clear_events_and_wait_keys():
+    kb = _keyboard(lambda: [(.5, 'left'), (2., 'right')])
+    advance(1.)
+    kb.clearEvents()
+    kb.press(1.5, 'up')
+    advance(1.)
+    assert [k.name for k in kb.getKeys(waitRelease = False)] == ['right', 'up']
+    assert kb.waitKeys(keyList = ['a', 'b'])[0].name == 'a'
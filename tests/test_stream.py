@@ -0,0 +1,39 @@
+import numpy as np
+import time
+
+from util.cfs.stream import MondrianStream
+
+def test_stream_buffers_up_to_capacity():
+    stream = MondrianStream(size = 16, capacity = 4, seed = 0)
+    assert stream.wait_ready(3, timeout = 10.)
+    assert stream.ready == 3 # one slot is kept for the frame handed out
+    stream.close()
+
+def test_stream_frames_are_fresh():
+    stream = MondrianStream(size = 16, capacity = 4, seed = 0)
+    frames = []
+    for _ in range(6):
+        assert stream.wait_ready(1, timeout = 10.)
+        frames.append(stream.next_frame().copy())
+    stream.close()
+    for a, b in zip(frames, frames[1:]):
+        assert (a != b).any()
+
+def test_underrun_returns_none():
+    stream = MondrianStream(size = 16, capacity = 2, seed = 0)
+    stream.close()
+    stream._thread.join()
+    while stream.next_frame() is not None: # drain whatever was made
+        pass
+    assert stream.next_frame() is None
+    assert stream.underruns >= 1
+
+def test_stream_keeps_up_with_mask_updates():
+    # full-size frames, taken four times as fast as 10 Hz mask updates
+    stream = MondrianStream(capacity = 8, seed = 0)
+    assert stream.wait_ready(7, timeout = 10.)
+    for _ in range(40):
+        assert stream.next_frame() is not None
+        time.sleep(.025)
+    stream.close()
+    assert stream.underruns == 0
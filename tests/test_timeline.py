@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('psychopy')
+from util.timeline import Timeline
+
+class FakeWindow:
+    '''
+    flips at exactly `frame_rate`, skipping the flips in `drop`
+    '''
+
+    def __init__(self, frame_rate, drop = ()):
+        self.monitorFramePeriod = 1. / frame_rate
+        self.drop = set(drop)
+        self._n = -1
+
+    def flip(self):
+        self._n += 1
+        while self._n in self.drop:
+            self._n += 1
+        return 10. + self._n * self.monitorFramePeriod
+
+def test_no_drift_at_non_nominal_refresh_rate():
+    win = FakeWindow(59.94)
+    timeline = Timeline(win)
+    assert np.isclose(timeline.frame_rate, 59.94)
+    event = timeline.schedule(8., duration = .2)
+    n_flips = 600 # 10 s, longer than a clock trial
+    for _ in range(n_flips):
+        timeline.flip()
+    assert timeline.last_flip == n_flips - 1
+    assert timeline.dropped_frames == 0
+    assert np.isclose(event.actual_onset, event.planned_onset)
+    assert np.isclose(event.actual_offset, event.planned_offset)
+
+def test_nominal_rate_drifts():
+    # what the measured period avoids: assuming 60 Hz on a 59.94 Hz monitor
+    # eventually counts a frame as dropped that wasn't
+    timeline = Timeline(FakeWindow(59.94), frame_rate = 60.)
+    for _ in range(600):
+        timeline.flip()
+    assert timeline.dropped_frames > 0
+
+def test_dropped_frames_are_counted():
+    timeline = Timeline(FakeWindow(60., drop = (10, 20, 21)))
+    for _ in range(50):
+        timeline.flip()
+    assert timeline.dropped_frames == 3
+    assert timeline.last_flip == 52
+
+def test_flip_times_are_from_first_flip():
+    timeline = Timeline(FakeWindow(100.), record = True)
+    for _ in range(5):
+        timeline.flip()
+    np.testing.assert_allclose(timeline.flip_times, np.arange(5) * .01)
+    assert timeline.flip_indices == list(range(5))
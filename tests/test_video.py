@@ -0,0 +1,56 @@
+import numpy as np
+import json
+import os
+
+from util.video import VideoFrames, split_frame, crop_to_square
+
+def _fake_decoded_video(tmp_path, n_frames = 6, height = 400, width = 800):
+    '''
+    a stand-in video file, already "decoded" so cv2 isn't needed
+    '''
+    video = str(tmp_path/'video.mp4')
+    open(video, 'w').close()
+    frames = np.zeros((n_frames, height, width, 3), dtype = np.uint8)
+    frames[..., 0] = np.arange(n_frames)[:, None, None]
+    frames[:, :, width//2:, 1] = 1 # right half
+    fpath = str(tmp_path/'video.frames')
+    frames.tofile(fpath)
+    with open(fpath + '.json', 'w') as f:
+        json.dump(dict(
+            n_frames = n_frames,
+            shape = [height, width, 3],
+            mtime = os.path.getmtime(video)
+            ), f)
+    return video, frames
+
+def test_split_and_crop_work_on_batches():
+    images = np.zeros((3, 400, 800, 3))
+    left, right = split_frame(images)
+    assert left.shape == right.shape == (3, 400, 400, 3)
+    cropped, ratio = crop_to_square(left, size = 100)
+    assert cropped.shape == (3, 100, 100, 3)
+    assert ratio == 100/400
+
+def test_frames_are_read_from_decoded_file(tmp_path):
+    video, frames = _fake_decoded_video(tmp_path)
+    vid = VideoFrames(video)
+    assert len(vid) == len(frames)
+    np.testing.assert_array_equal(vid[2:4], frames[2:4])
+
+def test_split_and_crop_select_frames_and_sides(tmp_path):
+    video, _ = _fake_decoded_video(tmp_path)
+    vid = VideoFrames(video)
+    right = vid.split([4, 1, 4], 'right')
+    assert right.shape == (3, 400, 400, 3)
+    assert list(right[:, 0, 0, 0]) == [4, 1, 4]
+    assert (right[..., 1] == 1).all()
+    left = vid.crop([0, 5], 'left')
+    assert left.shape == (2, 370, 370, 3)
+    assert (left[..., 1] == 0).all()
+
+def test_cached_frames_are_copies(tmp_path):
+    video, _ = _fake_decoded_video(tmp_path)
+    vid = VideoFrames(video)
+    crops = vid.crop([3], 'left')
+    crops[:] = 255 # e.g. a figure drawing over a frame
+    assert vid.crop([3], 'left')[0, 0, 0, 0] == 3
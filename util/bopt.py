@@ -26,9 +26,134 @@ class QuestObject(_QuestObject):
         chance accuracy). So you can use the `lower_cutoff` argument to truncate
         the posterior before drawing a sample. 
         '''
-        if lower_cutoff:
+        pdf = self.pdf
+        if lower_cutoff is not None:
             _x = self.tGuess + self.x
             above_bound = _x >= lower_cutoff
-            pdf = self.pdf * above_bound # truncate the posterior
+            pdf = pdf * above_bound # truncate the posterior
         p = pdf / pdf.sum()
         return self.tGuess + np.random.choice(self.x, p = p)
+
+
+class JointQuest:
+    '''
+    An adaptive staircase in the spirit of QUEST, but which keeps a joint
+    posterior over the threshold and the slope (beta) of a Weibull
+    psychometric function on a grid, so the slope is learned as trials come
+    in rather than in a separate `QuestObject.beta_analysis` at the end.
+
+    Each `update` is a single vectorized pass over the grid, after which the
+    marginal posterior of the threshold and its CDF are cached, so `mean`,
+    `quantile` and `draw_from_post` (by inverse-CDF lookup) are cheap.
+
+    As in QUEST, intensities are on a log10 scale, and the threshold is the
+    intensity at which accuracy is `pThreshold` (whatever the slope).
+    '''
+
+    def __init__(self, tGuess, tGuessSd, pThreshold, beta, delta, gamma,
+                    grain = .01, range = 5., log_beta_sd = .25, n_beta = 41):
+        '''
+        Parameters
+        ----------
+        tGuess, tGuessSd : float
+            Mean and sd of the Gaussian prior on the threshold.
+        pThreshold : float
+            Accuracy that defines the threshold.
+        beta : float
+            Prior guess at the slope.
+        delta : float
+            Lapse rate.
+        gamma : float
+            Chance performance.
+        grain : float, default: .01
+            Spacing of the threshold grid.
+        range : float, default: 5.
+            Width of the threshold grid, centered on `tGuess`.
+        log_beta_sd : float, default: .25
+            Sd of the (Gaussian) prior on log10(beta), centered on `beta`.
+            The slope grid spans three of these either side.
+        n_beta : int, default: 41
+            Number of points on the slope grid.
+        '''
+        assert(0 < delta*gamma + (1 - delta)*gamma < pThreshold < 1 - delta)
+        self.pThreshold = pThreshold
+        self.delta = delta
+        self.gamma = gamma
+        self.x = tGuess + np.arange(-range/2, range/2 + grain/2, grain)
+        log_beta = np.log10(beta) + np.linspace(-3, 3, n_beta)*log_beta_sd
+        self.beta = 10**log_beta
+        # offset that puts accuracy `pThreshold` at the threshold, per slope
+        c = (1 - (pThreshold - delta*gamma)/(1 - delta)) / (1 - gamma)
+        self._offset = np.log10(-np.log(c)) / self.beta
+        log_prior = -.5*((self.x - tGuess)/tGuessSd)**2
+        log_prior = log_prior[:, np.newaxis] - .5*(
+            (log_beta - np.log10(beta))/log_beta_sd
+            )**2
+        self.log_post = log_prior - log_prior.max()
+        self.n_trials = 0
+        self._cache()
+
+    def p_correct(self, intensity):
+        '''
+        Probability of a correct response at `intensity` (a scalar or array),
+        for each (threshold, slope) on the grid, i.e. with shape
+        `np.shape(intensity) + (len(self.x), len(self.beta))`.
+        '''
+        intensity = np.asarray(intensity, dtype = float)[..., np.newaxis, np.newaxis]
+        u = intensity - self.x[:, np.newaxis] + self._offset
+        return self.delta*self.gamma + (1 - self.delta)*(
+            1 - (1 - self.gamma)*np.exp(-10**(self.beta*u))
+            )
+
+    def update(self, intensity, response):
+        '''
+        adds a trial's result (1 if correct, 0 if not) to the posterior
+        '''
+        p = self.p_correct(intensity)
+        self.log_post += np.log(p if response else 1 - p)
+        self.log_post -= self.log_post.max() # keep in range
+        self.n_trials += 1
+        self._cache()
+
+    def _cache(self):
+        post = np.exp(self.log_post)
+        post /= post.sum()
+        self.post = post
+        self.pdf = post.sum(axis = 1) # marginal over slope
+        self.beta_pdf = post.sum(axis = 0) # marginal over threshold
+        self.cdf = np.cumsum(self.pdf)
+        self._mean = self.pdf @ self.x
+
+    def mean(self):
+        '''
+        posterior mean of the threshold
+        '''
+        return self._mean
+
+    def sd(self):
+        return np.sqrt(self.pdf @ (self.x - self._mean)**2)
+
+    def beta_mean(self):
+        '''
+        posterior mean of the slope
+        '''
+        return self.beta_pdf @ self.beta
+
+    def quantile(self, quantileOrder = .5):
+        '''
+        quantile of the marginal posterior of the threshold
+        '''
+        idx = np.searchsorted(self.cdf, quantileOrder)
+        return self.x[min(idx, len(self.x) - 1)]
+
+    def draw_from_post(self, lower_cutoff = None):
+        '''
+        Returns a draw from the marginal posterior of the threshold, for
+        Thompson sampling; see `QuestObject.draw_from_post`, including for
+        truncating the posterior below `lower_cutoff`.
+        '''
+        lo = 0.
+        if lower_cutoff is not None:
+            below = np.searchsorted(self.x, lower_cutoff)
+            lo = self.cdf[below - 1] if below > 0 else 0.
+        return self.quantile(np.random.uniform(lo, self.cdf[-1]))
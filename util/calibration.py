@@ -0,0 +1,215 @@
+'''
+Monte-Carlo simulation of the calibration block in experiment.py: many
+synthetic observers are run through the same procedure at once, as
+array operations over a batch of `JointQuest` posteriors, with batches
+split across a process pool. Run e.g.::
+
+    python -m util.calibration --observers 20000 --trials 100
+
+to see how the bias and spread of the chosen contrast (the 5th percentile
+of the threshold posterior) depend on the number of calibration trials.
+'''
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import argparse
+import os
+
+from .bopt import JointQuest
+
+# the calibration block's settings in experiment.py
+QUEST_PARAMS = dict(
+    tGuess = -.5,
+    tGuessSd = .5,
+    pThreshold = .525,
+    beta = 3.5,
+    delta = .01,
+    gamma = .5
+    )
+
+def p_correct(log_contrast, threshold, beta, pThreshold, delta, gamma):
+    '''
+    Weibull psychometric function, parameterized as in `JointQuest` so that
+    accuracy is `pThreshold` at `threshold`
+    '''
+    c = (1 - (pThreshold - delta*gamma)/(1 - delta)) / (1 - gamma)
+    u = log_contrast - threshold + np.log10(-np.log(c))/beta
+    return delta*gamma + (1 - delta)*(1 - (1 - gamma)*np.exp(-10**(beta*u)))
+
+def simulate_batch(seed, thresholds, betas, n_trials, checkpoints,
+                    quest_params = QUEST_PARAMS, stop_width = None,
+                    min_trials = 0):
+    '''
+    Runs one batch of observers with the given true `thresholds` and
+    `betas` through `n_trials` of mean-truncated Thompson sampling. If
+    `stop_width` is given, each observer stops early once at least
+    `min_trials` are done and the 90% credible interval of the threshold
+    is narrower than that, as in experiment.py.
+
+    Returns
+    ----------
+    estimates : np.ndarray
+        A (len(checkpoints), n_observers) array of the log contrast that
+        would be chosen (i.e. `quest.quantile(.05)`, clipped to 0) after
+        each number of trials in `checkpoints`, or when the observer
+        stopped, if that was earlier.
+    n_used : np.ndarray
+        The number of trials each observer ran.
+    '''
+    rng = np.random.default_rng(seed)
+    n = len(thresholds)
+    quest = JointQuest(**quest_params) # template for grid and likelihood
+    x = quest.x
+    n_x = len(x)
+    params = (quest.pThreshold, quest.delta, quest.gamma)
+    # since stimuli are drawn from the threshold grid, the likelihood only
+    # depends on how many grid steps the stimulus is above the threshold,
+    # so look it up by that (offset by n_x - 1) instead of recomputing it
+    steps = np.concatenate([x[0] - x[:0:-1], x - x[0]])
+    p_steps = p_correct(steps[:, np.newaxis], 0., quest.beta, *params)
+    log_p, log_q = np.log(p_steps), np.log(1 - p_steps)
+    j = np.arange(n_x)
+    max_idx = np.searchsorted(x, 0., side = 'right') - 1 # contrast <= 1
+    log_post = np.repeat(quest.log_post[np.newaxis], n, axis = 0)
+    rows = np.arange(n)
+    estimates = np.empty((len(checkpoints), n))
+    stopped = np.zeros(n, dtype = bool)
+    n_used = np.full(n, n_trials)
+
+    def marginal_cdf():
+        post = np.exp(log_post - log_post.max(axis = (1, 2), keepdims = True))
+        pdf = post.sum(axis = 2)
+        pdf /= pdf.sum(axis = 1, keepdims = True)
+        return pdf, np.cumsum(pdf, axis = 1)
+
+    for trial in range(1, n_trials + 1):
+        pdf, cdf = marginal_cdf()
+        if stop_width is not None and trial - 1 >= min_trials:
+            q05 = x[(cdf < .05).sum(axis = 1)]
+            q95 = x[np.minimum((cdf < .95).sum(axis = 1), n_x - 1)]
+            stopping = ~stopped & (q95 - q05 < stop_width)
+            n_used[stopping] = trial - 1
+            stopped |= stopping
+        # draw from posterior truncated at its mean (`draw_from_post`)
+        mean = pdf @ x
+        below = np.searchsorted(x, mean)
+        lo = np.where(below > 0, cdf[rows, np.maximum(below - 1, 0)], 0.)
+        u = rng.uniform(lo, cdf[:, -1])
+        idx = np.minimum((cdf < u[:, np.newaxis]).sum(axis = 1), max_idx)
+        # simulate responses and update posteriors
+        p = p_correct(x[idx], thresholds, betas, *params)
+        correct = rng.uniform(size = n) < p
+        diff = n_x - 1 + idx[:, np.newaxis] - j
+        log_lik = np.where(correct[:, np.newaxis, np.newaxis],
+                                log_p[diff], log_q[diff])
+        log_lik[stopped] = 0. # stopped observers' posteriors stay put
+        log_post += log_lik
+        if trial in checkpoints:
+            _, cdf = marginal_cdf()
+            idx = np.minimum((cdf < .05).sum(axis = 1), max_idx)
+            estimates[checkpoints.index(trial)] = x[idx]
+    return estimates, n_used
+
+def simulate_calibration(n_observers = 10000, n_trials = 100, checkpoints = None,
+                            threshold_sd = None, beta_sd = .25, batch_size = 100,
+                            seed = 0, workers = None, quest_params = QUEST_PARAMS,
+                            stop_width = None, min_trials = 0):
+    '''
+    Simulates the calibration block for `n_observers` synthetic observers,
+    whose true log10 thresholds are drawn from the QUEST prior (or with
+    sd `threshold_sd` if given), and whose slopes are log-normal around
+    the prior guess with sd `beta_sd` in log10 units. As in
+    `generate_mondrians`, results only depend on `seed`. See
+    `simulate_batch` for early stopping.
+
+    Returns
+    ----------
+    results : dict
+        `checkpoints`, the true `thresholds` and `betas` of each observer,
+        `estimates`, a (len(checkpoints), n_observers) array of the log
+        contrast chosen after that many trials, and `n_used`, the number
+        of trials each observer actually ran.
+    '''
+    if checkpoints is None:
+        checkpoints = list(range(10, n_trials + 1, 10))
+    checkpoints = sorted(set(checkpoints))
+    assert(checkpoints[-1] <= n_trials)
+    rng = np.random.default_rng(seed)
+    if threshold_sd is None:
+        threshold_sd = quest_params['tGuessSd']
+    thresholds = rng.normal(quest_params['tGuess'], threshold_sd, n_observers)
+    betas = quest_params['beta'] * 10**rng.normal(0, beta_sd, n_observers)
+    starts = range(0, n_observers, batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    run = partial(
+        simulate_batch,
+        n_trials = n_trials,
+        checkpoints = checkpoints,
+        quest_params = quest_params,
+        stop_width = stop_width,
+        min_trials = min_trials
+        )
+    with ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+        batches = pool.map(
+            run, seeds,
+            [thresholds[i:i + batch_size] for i in starts],
+            [betas[i:i + batch_size] for i in starts]
+            )
+        estimates, n_used = zip(*batches)
+    return dict(
+        checkpoints = checkpoints,
+        thresholds = thresholds,
+        betas = betas,
+        estimates = np.concatenate(estimates, axis = 1),
+        n_used = np.concatenate(n_used)
+        )
+
+def summarize(results, quest_params = QUEST_PARAMS):
+    '''
+    prints bias and spread of the chosen contrast at each checkpoint
+    '''
+    thresholds, betas = results['thresholds'], results['betas']
+    params = (quest_params['pThreshold'], quest_params['delta'],
+                quest_params['gamma'])
+    row = '%7s %10s %10s %10s %12s %12s'
+    print(row%('trials', 'bias', 'sd', 'rmse', 'below thr.', 'accuracy'))
+    for n, est in zip(results['checkpoints'], results['estimates']):
+        err = est - thresholds # in log10 contrast
+        acc = p_correct(est, thresholds, betas, *params)
+        print(row%(
+            n, '%.3f'%err.mean(), '%.3f'%err.std(),
+            '%.3f'%np.sqrt((err**2).mean()),
+            '%.1f%%'%(100*(err < 0).mean()), '%.3f'%acc.mean()
+            ))
+    n_used = results['n_used']
+    print('\ntrials run: mean %.1f, min %d, max %d'%(
+        n_used.mean(), n_used.min(), n_used.max()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.split('\n\n')[0])
+    parser.add_argument('--observers', type = int, default = 10000)
+    parser.add_argument('--trials', type = int, default = 100)
+    parser.add_argument('--every', type = int, default = 10,
+                        help = 'report after every this many trials')
+    parser.add_argument('--batch-size', type = int, default = 100)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--workers', type = int, default = None)
+    parser.add_argument('--stop-width', type = float, default = None,
+                        help = 'stop early once the 90%% credible interval '
+                        'is narrower than this (log10 units)')
+    parser.add_argument('--min-trials', type = int, default = 0)
+    args = parser.parse_args()
+    results = simulate_calibration(
+        n_observers = args.observers,
+        n_trials = args.trials,
+        checkpoints = range(args.every, args.trials + 1, args.every),
+        batch_size = args.batch_size,
+        seed = args.seed,
+        workers = args.workers,
+        stop_width = args.stop_width,
+        min_trials = args.min_trials
+        )
+    print('\n%d simulated observers; errors of chosen log10 contrast '
+            'relative to true threshold:\n'%args.observers)
+    summarize(results)
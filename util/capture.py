@@ -0,0 +1,227 @@
+'''
+Records what a window shows straight to disk, as an alternative to
+`win.getMovieFrame()` and `win.saveMovieFrames()`, which read each frame
+back synchronously and keep every frame in memory until the end.
+'''
+from pyglet import gl
+import numpy as np
+import subprocess
+import threading
+import ctypes
+import shutil
+import queue
+import json
+import os
+
+class FrameCapture:
+    '''
+    Streams a window's frames to a video file through ffmpeg, or to a raw
+    frame file (if `fname` ends in '.raw'; read it back with `read_capture`).
+
+    Pixels are read back into one of two pixel buffer objects in turn, so
+    the GPU copies a frame while the previous one is handed to a writer
+    thread through a bounded queue. `grab` therefore never waits for the
+    read it just started, and memory use doesn't grow with the length of
+    the recording (if the writer falls behind, `grab` waits for it).
+
+    Usage
+    -------
+    Call `grab` after every flip, in place of `win.getMovieFrame()`::
+
+        capture = FrameCapture(win, 'side-by-side.mp4', fps = 60.)
+        while recording:
+            ...
+            win.flip()
+            capture.grab()
+        capture.close()
+
+    '''
+
+    def __init__(self, win, fname, fps = 60., queue_size = 16, chunk_frames = 16):
+        '''
+        Arguments
+        ----------
+        win : psychopy.visual.Window
+        fname : str
+            Output file. Anything but '.raw' is passed to ffmpeg, which must
+            be on the PATH.
+        fps : float, default: 60.
+            Frame rate of the video.
+        queue_size : int, default: 16
+            Frames that can wait for the writer before `grab` blocks.
+        chunk_frames : int, default: 16
+            Frames written to a raw file at a time.
+        '''
+        self.win = win
+        self.fname = fname
+        self.width, self.height = [int(v) for v in win.frameBufferSize]
+        self.n_frames = 0
+        self._nbytes = self.width * self.height * 3
+        self._pbos = (gl.GLuint * 2)()
+        gl.glGenBuffers(2, self._pbos)
+        for pbo in self._pbos:
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, pbo)
+            gl.glBufferData(
+                gl.GL_PIXEL_PACK_BUFFER, self._nbytes, None, gl.GL_STREAM_READ
+                )
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        self._next = 0 # buffer to read the next frame into
+        self._pending = None # and the one with a read in flight
+        if fname.endswith('.raw'):
+            self._sink = _RawSink(fname, self.height, self.width, fps, chunk_frames)
+        else:
+            self._sink = _FFmpegSink(fname, self.height, self.width, fps)
+        self._queue = queue.Queue(queue_size)
+        self._error = None
+        self._thread = threading.Thread(target = self._write, daemon = True)
+        self._thread.start()
+        self._closed = False
+
+    def grab(self, buffer = 'front'):
+        '''
+        Starts reading back the frame in `buffer` ('front' after a flip,
+        'back' before one), and passes the previous frame on to be written.
+        '''
+        if self._error is not None:
+            raise self._error
+        # as in psychopy's Window._getFrame: with an FBO (as `init_window`
+        # uses), the back buffer is the FBO's color attachment, and the
+        # front buffer belongs to the default framebuffer
+        fbo = getattr(self.win, 'useFBO', False)
+        if buffer == 'back' and fbo:
+            gl.glBindFramebufferEXT(gl.GL_FRAMEBUFFER_EXT, self.win.frameBuffer)
+            gl.glReadBuffer(gl.GL_COLOR_ATTACHMENT0_EXT)
+        else:
+            if fbo:
+                gl.glBindFramebufferEXT(gl.GL_FRAMEBUFFER_EXT, 0)
+            gl.glReadBuffer(gl.GL_FRONT if buffer == 'front' else gl.GL_BACK)
+        gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 1)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, self._pbos[self._next])
+        gl.glReadPixels( # returns right away, into the bound buffer
+            0, 0, self.width, self.height,
+            gl.GL_RGB, gl.GL_UNSIGNED_BYTE, 0
+            )
+        if fbo: # psychopy expects its FBO to stay bound
+            gl.glBindFramebufferEXT(gl.GL_FRAMEBUFFER_EXT, self.win.frameBuffer)
+        if self._pending is not None:
+            self._collect(self._pending)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        self._pending = self._next
+        self._next = 1 - self._next
+        self.n_frames += 1
+
+    def _collect(self, idx):
+        '''
+        copies a finished read out of pixel buffer `idx` and queues it
+        '''
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, self._pbos[idx])
+        ptr = gl.glMapBuffer(gl.GL_PIXEL_PACK_BUFFER, gl.GL_READ_ONLY)
+        ptr = ctypes.cast(ptr, ctypes.c_void_p).value
+        pixels = (ctypes.c_ubyte * self._nbytes).from_address(ptr)
+        frame = np.frombuffer(pixels, dtype = np.uint8).copy()
+        gl.glUnmapBuffer(gl.GL_PIXEL_PACK_BUFFER)
+        # rows come bottom to top
+        self._queue.put(frame.reshape(self.height, self.width, 3))
+
+    def _write(self):
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                return
+            if self._error is None:
+                try:
+                    self._sink.write(frame)
+                except Exception as e:
+                    self._error = e
+
+    def close(self):
+        '''
+        writes out the last frame and finishes the file
+        '''
+        if self._closed:
+            return
+        self._closed = True
+        if self._pending is not None:
+            self._collect(self._pending)
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        self._queue.put(None)
+        self._thread.join()
+        gl.glDeleteBuffers(2, self._pbos)
+        self._sink.close()
+        if self._error is not None:
+            raise self._error
+
+    def __del__(self):
+        if not getattr(self, '_closed', True):
+            self.close()
+
+
+class _FFmpegSink:
+
+    def __init__(self, fname, height, width, fps):
+        if shutil.which('ffmpeg') is None:
+            raise Exception("Can't find ffmpeg; capture to a .raw file instead.")
+        self._proc = subprocess.Popen(
+            [
+                'ffmpeg', '-y', '-loglevel', 'error',
+                '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                '-s', '%dx%d'%(width, height), '-r', str(fps),
+                '-i', '-',
+                '-vf', 'vflip', '-pix_fmt', 'yuv420p',
+                fname
+                ],
+            stdin = subprocess.PIPE
+            )
+
+    def write(self, frame):
+        self._proc.stdin.write(frame.data)
+
+    def close(self):
+        self._proc.stdin.close()
+        if self._proc.wait() != 0:
+            raise Exception('ffmpeg failed with exit code %d'%self._proc.returncode)
+
+
+def _capture_index_path(fname):
+    return os.path.splitext(fname)[0] + '.json'
+
+class _RawSink:
+
+    def __init__(self, fname, height, width, fps, chunk_frames):
+        self.fname = fname
+        self.fps = fps
+        self._f = open(fname, 'wb')
+        self._chunk = np.empty((chunk_frames, height, width, 3), dtype = np.uint8)
+        self._n = 0 # frames in chunk
+        self._written = 0
+
+    def write(self, frame):
+        self._chunk[self._n] = frame[::-1] # top row first
+        self._n += 1
+        if self._n == len(self._chunk):
+            self._flush()
+
+    def _flush(self):
+        self._f.write(self._chunk[:self._n].tobytes())
+        self._written += self._n
+        self._n = 0
+
+    def close(self):
+        self._flush()
+        self._f.close()
+        with open(_capture_index_path(self.fname), 'w') as f:
+            json.dump(dict(
+                n_frames = self._written,
+                shape = list(self._chunk.shape[1:]),
+                fps = self.fps
+                ), f)
+
+
+def read_capture(fname):
+    '''
+    Memory-maps a raw capture as a (n_frames, height, width, 3) uint8 array.
+    '''
+    with open(_capture_index_path(fname)) as f:
+        index = json.load(f)
+    shape = tuple([index['n_frames']] + index['shape'])
+    return np.memmap(fname, dtype = np.uint8, mode = 'r', shape = shape)
@@ -1,6 +1,13 @@
-from psychopy import visual
-from .cfs import CFSMask
-from .stim import MaskedStimulus
+import importlib
+
+# the stimuli need psychopy, so they're only imported on first use; that way
+# generating and packing the assets (mondrian.py, assets.py) works headless
+_LAZY = dict(CFSMask = '.cfs', BACKWARD_MASK = '.cfs', MaskedStimulus = '.stim')
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError('module %s has no attribute %s'%(__name__, name))
+    return getattr(importlib.import_module(_LAZY[name], __name__), name)
 
 def init_window(**kwargs):
     '''
@@ -13,6 +20,7 @@ def init_window(**kwargs):
         You can input any arguments to psychopy.visual.Window that aren't
         already specified within this function.
     '''
+    from psychopy import visual
     win = visual.Window(
         allowStencil = False,
         color = [0, 0, 0],
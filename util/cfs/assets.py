@@ -0,0 +1,150 @@
+import numpy as np
+import warnings
+import hashlib
+import json
+import os
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+PACK_PATH = os.path.join(THIS_DIR, 'assets.pack')
+SECTIONS = dict(mondrians = '.tif', masks = '.png') # subdir -> file extension
+
+_stores = dict() # packed stores already mapped by this process, keyed by path
+
+def get_files_from_subdir(dirname, ext):
+    subdir = os.path.join(THIS_DIR, dirname)
+    fnames = os.listdir(subdir)
+    fnames = [f for f in fnames if ext in f]
+    fpaths = [os.path.join(subdir, f) for f in sorted(fnames)]
+    return fpaths
+
+def source_mtimes(name):
+    '''
+    modification times of the loose image files a section is packed from,
+    by file name
+    '''
+    fpaths = get_files_from_subdir(name, SECTIONS[name])
+    return {os.path.basename(f): os.path.getmtime(f) for f in fpaths}
+
+def pad_rgb(frames):
+    '''
+    Adds an opaque alpha channel to a stack of RGB frames. PIL can only
+    wrap single-channel and RGBA arrays without copying them, so packed
+    frames in one of those layouts go straight from the memory map to the
+    texture upload.
+    '''
+    if frames.ndim != 4 or frames.shape[-1] != 3:
+        return frames
+    alpha = np.full(frames.shape[:-1] + (1,), 255, dtype = frames.dtype)
+    return np.concatenate([frames, alpha], axis = -1)
+
+def _index_path(path):
+    return os.path.splitext(path)[0] + '.json'
+
+def _checksum(arr):
+    return hashlib.sha256(np.ascontiguousarray(arr).data).hexdigest()
+
+def write_packed(arrays, path = PACK_PATH, sources = None):
+    '''
+    Writes frame stacks back-to-back into a single file, along with a JSON
+    index (next to it, same name) recording where each stack lives.
+
+    Arguments
+    ----------
+    arrays : dict[np.ndarray]
+        Maps section names (e.g. 'mondrians') to arrays of shape
+        (n_frames, height, width[, channels]).
+    path : str
+        Where to write the packed file.
+    sources : dict[dict], default: None
+        For sections packed from the loose image files, their
+        `source_mtimes`, so `load_packed` can tell when the pack is stale.
+    '''
+    sources = sources or dict()
+    index = dict()
+    offset = 0
+    with open(path, 'wb') as f:
+        for name, frames in arrays.items():
+            frames = np.ascontiguousarray(frames)
+            index[name] = dict(
+                offset = offset,
+                count = frames.shape[0],
+                shape = list(frames.shape[1:]),
+                dtype = frames.dtype.str,
+                sha256 = _checksum(frames)
+            )
+            if name in sources:
+                index[name]['sources'] = sources[name]
+            f.write(frames.data)
+            offset += frames.nbytes
+    with open(_index_path(path), 'w') as f:
+        json.dump(index, f, indent = 2)
+    _stores.pop(path, None) # so next load maps the new file
+
+def pack_assets(path = PACK_PATH):
+    '''
+    Build step: decodes the loose Mondrian and backward mask images once and
+    packs them with `write_packed`. Run with `python -m util.cfs.assets`.
+    '''
+    from PIL import Image
+    arrays = dict()
+    sources = dict()
+    for name, ext in SECTIONS.items():
+        sources[name] = source_mtimes(name)
+        frames = [np.asarray(Image.open(f)) for f in get_files_from_subdir(name, ext)]
+        shapes = set(frame.shape for frame in frames)
+        if len(shapes) > 1:
+            raise Exception('Images in %s differ in shape: %s'%(name, shapes))
+        arrays[name] = pad_rgb(np.stack(frames))
+    write_packed(arrays, path, sources)
+
+def load_packed(path = PACK_PATH, verify = False):
+    '''
+    Memory-maps a file written by `write_packed`. The operating system
+    shares the mapped pages between processes, and indexing a section
+    returns a view into the map rather than a copy. A section packed from
+    loose image files that have changed since is left out, with a warning,
+    so callers fall back to the files themselves.
+
+    Arguments
+    ----------
+    path : str
+    verify : bool, default: False
+        Whether to check each section against its checksum. This reads the
+        whole file, so it is off by default.
+
+    Returns
+    ----------
+    store : dict[np.memmap] | None
+        Maps section names to read-only arrays of shape
+        (n_frames, height, width[, channels]), or None if the
+        assets have not been packed.
+    '''
+    if path in _stores and not verify:
+        return _stores[path]
+    if not os.path.exists(path):
+        return None
+    with open(_index_path(path)) as f:
+        index = json.load(f)
+    store = dict()
+    for name, entry in index.items():
+        if 'sources' in entry and entry['sources'] != source_mtimes(name):
+            warnings.warn(
+                '%s in %s is out of date; using the loose files instead. '
+                'Rebuild it with `python -m util.cfs.assets`.'%(name, path)
+                )
+            continue
+        store[name] = np.memmap(
+            path,
+            dtype = np.dtype(entry['dtype']),
+            mode = 'r',
+            offset = entry['offset'],
+            shape = tuple([entry['count']] + entry['shape'])
+            )
+        if verify and _checksum(store[name]) != entry['sha256']:
+            raise Exception('Checksum mismatch for %s in %s!'%(name, path))
+    _stores[path] = store
+    return store
+
+
+if __name__ == '__main__':
+    pack_assets()
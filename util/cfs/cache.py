@@ -0,0 +1,109 @@
+from psychopy import visual
+from PIL import Image
+import weakref
+
+from .assets import SECTIONS, get_files_from_subdir, load_packed
+
+_ATTR = '_cfs_texture_cache' # each window carries its own TextureCache
+
+class TextureCache:
+    '''
+    Holds one ImageStim for each Mondrian and backward mask image, so that
+    the images are decoded and uploaded as textures only once per window.
+
+    The stimuli are shared by every CFSMask drawn to the same window, so
+    they carry no position, size or color of their own; each CFSMask sets
+    those right before it draws. Each set of images is only loaded the
+    first time it's used, so e.g. a streaming CFSMask, which only needs the
+    backward masks, never loads the Mondrians. Use `get_texture_cache`
+    rather than constructing this class directly.
+    '''
+
+    def __init__(self, win):
+        self.win = win
+        self._sections = dict() # name -> stims, for the sets loaded so far
+        # id(stim) -> (pos, size, color) it was last drawn with, so a
+        # CFSMask only applies its own when they differ (see `draw_current`)
+        self.applied = dict()
+
+    @property
+    def mondrians(self):
+        return self._section('mondrians')
+
+    @property
+    def masks(self):
+        return self._section('masks')
+
+    def _section(self, name):
+        if name not in self._sections:
+            self._sections[name] = self._load(name)
+        return self._sections[name]
+
+    def _load(self, name):
+        '''
+        Reads images from the packed asset store if it has been built
+        (see `assets.pack_assets`), else falls back to the loose files.
+        Packed frames are wrapped as PIL images without a copy (see
+        `assets.pad_rgb`), so each is read from the memory map only when
+        psychopy uploads it as a texture.
+        '''
+        store = load_packed()
+        if store is not None and name in store:
+            images = [Image.fromarray(frame) for frame in store[name]]
+        else:
+            images = get_files_from_subdir(name, SECTIONS[name])
+        stims = [
+            visual.ImageStim(
+                self.win,
+                image = img,
+                mask = None,
+                colorSpace = 'rgb',
+                contrast = 1.,
+                interpolate = True
+                )
+            for img in images]
+        return stims
+
+    def release(self):
+        '''
+        drops all stimuli so psychopy can free their textures
+        '''
+        for stims in self._sections.values():
+            del stims[:]
+        self.applied.clear()
+
+
+def get_texture_cache(win):
+    '''
+    Returns the TextureCache for `win`, loading it on first use. The cache
+    is released automatically when `win.close()` is called.
+    '''
+    cache = getattr(win, _ATTR, None)
+    if cache is None:
+        cache = TextureCache(win)
+        setattr(win, _ATTR, cache)
+        _release_on_close(win)
+    return cache
+
+def release_texture_cache(win):
+    '''
+    Frees the textures cached for `win`, if there are any.
+    '''
+    cache = getattr(win, _ATTR, None)
+    if cache is not None:
+        delattr(win, _ATTR)
+        cache.release()
+
+def _release_on_close(win):
+    '''
+    wraps `win.close` so cached textures are freed while the window's GL
+    context still exists. The wrapper only holds a weak reference, so it
+    doesn't keep a window that is never closed alive.
+    '''
+    close = type(win).close
+    ref = weakref.ref(win)
+    def _close(*args, **kwargs):
+        win = ref()
+        release_texture_cache(win)
+        return close(win, *args, **kwargs)
+    win.close = _close
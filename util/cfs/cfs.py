@@ -1,19 +1,19 @@
 from psychopy import visual
+from PIL import Image
 import numpy as np
-import os
 
-def get_files_from_subdir(dirname, ext):
-    this_dir = os.path.dirname(os.path.realpath(__file__))
-    subdir = os.path.join(this_dir, dirname)
-    fnames = os.listdir(subdir)
-    fnames = [f for f in fnames if ext in f]
-    fpaths = [os.path.join(subdir, f) for f in fnames]
-    return fpaths
+from .assets import get_files_from_subdir
+from .cache import get_texture_cache
+from .stream import MondrianStream
+
+BACKWARD_MASK = -2 # `mask_index` while the backward mask is shown
 
 class CFSMask:
 
     def __init__(self, win, color = (0,0,1), pos = (0, 0), size = .5,
-                presentation_rate = 10., frame_rate = 60.):
+                presentation_rate = 10., frame_rate = 60., source = 'cached',
+                cache_settings = True, timeline = None, autodraw = True,
+                sequence = None, backward_mask = None):
         '''
         Arguments
         ---------
@@ -29,6 +29,34 @@ class CFSMask:
         frame_rate : float
             The refresh rate of the monitor (or the rate at which psychopy's
             win.flip() is going to be called).
+        source : str, default: 'cached'
+            Where Mondrian images come from. 'cached' draws randomly from the
+            fixed set of images shared by every CFSMask on the window, while
+            'stream' shows freshly generated images that a background thread
+            produces ahead of time (see MondrianStream).
+        cache_settings : bool, default: True
+            Cached images are drawn with the stimuli shared by every CFSMask
+            on the window, so this mask's position, size and color have to
+            be applied to them. If True, that's only done when a stimulus
+            was last drawn with different ones (e.g. by another CFSMask), so
+            a frame costs the same as drawing a stimulus of our own. If
+            False, they're applied on every frame. Ignored when streaming.
+        timeline : util.timeline.Timeline, default: None
+            If given, masks update on flip indices from the timeline rather
+            than by counting calls to `draw`, so a dropped frame doesn't
+            stretch the current mask.
+        autodraw : bool, default: True
+            Whether to start drawing the border and fixation on every flip
+            right away. If False, they only appear once `show` is called,
+            so a mask can be built ahead of time.
+        sequence : list[int], default: None
+            Indices into the window's cached Mondrians to show, in order
+            (starting over if the mask runs longer), e.g. from a session
+            plan. If None, each one is picked at random. Ignored when
+            streaming.
+        backward_mask : int, default: None
+            Index of the cached backward mask to end with, or None to pick
+            one at random.
         '''
         self.win = win
         self.color = color
@@ -37,18 +65,47 @@ class CFSMask:
         self.presentation_rate = presentation_rate
         self.frame_rate = frame_rate
         self._counter = 0 # counts screen flips that have occured
+        self._update_block = -1 # counter // _update_on at last update
+        self.timeline = timeline
+        self._first_flip = None
         self._update_on = np.round(frame_rate / presentation_rate).astype(int)
         self.completed = False
         self._terminate = 0
+        if source not in ('cached', 'stream'):
+            raise Exception("source must be 'cached' or 'stream', not %s"%source)
+        self.source = source
+        self._stream = None
+        self._cache_settings = cache_settings
+        self._sequence = sequence
+        self._n_updates = 0 # Mondrians shown so far
+        self.mask_index = -1 # what's shown; see `update_mask`
+        self._backward_mask = backward_mask
+        # what the window's shared stimuli were last drawn with
+        self._applied = get_texture_cache(win).applied
 
         self._mondrians = self.init_mondrians()
         self._mask = self.init_mask()
         self._border = self.init_border()
         self._fixation = self.init_fixation()
-        self._current_mask = None
+        self._quad = self.init_quad() if source == 'stream' else None
+        self._current_stim = None
+        if autodraw:
+            self.show()
+
+    def show(self):
+        '''
+        starts drawing the border and fixation on every flip
+        '''
         self._border.autoDraw = True
         self._fixation.autoDraw = True
 
+    def hide(self):
+        '''
+        stops drawing the border and fixation on every flip
+        '''
+        self._border.autoDraw = False
+        self._fixation.autoDraw = False
+
     def terminate(self):
         '''
         triggers termination sequence
@@ -76,47 +133,67 @@ class CFSMask:
         '''
         if self.completed:
             return # stop updating
-        self._counter += 1
+        if self.timeline is None:
+            self._counter += 1
+        else:
+            if self._first_flip is None:
+                self._first_flip = self.timeline.next_flip
+            self._counter = self.timeline.next_flip - self._first_flip + 1
         if terminate:
             self.terminate()
-        if self._counter % self._update_on == 1: # every _update_on frames...
+        block = (self._counter - 1) // self._update_on
+        if block != self._update_block: # every _update_on frames...
+            self._update_block = block
             self.update_mask()
+        if self._current_stim is not None:
+            self.draw_current()
 
     def init_mondrians(self):
         '''
-        intialize the mondrian masks to be used for CFS
-        '''
-        fpaths = get_files_from_subdir('mondrians', '.tif')
-        mondrians = [
-            visual.ImageStim(
-                self.win,
-                image = f,
-                mask = None,
-                size = self.size,
-                pos = self.pos,
-                color = self.color,
-                colorSpace = 'rgb',
-                contrast = 1.,
-                interpolate = True
-                )
-            for f in fpaths]
-        return mondrians
+        get the mondrian masks to be used for CFS, which are shared
+        with every other CFSMask on this window unless streaming
+        '''
+        if self.source == 'stream':
+            self.init_stream()
+            return []
+        return get_texture_cache(self.win).mondrians
+
+    def init_stream(self):
+        '''
+        start generating mondrians in the background
+        '''
+        seed = np.random.randint(2**32) # so np.random.seed still applies
+        self._stream = MondrianStream(seed = seed)
+        # fill the buffer before the first flip, so the worker starts out
+        # as far ahead as it can get
+        self._stream.wait_ready(self._stream.capacity - 1)
 
     def init_mask(self):
         '''
-        initialize the final backward mask (to reduce any visual after-effects)
+        pick the final backward mask (to reduce any visual after-effects)
+        '''
+        masks = get_texture_cache(self.win).masks
+        if self._backward_mask is not None:
+            return masks[self._backward_mask]
+        return masks[np.random.randint(0, len(masks))]
+
+    def init_quad(self):
+        '''
+        The stimulus a streaming mask draws with, placed once. New frames
+        are uploaded into its own texture.
         '''
-        fpaths = get_files_from_subdir('masks', '.png')
-        f = np.random.choice(fpaths)
-        mask = visual.ImageStim(
+        quad = visual.ImageStim(
             self.win,
-            image = f,
+            image = Image.fromarray(self._stream.next_frame()),
             mask = None,
             size = self.size,
             pos = self.pos,
+            color = self.color,
+            colorSpace = 'rgb',
+            contrast = 1.,
             interpolate = True
             )
-        return mask
+        return quad
 
     def init_fixation(self):
         fixation = visual.TextStim(
@@ -148,26 +225,91 @@ class CFSMask:
         return border
 
     def update_mask(self):
-        if self._current_mask is not None:
-            self._mondrians[self._current_mask].autoDraw = False
-        if self._terminate == 0:
-            self._current_mask = np.random.randint(0, len(self._mondrians))
-            self._mondrians[self._current_mask].autoDraw = True
+        '''
+        Moves on to the next image, and sets `mask_index` to the index of
+        the Mondrian shown (in the window's cache, or counting streamed
+        frames), to BACKWARD_MASK, or to -1 once the mask is done.
+        '''
+        if self._terminate == 0 and self._stream is not None:
+            if self._current_stim is not None: # first frame already uploaded
+                frame = self._stream.next_frame()
+                if frame is not None: # else keep showing the last one
+                    self._quad.image = Image.fromarray(frame)
+                    self._n_updates += 1
+            self._current_stim = self._quad
+            self.mask_index = self._n_updates
+        elif self._terminate == 0:
+            if self._sequence is not None:
+                idx = self._sequence[self._n_updates % len(self._sequence)]
+            else:
+                idx = np.random.randint(0, len(self._mondrians))
+            self._n_updates += 1
+            self._current_stim = self._mondrians[idx]
+            self.mask_index = idx
         elif self._terminate == 1:
-            self._mask.autoDraw = True
+            self._current_stim = self._mask
+            self.mask_index = BACKWARD_MASK
             self._terminate += 1
         elif self._terminate > 1:
             self.stop()
             return
 
+    def draw_current(self):
+        '''
+        draws the current mask image with this instance's position, size and
+        color, which only need applying to a shared stimulus, and (with
+        `cache_settings`) only if it was last drawn with different ones
+        '''
+        stim = self._current_stim
+        if stim is not self._quad:
+            # the backward mask keeps its own colors
+            color = None if stim is self._mask else tuple(self.color)
+            settings = (
+                tuple(np.ravel(self.pos)), tuple(np.ravel(self.size)), color
+                )
+            changed = self._applied.get(id(stim)) != settings
+            if changed or not self._cache_settings:
+                stim.pos = self.pos
+                stim.size = self.size
+                if color is not None:
+                    stim.color = self.color
+                self._applied[id(stim)] = settings
+        stim.draw()
+
+    def draw_frame(self, mask_index):
+        '''
+        Draws the mask, with its border and fixation, as it was on a frame
+        where `mask_index` was recorded (see `update_mask`), e.g. to replay
+        a frame log. Only for cached Mondrians, since streamed ones aren't
+        kept.
+        '''
+        if self.source == 'stream':
+            raise Exception('Streamed masks cannot be redrawn!')
+        if mask_index == BACKWARD_MASK:
+            self._current_stim = self._mask
+        elif mask_index >= 0:
+            self._current_stim = self._mondrians[mask_index]
+        if mask_index != -1:
+            self.draw_current()
+        self._border.draw()
+        self._fixation.draw()
+
+    @property
+    def underruns(self):
+        '''
+        number of updates at which the stream had no new frame ready
+        '''
+        if self._stream is None:
+            return 0
+        return self._stream.underruns
+
     def stop(self):
-        # make sure nothing is still autodrawing
-        if self._current_mask is not None:
-            self._mondrians[self._current_mask].autoDraw = False
-        self._mask.autoDraw = False
+        if self._stream is not None:
+            self._stream.close()
+        self._current_stim = None
+        self.mask_index = -1
         self.completed = True
 
     def __del__(self):
-        self._border.autoDraw = False
-        self._fixation.autoDraw = False
+        self.hide()
         self.stop()
@@ -0,0 +1,72 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import os
+
+# defaults reproduce the original 370 px frames drawn with psychopy
+BASE_SIZE = 370
+N_SQUARES = 350
+
+def make_mondrian(rng, size = BASE_SIZE, n_squares = N_SQUARES):
+    '''
+    Rasterizes a single Mondrian frame without a window: `n_squares` gray
+    squares of random luminance, position and size over a mid-gray
+    background, with later squares occluding earlier ones.
+
+    Arguments
+    ----------
+    rng : np.random.Generator
+    size : int, default: 370
+        Width and height of the frame in pixels. Square positions and sizes
+        scale with it, so any resolution looks like the 370 px original.
+    n_squares : int, default: 350
+
+    Returns
+    ----------
+    frame : np.ndarray
+        A (size, size, 3) uint8 RGB image, laid out like the original TIFs.
+    '''
+    scale = size / BASE_SIZE
+    lum = rng.uniform(-1, 1, n_squares)
+    centers = rng.integers(-180, 180, (n_squares, 2)) * scale
+    half_sides = rng.uniform(30, 100, n_squares) * scale / 2
+    # pixel (row i, column j) is centred at (j - size/2 + .5, size/2 - .5 - i),
+    # so each square covers a block of whole rows and columns
+    offset = size / 2 - .5
+    bounds = np.stack([
+        np.ceil(offset - centers[:, 1] - half_sides), # top row
+        np.floor(offset - centers[:, 1] + half_sides) + 1, # bottom row
+        np.ceil(offset + centers[:, 0] - half_sides), # left column
+        np.floor(offset + centers[:, 0] + half_sides) + 1 # right column
+        ], axis = 1)
+    bounds = np.clip(bounds, 0, size).astype(int)
+    levels = np.round((np.append(lum, 0.) + 1) / 2 * 255).astype(np.uint8)
+    frame = np.full((size, size), levels[-1]) # background
+    for (top, bottom, left, right), level in zip(bounds, levels):
+        frame[top:bottom, left:right] = level # painted back to front
+    return np.repeat(frame[:, :, None], 3, axis = 2)
+
+def _make_seeded(seed, size, n_squares):
+    return make_mondrian(np.random.default_rng(seed), size, n_squares)
+
+def generate_mondrians(n_frames = 100, size = BASE_SIZE, n_squares = N_SQUARES,
+                        seed = 0, workers = None):
+    '''
+    Generates a stack of Mondrian frames across a process pool. Each frame
+    gets its own child seed, so the output only depends on `seed`, not on
+    the number of workers.
+
+    Returns
+    ----------
+    frames : np.ndarray
+        A (n_frames, size, size, 3) uint8 array.
+    '''
+    seeds = np.random.SeedSequence(seed).spawn(n_frames)
+    frames = np.empty((n_frames, size, size, 3), dtype = np.uint8)
+    make = partial(_make_seeded, size = size, n_squares = n_squares)
+    workers = workers or os.cpu_count()
+    chunksize = max(1, n_frames // (4 * workers))
+    with ProcessPoolExecutor(workers) as pool:
+        for i, frame in enumerate(pool.map(make, seeds, chunksize = chunksize)):
+            frames[i] = frame
+    return frames
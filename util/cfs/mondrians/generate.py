@@ -1,37 +1,40 @@
-from psychopy import visual
-import numpy as np
-
-win = visual.Window([370,370],  units="pix")
-
-def draw_rand_sq(win, sq):
-
-    gray1 = [0, 0, 0]
-    c = np.random.uniform(-1, 1)
-    color = (c, c, c)
-    sq.fillColor = color
-    sq.lineColor = color
-    sq.setPos([np.random.randint(-180,180), np.random.randint(-180,180)])
-    sq.setSize(np.random.uniform(30,100))
-    sq.draw()
-
+'''
+Regenerates the Mondrian masks without opening a window and writes them into
+the packed asset store (see util/cfs/assets.py), e.g.::
 
-c = 0.2
-x = 1
+    python -m util.cfs.mondrians.generate --n-frames 1000 --size 512
 
-backg = map(lambda x: x/1000.0, range(0, 10000, 100))
-opacitylist = map(lambda x: x/1000.0, range(0, 10000, 20))
-
-squares = []
-for i in range(350):
-    squares.append(visual.Rect(win))
-
-
-
-for i in range(100):
-    for square in squares:
-        draw_rand_sq(win,square)
-    win.flip()
-    win.getMovieFrame()
-    x += 1
+Any other sections already in the store (e.g. the backward masks) are kept.
+'''
+import argparse
+import numpy as np
 
-win.saveMovieFrames('mondrian.tif')
+from ..assets import PACK_PATH, load_packed, pad_rgb, source_mtimes, write_packed
+from ..mondrian import generate_mondrians
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[1])
+    parser.add_argument('--n-frames', type = int, default = 100)
+    parser.add_argument('--size', type = int, default = 370)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--workers', type = int, default = None)
+    parser.add_argument('--out', default = PACK_PATH)
+    args = parser.parse_args()
+
+    frames = generate_mondrians(
+        n_frames = args.n_frames,
+        size = args.size,
+        seed = args.seed,
+        workers = args.workers
+        )
+    store = load_packed(args.out) or dict()
+    # copy other sections out of the map before the file is overwritten;
+    # they're up to date with their loose files, or `load_packed` would
+    # have left them out
+    arrays = {name: np.array(arr) for name, arr in store.items()}
+    sources = {
+        name: source_mtimes(name) for name in arrays if name != 'mondrians'
+        }
+    arrays['mondrians'] = pad_rgb(frames)
+    write_packed(arrays, args.out, sources)
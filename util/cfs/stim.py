@@ -3,7 +3,8 @@ import numpy as np
 
 class MaskedStimulus:
 
-    def __init__(self, win, color, mask_size, contrast, position = None, mask_pos = (0, 0)):
+    def __init__(self, win, color, mask_size, contrast, position = None,
+                    mask_pos = (0, 0), timeline = None):
 
         possible_positions = dict(
             upper_right = (mask_pos[0] + mask_size//4, mask_pos[1] + mask_size//4),
@@ -24,8 +25,17 @@ class MaskedStimulus:
             )
         self._triggered = False
         self._clock = core.Clock()
+        self.timeline = timeline # if given, presentation is locked to flips
+        self.event = None
+        self.visible = False # whether the last `draw` drew the stimulus
 
     def present(self, time_from_now, duration = .2):
+        if self.timeline is not None:
+            self.event = self.timeline.schedule(
+                time_from_now, duration, name = 'stimulus'
+                )
+            self._triggered = True
+            return self.position
         self._clock.reset(0.)
         self._onset = time_from_now
         self._offset = time_from_now + duration
@@ -33,8 +43,13 @@ class MaskedStimulus:
         return self.position
 
     def draw(self):
+        self.visible = False
         if not self._triggered:
             return
-        t = self._clock.getTime()
-        if t >= self._onset and t < self._offset:
+        if self.event is not None:
+            self.visible = self.event.active
+        else:
+            t = self._clock.getTime()
+            self.visible = t >= self._onset and t < self._offset
+        if self.visible:
             self.circle.draw()
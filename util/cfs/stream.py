@@ -0,0 +1,101 @@
+import numpy as np
+import threading
+
+from .mondrian import BASE_SIZE, make_mondrian
+
+class MondrianStream:
+    '''
+    Generates fresh Mondrian frames on a background thread into a bounded
+    ring buffer, so a CFSMask never has to show the same image twice.
+
+    The render loop takes frames with `next_frame`, which never waits on the
+    worker: if no new frame is ready it returns None and counts an underrun,
+    and the caller should keep showing its previous frame.
+    '''
+
+    def __init__(self, size = BASE_SIZE, capacity = 8, seed = None):
+        '''
+        Arguments
+        ---------
+        size : int, default: 370
+            Width and height of generated frames in pixels.
+        capacity : int, default: 8
+            Number of frame slots in the ring buffer. One slot always holds
+            the frame most recently handed out, so at most `capacity - 1`
+            frames are generated ahead.
+        seed : int, default: None
+            Seed for the worker's random number generator.
+        '''
+        assert(capacity >= 2)
+        self.size = size
+        self.capacity = capacity
+        self.underruns = 0
+        self._frames = np.empty((capacity, size, size, 3), dtype = np.uint8)
+        self._rng = np.random.default_rng(seed)
+        self._written = 0 # frames generated so far
+        self._read = 0 # frames handed out so far
+        self._running = True
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target = self._produce, daemon = True)
+        self._thread.start()
+
+    def _has_free_slot(self):
+        return self._written - self._read < self.capacity - 1
+
+    def _produce(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: not self._running or self._has_free_slot()
+                    )
+                if not self._running:
+                    return
+                slot = self._written % self.capacity
+            # consumer only reads slots below self._written, so this
+            # one can be filled without holding the lock
+            self._frames[slot] = make_mondrian(self._rng, self.size)
+            with self._cond:
+                self._written += 1
+                self._cond.notify_all()
+
+    @property
+    def ready(self):
+        '''
+        number of generated frames waiting to be shown
+        '''
+        return self._written - self._read
+
+    def wait_ready(self, n = 1, timeout = None):
+        '''
+        Blocks until `n` frames are buffered. Only call this outside the
+        render loop, e.g. to prime the buffer before a trial.
+        '''
+        n = min(n, self.capacity - 1)
+        with self._cond:
+            return self._cond.wait_for(lambda: self.ready >= n, timeout)
+
+    def next_frame(self):
+        '''
+        Returns the next (size, size, 3) uint8 frame, or None on underrun.
+        The frame is a view into the ring buffer that stays valid until
+        the next call.
+        '''
+        with self._cond:
+            if self._written == self._read:
+                self.underruns += 1
+                return None
+            frame = self._frames[self._read % self.capacity]
+            self._read += 1
+            self._cond.notify_all()
+        return frame
+
+    def close(self):
+        '''
+        stops the worker once it finishes any frame in progress
+        '''
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def __del__(self):
+        self.close()
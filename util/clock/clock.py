@@ -1,4 +1,4 @@
-from psychopy.visual import Line, Circle, Polygon, TextStim
+from psychopy.visual import Line, Circle, Polygon, ShapeStim, TextStim
 import numpy as np
 
 def subtract_angles(a, b):
@@ -41,12 +41,19 @@ class LibetClock:
             win.flip()
         win.flip() # to show feedback
         trial_data = clock.get_data()
-        clock.stop() # clock autodraws until you stop it...
+        clock.close() # clock autodraws until you close it...
+        clock.reset() # ... or reset it for the next trial
 
     '''
 
+    LINE_WIDTH = 5
+    HAND = 1.07 # length of hands/cursors, relative to radius
+    FEEDBACK = 1.2 # and of feedback markers
+
     def __init__(self, win, kb, radius, pos = (0, 0),
-                    period = 2.56, feedback = True, on_event = None):
+                    period = 2.56, feedback = True, on_event = None,
+                    timeline = None, batched = True, continuous = False,
+                    start_angle = None):
         '''
         Arguments
         ----------
@@ -67,6 +74,25 @@ class LibetClock:
             You may specify a function that will be called when the critical
             event (button press) occurs. This is useful for triggering a
             stimulus cued to the subjects' keypress.
+        timeline : util.timeline.Timeline, default: None
+            If given, the hand is drawn at the position for the scheduled time
+            of the upcoming flip, instead of the current time plus a frame.
+        batched : bool, default: True
+            If True, the ring and ticks are drawn as a single line strip, and
+            the hand, cursor and feedback marker are each one stimulus that is
+            moved into place, so the per-frame cost doesn't grow with the
+            number of ticks or hand positions. If False, every tick and every
+            possible hand position is its own stimulus.
+        continuous : bool, default: False
+            If True, the hand is drawn at the exact angle for the window's
+            predicted time of the next flip, rather than snapped to one of
+            the pre-built positions, and the angle shown on each frame is
+            recorded. `event_angle` (and so the overestimation) is then the
+            angle that was on screen when the key was pressed. Requires
+            `batched`.
+        start_angle : float, default: None
+            Angle (in radians) the hand starts at, or None to pick one at
+            random.
         '''
         EDGES = 256
         self.win = win
@@ -74,38 +100,73 @@ class LibetClock:
         self.radius = radius
         self.period = period
         self.pos = pos
-        self._start_angle = np.random.uniform(0, 2*np.pi)
-        self.clock = None
-        self._event_t = None
-        self.trial_ended = False
-        self._give_feedback = feedback
-        self._data = None
-        self._on_event = on_event
-        self._msg = None
+        if continuous and not batched:
+            raise Exception('A continuous hand requires batched = True.')
+        self.batched = batched
+        self.continuous = continuous
+        self._n_positions = EDGES # number of distinct hand positions
         ## draw basic clock shape (circle and ticks)
-        self.ring = Circle(
-            win,
-            radius = radius,
-            edges = EDGES,
-            pos = pos,
-            fillColor = None,
-            lineColor = 'black',
-            lineWidth = 5
-            )
-        self.ring.autoDraw = True
-        self.ticks = self.make_ticks(60, length = 1.05)
-        for tick in self.ticks:
-            tick.autoDraw = True
+        if batched:
+            self.face = [self.make_face(EDGES, 60, length = 1.05)]
+            n = 1 # hands etc. are moved to wherever they're needed
+        else:
+            ring = Circle(
+                win,
+                radius = radius,
+                edges = EDGES,
+                pos = pos,
+                fillColor = None,
+                lineColor = 'black',
+                lineWidth = self.LINE_WIDTH
+                )
+            self.face = [ring] + self.make_ticks(60, length = 1.05)
+            n = EDGES
         ## pre-draw all positions of moving hand
-        self.hands = self.make_arrows(EDGES, color = 'black', length = 1.07)
+        self.hands = self.make_arrows(n, color = 'black', length = self.HAND)
         self.cursors = self.make_arrows( # and hand that subject can move
-            EDGES,                      # when they're reporting perceived time
+            n,                          # when they're reporting perceived time
             color = 'black',
             fill = False,
-            length = 1.07
+            length = self.HAND
             )
         # lastly, some markers to show feedback after subjects respond
-        self.feedback_ticks = self.make_ticks(EDGES, 'white', 1.2)
+        self.feedback_ticks = self.make_ticks(n, 'white', self.FEEDBACK)
+        self._msg = self.make_msg()
+        self._shown = [] # stimuli autodrawing for this trial
+        self.reset(feedback, on_event, timeline, start_angle)
+
+    def reset(self, feedback = True, on_event = None, timeline = None,
+                start_angle = None):
+        '''
+        Readies the clock for a new trial without rebuilding any stimuli,
+        so one clock can be reused for a whole session. Picks a new start
+        angle (at random, unless given), clears the previous trial's response and feedback, and
+        takes the per-trial arguments as in __init__.
+        '''
+        self.close()
+        if start_angle is None:
+            start_angle = np.random.uniform(0, 2*np.pi)
+        self._start_angle = start_angle
+        self.clock = None
+        self._event_t = None
+        self.trial_ended = False
+        self._give_feedback = feedback
+        self._data = None
+        self._on_event = on_event
+        self.timeline = timeline
+        self._timeline_start = None
+        self._frame_times = [] # predicted flip times of frames shown so far
+        self._frame_angles = [] # and angles of the hand on them
+        self.hand_index = -1 # what the last `draw` showed, for frame logs
+        self.hand_angle = np.nan
+        self.cursor_angle = np.nan
+        self.feedback_angle = np.nan # where the feedback marker is, once shown
+        for stim in self.face:
+            self._autodraw(stim)
+
+    def _autodraw(self, stim):
+        stim.autoDraw = True
+        self._shown.append(stim)
 
     def abspos(self, relpos):
         '''
@@ -116,49 +177,122 @@ class LibetClock:
 
     def make_ticks(self, n_ticks = 12, color = 'black', length = 1.1):
         tick_angles = -1*np.linspace(0, 2*np.pi, n_ticks + 1)[:-1]
-        ticks = []
-        for i in range(tick_angles.size):
-            theta = tick_angles[i]
-            x = np.cos(theta)
-            x_start = self.radius * x
-            x_end = length*self.radius * x
-            y = np.sin(theta)
-            y_start = self.radius * y
-            y_end = length*self.radius * y
-            line = Line(
+        unit = np.stack([np.cos(tick_angles), np.sin(tick_angles)], axis = 1)
+        starts = self.radius * unit + self.pos
+        ends = length*self.radius * unit + self.pos
+        ticks = [
+            Line(
                 self.win,
-                self.abspos((x_start, y_start)),
-                self.abspos((x_end, y_end)),
+                tuple(start),
+                tuple(end),
                 lineColor = color,
-                lineWidth = self.ring.lineWidth
+                lineWidth = self.LINE_WIDTH
                 )
-            ticks.append(line)
+            for start, end in zip(starts, ends)]
         return ticks
 
+    def make_face(self, edges = 256, n_ticks = 12, length = 1.1):
+        '''
+        builds the ring and its ticks as one line strip, which runs around
+        the ring and out and back along each tick as it passes it
+        '''
+        ring_angles = np.linspace(0, 2*np.pi, edges + 1)[:-1]
+        tick_angles = np.linspace(0, 2*np.pi, n_ticks + 1)[:-1]
+        angles = np.concatenate([ring_angles, tick_angles])
+        is_tick = np.arange(angles.size) >= edges
+        order = np.argsort(angles, kind = 'stable')
+        angles, is_tick = angles[order], is_tick[order]
+        unit = np.stack([np.cos(angles), np.sin(angles)], axis = 1)
+        ring = self.radius * unit
+        tip = length*self.radius * unit
+        verts = np.stack([ring, tip, ring], axis = 1).reshape(-1, 2)
+        keep = np.stack([np.ones_like(is_tick), is_tick, is_tick], axis = 1)
+        face = ShapeStim(
+            self.win,
+            vertices = verts[keep.ravel()],
+            pos = self.pos,
+            closeShape = True,
+            fillColor = None,
+            lineColor = 'black',
+            lineWidth = self.LINE_WIDTH
+            )
+        return face
+
+    def posed(self, stims, idx):
+        '''
+        Returns the stimulus from `stims` (self.hands, self.cursors or
+        self.feedback_ticks) for hand position `idx`. When batched, that
+        is the one stimulus in the list, moved into place.
+        '''
+        if not self.batched:
+            return stims[idx]
+        return self.posed_at(stims, 2*np.pi * idx / self._n_positions)
+
+    def posed_at(self, stims, rad):
+        '''
+        Like `posed`, but moves the stimulus to an arbitrary angle (as
+        returned by `time_to_angle`). Only for batched clocks.
+        '''
+        stim = stims[0]
+        theta = -rad # angles are drawn clockwise
+        unit = np.array([np.cos(theta), np.sin(theta)])
+        if stims is self.feedback_ticks:
+            stim.start = tuple(self.radius * unit + self.pos)
+            stim.end = tuple(self.FEEDBACK*self.radius * unit + self.pos)
+        else:
+            stim.pos = tuple(self.HAND*self.radius * unit + self.pos)
+            stim.ori = -np.degrees(theta) - 90.
+        return stim
+
     def make_arrows(self, n = 12, color = 'black', fill = True, length = 1.1):
         tick_angles = -1*np.linspace(0, 2*np.pi, n + 1)[:-1]
-        ticks = []
-        for i in range(tick_angles.size):
-            theta = tick_angles[i]
-            x = np.cos(theta) * self.radius*length
-            y = np.sin(theta) * self.radius*length
-            r = self.radius*length - self.radius
-            triangle = Polygon(
+        unit = np.stack([np.cos(tick_angles), np.sin(tick_angles)], axis = 1)
+        centers = self.radius*length * unit + self.pos
+        oris = -np.degrees(tick_angles) - 90.
+        r = self.radius*length - self.radius
+        ticks = [
+            Polygon(
                 self.win,
-                pos = self.abspos((x, y)),
+                pos = tuple(center),
                 edges = 3,
                 radius = r,
-                ori = -np.degrees(theta) - 90.,
+                ori = ori,
                 lineColor = color,
                 fillColor = color if fill else None,
-                lineWidth = self.ring.lineWidth
-            )
-            ticks.append(triangle)
+                lineWidth = self.LINE_WIDTH
+                )
+            for center, ori in zip(centers, oris)]
         return ticks
 
+    def make_msg(self):
+        msg = '''
+        Use arrow keys to adjust the clock hand to where it was
+        when you pressed space. Then, press space again.
+        '''
+        txt_pos = self.abspos((0, 1.3*self.radius))
+        msg = TextStim(
+            win = self.win,
+            pos = txt_pos,
+            text = msg,
+            font = 'Arial',
+            wrapWidth = 3*self.radius,
+            contrast = 1,
+            depth = -4.0
+            )
+        return msg
+
     def start(self):
         self.clock = self.kb.clock
         self.kb.clock.reset()
+        if self.timeline is not None: # when kb.clock read zero
+            self._timeline_start = self.timeline.clock.getTime()
+
+    def to_timeline(self, t):
+        '''
+        converts a time since `start` (e.g. a keypress rt) to seconds since
+        the timeline's first flip
+        '''
+        return self.timeline.since_first_flip(self._timeline_start) + t
 
     def time_to_angle(self, t):
         '''
@@ -177,7 +311,7 @@ class LibetClock:
         '''
         rad %= (2*np.pi)
         clock_phase = rad / (2*np.pi)
-        idx = np.floor(len(self.hands) * clock_phase).astype(int)
+        idx = np.floor(self._n_positions * clock_phase).astype(int)
         return idx
 
     @property
@@ -197,9 +331,22 @@ class LibetClock:
             key = keys[0]
             self.critical_event(key.rt)
 
+    def displayed_angle(self, t):
+        '''
+        returns the angle of the hand that was on screen at time `t`,
+        for continuous clocks
+        '''
+        i = np.searchsorted(self._frame_times, t, side = 'right') - 1
+        if i < 0: # before first frame
+            return self.time_to_angle(t)
+        return self._frame_angles[i]
+
     def critical_event(self, t):
         self._event_t = t
-        self._event_angle = self.time_to_angle(self._event_t)
+        if self.continuous:
+            self._event_angle = self.displayed_angle(self._event_t)
+        else:
+            self._event_angle = self.time_to_angle(self._event_t)
         self._end_t = self._event_t + np.random.uniform(1., 2.)
         self._choice_t = self._end_t + 1.
         init_offset = np.random.uniform(np.pi/4, np.pi/3)
@@ -234,11 +381,19 @@ class LibetClock:
         return False
 
     def end_trial(self, resp_angle):
-        resp_idx = idx = self.deg_to_idx(resp_angle)
-        self.cursors[resp_idx].autoDraw = True
-        event_idx = self.deg_to_idx(self._event_angle)
-        if self._give_feedback:
-            self.feedback_ticks[event_idx].autoDraw = True
+        if self.continuous:
+            self._autodraw(self.posed_at(self.cursors, resp_angle))
+            if self._give_feedback:
+                marker = self.posed_at(self.feedback_ticks, self._event_angle)
+                self._autodraw(marker)
+                self.feedback_angle = self._event_angle
+        else:
+            resp_idx = idx = self.deg_to_idx(resp_angle)
+            self._autodraw(self.posed(self.cursors, resp_idx))
+            event_idx = self.deg_to_idx(self._event_angle)
+            if self._give_feedback:
+                self._autodraw(self.posed(self.feedback_ticks, event_idx))
+                self.feedback_angle = 2*np.pi * event_idx / self._n_positions
         self.trial_ended = True
         overest_angle = subtract_angles(resp_angle, self._event_angle)
         overest_t = overest_angle / (2*np.pi) * self.period
@@ -253,24 +408,10 @@ class LibetClock:
         self._msg.autoDraw = False
 
     def update_cursor(self):
-        msg = '''
-        Use arrow keys to adjust the clock hand to where it was
-        when you pressed space. Then, press space again.
-        '''
-        if self._msg is None:
-            txt_pos = self.abspos((0, 1.3*self.radius))
-            self._msg = TextStim(
-                win = self.win,
-                pos = txt_pos,
-                text = msg,
-                font = 'Arial',
-                wrapWidth = 3*self.radius,
-                contrast = 1,
-                depth = -4.0
-                )
-            self._msg.autoDraw = True
+        if not self._msg.autoDraw: # first call this trial
+            self._autodraw(self._msg)
 
-        speed = .5*np.pi / len(self.cursors)
+        speed = .5*np.pi / self._n_positions
         keys = self.kb.getKeys(
             keyList = ['left', 'right', 'space'],
             waitRelease = False,
@@ -284,26 +425,52 @@ class LibetClock:
             self._resp_angle %= (2*np.pi)
             if key.name == 'space':
                 self.end_trial(self._resp_angle)
+        if self.continuous:
+            self.cursor_angle = self._resp_angle
+            self.posed_at(self.cursors, self._resp_angle).draw()
+            return
         idx = self.deg_to_idx(self._resp_angle)
-        self.cursors[idx].draw()
+        self.cursor_angle = 2*np.pi * idx / self._n_positions
+        self.posed(self.cursors, idx).draw()
 
     def draw(self, flip_rate = None):
         '''
-        updates clock display; call this on every flip
+        Updates clock display; call this on every flip. Afterwards,
+        `hand_index` and `hand_angle` are the position of the hand drawn
+        (-1 and nan if none, and the index is -1 for continuous clocks),
+        and `cursor_angle` the cursor's angle (or nan). Once the trial has
+        ended, `feedback_angle` is where the feedback marker is (or nan if
+        there's no feedback).
         '''
         if self.clock is None: # not started yet
             return
+        self.hand_index = -1
+        self.hand_angle = self.cursor_angle = np.nan
         if self.spinning:
             # determine which position hand should be drawn
-            if flip_rate is not None:
-                flip_rate_offset = 1./flip_rate
+            if self.continuous:
+                t = self.win.getFutureFlipTime(clock = self.clock)
+                theta = self.time_to_angle(t)
+                self._frame_times.append(t)
+                self._frame_angles.append(theta)
+                self.hand_angle = theta
+                self.posed_at(self.hands, theta).draw()
+                if not self.critical_event_occured:
+                    self.check_for_event()
+                return
+            if self.timeline is not None:
+                t = self.timeline.flip_time(self.timeline.next_flip)
+                t -= self.to_timeline(0.)
+            elif flip_rate is not None:
+                t = self.clock.getTime() + 1./flip_rate
             else:
-                flip_rate_offset = 0.
-            t = self.clock.getTime() + flip_rate_offset
+                t = self.clock.getTime()
             theta = self.time_to_angle(t)
             idx = self.deg_to_idx(theta)
+            self.hand_index = idx
+            self.hand_angle = 2*np.pi * idx / self._n_positions
             # and draw it!
-            self.hands[idx].draw()
+            self.posed(self.hands, idx).draw()
             if not self.critical_event_occured:
                 self.check_for_event()
             return
@@ -315,6 +482,25 @@ class LibetClock:
             return
         return
 
+    def draw_state(self, hand_angle = np.nan, cursor_angle = np.nan,
+                    feedback_angle = np.nan, trial_ended = False):
+        '''
+        Draws the clock as it was on a frame where `hand_angle`,
+        `cursor_angle`, `feedback_angle` and `trial_ended` were recorded
+        (see `draw`), e.g. to replay a frame log. Doesn't need the clock to
+        be started. Requires `batched`.
+        '''
+        for stim in self.face:
+            stim.draw()
+        if not np.isnan(hand_angle):
+            self.posed_at(self.hands, hand_angle).draw()
+        if not np.isnan(cursor_angle):
+            self.posed_at(self.cursors, cursor_angle).draw()
+            if not trial_ended: # instructions are only up while responding
+                self._msg.draw()
+        if not np.isnan(feedback_angle):
+            self.posed_at(self.feedback_ticks, feedback_angle).draw()
+
     def get_data(self):
         return self._data
 
@@ -322,15 +508,9 @@ class LibetClock:
         '''
         make sure nothing is still autodrawing
         '''
-        self.ring.autoDraw = False
-        for tick in self.ticks:
-            tick.autoDraw = False
-        for hand in self.hands:
-            hand.autoDraw = False
-        for cursor in self.cursors:
-            cursor.autoDraw = False
-        for tick in self.feedback_ticks:
-            tick.autoDraw = False
+        for stim in self._shown:
+            stim.autoDraw = False
+        self._shown = []
 
     def __del__(self):
         self.close()
@@ -1 +1,2 @@
 from .keyboard import get_keyboard
+from .threaded import ThreadedKeyboard
@@ -1,12 +1,18 @@
 from psychopy.hardware.keyboard import Keyboard
 from psychtoolbox import hid
 
+from .threaded import ThreadedKeyboard
+
 # fix psychtoolbox issue for older versions of psychopy
 import ctypes
 xlib = ctypes.cdll.LoadLibrary("libX11.so")
 xlib.XInitThreads()
 
-def get_keyboard(dev_name = 'Dell Dell USB Entry Keyboard'):
+def get_keyboard(dev_name = 'Dell Dell USB Entry Keyboard', threaded = False):
+    '''
+    Returns a Keyboard for the named device, or, if `threaded`, one wrapped
+    in a ThreadedKeyboard so the device is read on a background thread.
+    '''
     devs = hid.get_keyboard_indices()
     idxs = devs[0]
     names = devs[1]
@@ -16,4 +22,6 @@ def get_keyboard(dev_name = 'Dell Dell USB Entry Keyboard'):
         raise Exception(
     'Cannot find %s! Available devices are %s.'%(dev_name, ', '.join(names))
         )
+    if threaded:
+        return ThreadedKeyboard(Keyboard(idx))
     return Keyboard(idx)
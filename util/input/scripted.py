@@ -0,0 +1,97 @@
+from psychopy.hardware.keyboard import KeyPress
+from psychopy import core
+
+class ScriptedKeyboard:
+    '''
+    Stands in for a psychopy Keyboard, producing key presses at exactly
+    scripted times instead of reading a device, e.g. to drive trials from a
+    test harness.
+
+    The script is restarted whenever `self.clock` is reset (as
+    `LibetClock.start` does at the start of each clock trial): `script` is
+    called with no arguments and should return a list of (time, key name)
+    or (time, key name, duration) tuples, with times in seconds since the
+    reset. A scripted key counts as pressed from its time on, and is held
+    down for `duration` seconds, or indefinitely if that's not given. More
+    keys can be added to the current script with `press`. `waitKeys`
+    doesn't wait, and just presses `choice(keyList)`.
+
+    Usage
+    -------
+    For a clock trial, press space once after the first rotation and again
+    to submit the response::
+
+        kb = ScriptedKeyboard(lambda: [(3., 'space'), (7., 'space')])
+
+    '''
+
+    def __init__(self, script, choice = None):
+        '''
+        Arguments
+        ----------
+        script : callable
+            Returns the (time, key name[, duration]) tuples to press after
+            a clock reset.
+        choice : callable, default: None
+            Picks the key `waitKeys` presses from its keyList. By default,
+            the first one.
+        '''
+        self.clock = core.Clock()
+        self._script = script
+        self._choice = choice if choice is not None else (lambda keys: keys[0])
+        self._epoch = None # last reset time the current script belongs to
+        self._keys = []
+
+    def _update(self):
+        epoch = self.clock.getLastResetTime()
+        if epoch != self._epoch: # clock was reset, so start the script over
+            self._epoch = epoch
+            self._keys = []
+            for press in self._script():
+                self.press(*press)
+        t = self.clock.getTime()
+        for key in self._keys:
+            if key._hold is not None and t >= key.rt + key._hold: # released
+                key.duration = key._hold
+        return t
+
+    def press(self, t, name, duration = None):
+        '''
+        Adds a key press to the current script, at `t` seconds since the
+        clock was last reset.
+        '''
+        key = KeyPress(0, self.clock.getLastResetTime() + t, name)
+        key.rt = t
+        key.duration = None # until released
+        key._hold = duration
+        key._consumed = False
+        self._keys.append(key)
+
+    def getKeys(self, keyList = None, waitRelease = True, clear = True):
+        t = self._update()
+        keys = []
+        for key in self._keys:
+            if key._consumed or key.rt > t:
+                continue
+            if keyList is not None and key.name not in keyList:
+                continue
+            if waitRelease and key.duration is None: # still held down
+                continue
+            if clear:
+                key._consumed = True
+            keys.append(key)
+        return keys
+
+    def waitKeys(self, maxWait = float('inf'), keyList = None,
+                    waitRelease = True, clear = True):
+        t = self.clock.getTime()
+        key = KeyPress(0, self.clock.getLastResetTime() + t, self._choice(keyList))
+        key.rt = t
+        key.duration = 0.
+        return [key]
+
+    def clearEvents(self, eventType = None):
+        t = self._update()
+        for key in self._keys:
+            if key.rt <= t:
+                key._consumed = True
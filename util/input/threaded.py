@@ -0,0 +1,108 @@
+from collections import deque
+import threading
+import time
+
+class ThreadedKeyboard:
+    '''
+    Wraps a psychopy Keyboard so the device is drained on a background
+    thread instead of inside the frame loop. Key presses go into a bounded
+    ring buffer with their device timestamps (`tDown`), and `getKeys`,
+    `waitKeys` and `clearEvents` only read what's already queued.
+
+    Reaction times are computed from `tDown` when keys are read, relative to
+    the last reset of `self.clock` (the wrapped keyboard's clock), so keys
+    queued before e.g. `LibetClock.start` resets the clock still get the
+    right `rt`.
+
+    Usage
+    -------
+    Use it wherever a Keyboard is expected::
+
+        kb = ThreadedKeyboard(Keyboard(idx))
+        keys = kb.getKeys(keyList = ['space'], waitRelease = False)
+        kb.stop() # when done with it
+
+    '''
+
+    def __init__(self, kb, capacity = 256, poll_interval = .001):
+        '''
+        Arguments
+        ----------
+        kb : psychopy.hardware.keyboard.Keyboard
+        capacity : int, default: 256
+            Maximum number of key presses kept. If the frame loop falls this
+            far behind, the oldest presses are dropped, and counted in
+            `self.overflows` if they hadn't been read yet.
+        poll_interval : float, default: .001
+            Seconds the capture thread sleeps between polls of the device.
+        '''
+        self._kb = kb
+        self.clock = kb.clock
+        self.overflows = 0
+        self.poll_interval = poll_interval
+        # deque appends and snapshots are atomic, so the capture thread
+        # and the frame loop never need to take a lock
+        self._events = deque(maxlen = capacity)
+        self._running = True
+        self._thread = threading.Thread(target = self._capture, daemon = True)
+        self._thread.start()
+
+    def _capture(self):
+        while self._running:
+            # psychopy updates `duration` on the returned KeyPress objects
+            # in place once the key is released, so each press is queued once
+            keys = self._kb.getKeys(waitRelease = False, clear = True)
+            for key in keys:
+                key._consumed = False
+                full = len(self._events) == self._events.maxlen
+                if full and not self._events[0]._consumed: # about to drop it
+                    self.overflows += 1
+                self._events.append(key)
+            time.sleep(self.poll_interval)
+
+    def getKeys(self, keyList = None, waitRelease = True, clear = True):
+        '''
+        Same arguments and return value as psychopy's Keyboard.getKeys.
+        '''
+        keys = []
+        for key in list(self._events):
+            if key._consumed:
+                continue
+            if keyList is not None and key.name not in keyList:
+                continue
+            if waitRelease and key.duration is None: # still held down
+                continue
+            key.rt = key.tDown - self.clock.getLastResetTime()
+            if clear:
+                key._consumed = True
+            keys.append(key)
+        return keys
+
+    def waitKeys(self, maxWait = float('inf'), keyList = None,
+                    waitRelease = True, clear = True):
+        '''
+        Same arguments and return value as psychopy's Keyboard.waitKeys,
+        which also discards keys pressed before the wait if `clear`.
+        '''
+        if clear:
+            self.clearEvents()
+        t0 = time.time()
+        while time.time() - t0 < maxWait:
+            keys = self.getKeys(keyList, waitRelease, clear)
+            if keys:
+                return keys
+            time.sleep(self.poll_interval)
+        return None
+
+    def clearEvents(self, eventType = None):
+        '''
+        discards everything queued so far
+        '''
+        for key in list(self._events):
+            key._consumed = True
+
+    def stop(self):
+        self._running = False
+
+    def __del__(self):
+        self.stop()
@@ -1,8 +1,48 @@
+import numpy as np
+import threading
+import atexit
+import json
+import queue
+import time
+import zlib
+import sys
 import os
 
+def _beh_dir(sub, dir):
+    '''
+    returns (and creates, if needed) a subject's behavioral log directory
+    '''
+    dir = os.path.join(dir, 'sub-%s'%sub, 'beh') # subject-level directory
+    if not os.path.exists(dir):
+        os.makedirs(dir)
+    return dir
+
+_SYNC = 'sync' # messages to a TSVLogger's writer thread, besides rows
+_STOP = 'stop'
+
+def _journal_path(fpath):
+    return fpath + '.journal'
+
+def _checksum(row):
+    return '%08x'%zlib.crc32(row.encode())
+
 class TSVLogger:
+    '''
+    Writes rows to a TSV file from a background thread, so that calling
+    `write` between trials only hands the row off, and log I/O never holds
+    up the next trial.
+
+    Every row also goes to a journal next to the log file (which is fsynced
+    row by row, each row ending in its checksum), and the log itself is
+    flushed and fsynced every `sync_interval` seconds, whenever `sync` is
+    called (e.g. at the end of a block), and on `close`, at which point the
+    journal is emptied. After a crash, `recover_tsv` rebuilds the log from
+    whatever made it to disk. If the writer thread fails, the error is
+    raised by the next call to `write`, `sync` or `close`.
+    '''
 
-    def __init__(self, sub, task, fields, dir = 'logs'):
+    def __init__(self, sub, task, fields, dir = 'logs', sync_interval = 5.,
+                    capacity = 1024):
         '''
         Opens a TSV file in which to log experiment events.
 
@@ -18,14 +58,27 @@ class TSVLogger:
             A relative directory path. This should be a root directory where all
             subjects' data is to be saved; a subject-specific subdirectory will
             be created within this root directory.
+        sync_interval : float, default: 5.
+            Seconds between fsyncs of the log file.
+        capacity : int, default: 1024
+            Number of rows that can wait to be written before `write` blocks.
         '''
-        dir = os.path.join(dir, 'sub-%s'%sub, 'beh') # subject-level directory
-        if not os.path.exists(dir):
-            os.makedirs(dir)
-        fpath = os.path.join(dir, 'sub-%s_task-%s_beh.tsv'%(sub, task))
-        self._f = open(fpath, 'w')
+        dir = _beh_dir(sub, dir)
+        self.fpath = os.path.join(dir, 'sub-%s_task-%s_beh.tsv'%(sub, task))
+        self._f = open(self.fpath, 'w')
         self._fields = fields
         self._f.write('\t'.join(self._fields))
+        self._row = '\n' + '\t'.join(['{}']*len(fields)) # formats one row
+        self._journal = None
+        self._rows = 0 # written to log file so far
+        self._sync_interval = sync_interval
+        self._sync() # header, and empty journal
+        self._queue = queue.Queue(capacity)
+        self._error = None
+        self._thread = threading.Thread(target = self._run, daemon = True)
+        self._thread.start()
+        self._closed = False
+        atexit.register(self.close) # write out what's queued on a clean exit
 
     def write(self, **params):
         '''
@@ -43,18 +96,329 @@ class TSVLogger:
         If you don't include a field specified at initialization, then it will
         be filled in with an 'n/a' automatically.
         '''
-        vals = dict()
-        for field in self._fields:
-            if field in params:
-                vals[field] = params[field]
+        if self._error is not None:
+            raise self._error
+        vals = tuple([params.get(field, 'n/a') for field in self._fields])
+        self._queue.put(vals)
+
+    def sync(self):
+        '''
+        waits until everything written so far is safely on disk
+        '''
+        self._queue.put(_SYNC)
+        self._queue.join()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        next_sync = time.monotonic() + self._sync_interval
+        while True:
+            # once writing has failed, just drain the queue so `sync` returns
+            if self._error is None:
+                timeout = max(0., next_sync - time.monotonic())
             else:
-                vals[field] = 'n/a'
-        boilerplate = '\n' + '\t'.join(['{%s}'%key for key in self._fields])
-        line = boilerplate.format(**vals)
+                timeout = None
+            try:
+                item = self._queue.get(timeout = timeout)
+                queued = True
+            except queue.Empty: # time for a periodic sync
+                item, queued = _SYNC, False
+            if self._error is None:
+                try:
+                    if item is _SYNC or item is _STOP:
+                        self._sync()
+                        next_sync = time.monotonic() + self._sync_interval
+                    else:
+                        self._append(item)
+                except Exception as e:
+                    self._error = e
+            if queued:
+                self._queue.task_done()
+            if item is _STOP:
+                return
+
+    def _append(self, vals):
+        line = self._row.format(*vals)
+        self._journal.write(line + '\t' + _checksum(line[1:]))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
         self._f.write(line)
+        self._rows += 1
+
+    def _sync(self):
+        '''
+        Makes the log file durable, then starts the journal over. The
+        journal's first line is the number of rows known to be in the log,
+        written to a new file that then replaces the journal, so that a
+        crash at any point leaves a journal with a count.
+        '''
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        jpath = _journal_path(self.fpath)
+        if self._journal is not None:
+            self._journal.close()
+        with open(jpath + '.tmp', 'w') as f:
+            f.write('%d'%self._rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(jpath + '.tmp', jpath)
+        self._journal = open(jpath, 'a')
 
     def close(self):
+        if getattr(self, '_closed', True):
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
         self._f.close()
+        self._journal.close()
+        atexit.unregister(self.close)
+        if self._error is not None: # keep the journal for `recover_tsv`
+            raise self._error
+        os.remove(_journal_path(self.fpath)) # log is complete
 
     def __del__(self):
         self.close()
+
+
+def recover_tsv(fpath):
+    '''
+    Restores a TSVLogger's file after a crash, keeping the rows that were
+    known to be on disk and adding back the rest from the journal (except
+    a row cut off mid-write, which fails its checksum), then removes the
+    journal.
+
+    Returns
+    ----------
+    n_rows : int | None
+        Number of rows in the recovered file, or None if there was no
+        journal (i.e. the log was closed cleanly).
+    '''
+    jpath = _journal_path(fpath)
+    if not os.path.exists(jpath): # closed cleanly
+        return None
+    with open(jpath) as f:
+        synced, *journaled = f.read().split('\n')
+    with open(fpath) as f:
+        header, *rows = f.read().split('\n')
+    rows = rows[:int(synced)]
+    for entry in journaled:
+        row, _, checksum = entry.rpartition('\t')
+        if checksum == _checksum(row):
+            rows.append(row)
+    with open(fpath + '.tmp', 'w') as f:
+        f.write('\n'.join([header] + rows))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(fpath + '.tmp', fpath)
+    os.remove(jpath)
+    return len(rows)
+
+
+class FlipTimingLogger:
+
+    def __init__(self, sub, task, run = None, dir = 'logs'):
+        '''
+        Collects the raw flip times recorded by a Timeline on each trial of a
+        block, and saves them as a compressed .npz sidecar to the block's TSV
+        log when closed.
+
+        The file holds three arrays with one entry per flip: 'trial',
+        'flip_index' and 'flip_time' (seconds since the trial's first flip).
+
+        Parameters
+        ----------
+        sub : str
+            A subject ID.
+        task : str
+            A task ID/name.
+        run : int, default: None
+            Block number, for tasks that span more than one block.
+        dir : str
+            Root log directory, as for TSVLogger.
+        '''
+        dir = _beh_dir(sub, dir)
+        run = '' if run is None else '_run-%d'%run
+        fname = 'sub-%s_task-%s%s_frametiming.npz'%(sub, task, run)
+        self.fpath = os.path.join(dir, fname)
+        self._trials = []
+        self._flip_indices = []
+        self._flip_times = []
+        self._closed = False
+
+    def write(self, trial, flip_times, flip_indices, **params):
+        '''
+        Adds one trial's flips. Extra keyword arguments are ignored, so you
+        can pass a whole `trial_data` dict from a trial run with frame timing
+        recorded, e.g. `timing_log.write(trial = 1, **trial_data)`.
+        '''
+        n = len(flip_times)
+        self._trials.append(np.full(n, trial, dtype = np.int16))
+        self._flip_indices.append(np.asarray(flip_indices, dtype = np.int32))
+        self._flip_times.append(np.asarray(flip_times, dtype = np.float64))
+
+    def close(self):
+        if self._closed:
+            return
+        np.savez_compressed(
+            self.fpath,
+            trial = np.concatenate(self._trials or [np.empty(0, np.int16)]),
+            flip_index = np.concatenate(
+                self._flip_indices or [np.empty(0, np.int32)]
+                ),
+            flip_time = np.concatenate(
+                self._flip_times or [np.empty(0, np.float64)]
+                )
+            )
+        self._closed = True
+
+    def __del__(self):
+        self.close()
+
+
+# one record per flip in a FrameLogger's file
+FRAME_DTYPE = np.dtype([
+    ('trial', np.int32),
+    ('flip', np.int32), # index from the trial's Timeline
+    ('t', np.float64), # seconds since the trial's first flip
+    ('mask_index', np.int16), # see CFSMask.update_mask
+    ('hand_index', np.int16), # see LibetClock.draw
+    ('hand_angle', np.float32),
+    ('cursor_angle', np.float32),
+    ('feedback_angle', np.float32),
+    ('trial_ended', np.bool_), # response given, so feedback is up
+    ('stim_visible', np.bool_),
+    ('catch_visible', np.bool_)
+    ])
+
+class FrameLogger:
+
+    def __init__(self, sub, task, run = None, dir = 'logs', chunk_size = 4096):
+        '''
+        Records what was on screen on every flip of a block: which Mondrian
+        the CFS mask showed, where the clock hand, cursor and feedback
+        marker were, and whether the masked stimuli were visible.
+
+        Records go into a preallocated structured array (see FRAME_DTYPE),
+        one field at a time, and are appended to a raw binary file between
+        trials (or whenever `chunk_size` records have built up). On close,
+        a JSON index next to it gives the record range of each trial; read
+        it back with `read_frames`.
+
+        Parameters
+        ----------
+        sub : str
+            A subject ID.
+        task : str
+            A task ID/name.
+        run : int, default: None
+            Block number, for tasks that span more than one block.
+        dir : str
+            Root log directory, as for TSVLogger.
+        chunk_size : int, default: 4096
+            Number of records buffered in memory.
+        '''
+        dir = _beh_dir(sub, dir)
+        run = '' if run is None else '_run-%d'%run
+        fname = 'sub-%s_task-%s%s_frames.dat'%(sub, task, run)
+        self.fpath = os.path.join(dir, fname)
+        self._f = open(self.fpath, 'wb')
+        self._buf = np.zeros(chunk_size, dtype = FRAME_DTYPE)
+        self._fields = [self._buf[name] for name in FRAME_DTYPE.names]
+        self._n = 0 # records in buffer
+        self._written = 0 # records in file
+        self._index = dict() # trial -> [first record, end]
+        self.trial = None
+        self._closed = False
+
+    def begin_trial(self, trial):
+        '''
+        Starts recording frames for a new trial, writing out the last one's.
+        '''
+        self._end_trial()
+        self.trial = trial
+        self._index[trial] = [self._written, None]
+
+    def _end_trial(self):
+        if self.trial is not None:
+            self._index[self.trial][1] = self._written + self._n
+        self._flush()
+
+    def record(self, flip, t, mask_index = -1, hand_index = -1,
+                hand_angle = np.nan, cursor_angle = np.nan,
+                feedback_angle = np.nan, trial_ended = False,
+                stim_visible = False, catch_visible = False):
+        '''
+        Adds a record for the flip that just happened. Call right after
+        `Timeline.flip`.
+        '''
+        i = self._n
+        if i == len(self._buf):
+            self._flush()
+            i = 0
+        (trial, flip_, t_, mask, hand, angle, cursor, feedback, ended,
+            stim, catch) = self._fields
+        trial[i] = self.trial
+        flip_[i] = flip
+        t_[i] = t
+        mask[i] = mask_index
+        hand[i] = hand_index
+        angle[i] = hand_angle
+        cursor[i] = cursor_angle
+        feedback[i] = feedback_angle
+        ended[i] = trial_ended
+        stim[i] = stim_visible
+        catch[i] = catch_visible
+        self._n = i + 1
+
+    def _flush(self):
+        if self._n:
+            self._f.write(self._buf[:self._n].tobytes())
+            self._written += self._n
+            self._n = 0
+
+    def close(self):
+        if self._closed:
+            return
+        self._end_trial()
+        self._f.close()
+        with open(_frames_index_path(self.fpath), 'w') as f:
+            json.dump(dict(
+                n_frames = self._written,
+                trials = {str(trial): idx for trial, idx in self._index.items()}
+                ), f)
+        self._closed = True
+
+    def __del__(self):
+        self.close()
+
+
+def _frames_index_path(fpath):
+    return os.path.splitext(fpath)[0] + '.json'
+
+def read_frames(fpath, trial = None):
+    '''
+    Memory-maps the records from a FrameLogger file.
+
+    Returns
+    ----------
+    frames : np.memmap
+        Records with dtype FRAME_DTYPE, for all trials, or for just the
+        given `trial` number.
+    '''
+    frames = np.memmap(fpath, dtype = FRAME_DTYPE, mode = 'r')
+    if trial is None:
+        return frames
+    with open(_frames_index_path(fpath)) as f:
+        start, stop = json.load(f)['trials'][str(trial)]
+    return frames[start:stop]
+
+
+if __name__ == '__main__':
+    # `python -m util.logging <tsv files>` recovers logs after a crash
+    for fpath in sys.argv[1:]:
+        n_rows = recover_tsv(fpath)
+        if n_rows is None:
+            print('%s was closed cleanly.'%fpath)
+        else:
+            print('Recovered %d rows in %s.'%(n_rows, fpath))
@@ -0,0 +1,170 @@
+'''
+Compiles a whole session up front into a seeded, serializable plan: which
+blocks run in what order, and for every trial its practice/catch flags,
+stimulus positions and timing, the clock's start angle and the order of
+Mondrian masks. experiment.py runs the plan and saves it with the logs,
+so a session can be reproduced exactly from the plan file. The only thing
+left to decide at run time is the calibration contrast, which depends on
+the subject's responses.
+'''
+from dataclasses import dataclass, field, asdict
+import numpy as np
+import json
+
+POSITIONS = ['upper_left', 'upper_right', 'lower_left', 'lower_right']
+
+@dataclass
+class TrialPlan:
+    trial: int
+    practice: bool = False
+    catch: bool = None # None on discrimination trials
+    feedback: bool = None # likewise
+    stim_position: str = None
+    stim_onset: float = None # discrimination trials only
+    catch_position: str = None
+    catch_t: float = None
+    start_angle: float = None
+    mask_sequence: list = None
+    backward_mask: int = None
+
+    def trial_kwargs(self):
+        '''
+        arguments for `discrimination_trial` or `clock_trial`
+        '''
+        kwargs = asdict(self)
+        del kwargs['trial'], kwargs['practice']
+        return {key: val for key, val in kwargs.items() if val is not None}
+
+@dataclass
+class BlockPlan:
+    task: str # 'discrimination', 'masked' or 'unmasked'
+    run: int = None
+    masked: bool = True
+    operant: bool = None
+    trials: list = field(default_factory = list)
+
+@dataclass
+class SessionPlan:
+    sub: str
+    seed: int
+    stim_position: str # of the operant stimulus in clock trials
+    blocks: list = field(default_factory = list)
+
+    def block(self, task, run = None):
+        for block in self.blocks:
+            if block.task == task and block.run == run:
+                return block
+        raise Exception('No %s block (run %s) in plan!'%(task, run))
+
+    def save(self, fpath):
+        with open(fpath, 'w') as f:
+            json.dump(asdict(self), f, indent = 1)
+
+    @classmethod
+    def load(cls, fpath):
+        with open(fpath) as f:
+            plan = json.load(f)
+        blocks = []
+        for block in plan.pop('blocks'):
+            trials = [TrialPlan(**trial) for trial in block.pop('trials')]
+            blocks.append(BlockPlan(trials = trials, **block))
+        return cls(blocks = blocks, **plan)
+
+
+def _mask_plan(rng, n_mondrians, n_masks, length):
+    return dict(
+        mask_sequence = rng.integers(n_mondrians, size = length).tolist(),
+        backward_mask = int(rng.integers(n_masks))
+        )
+
+def compile_session(sub, n_mondrians, n_masks, calibration_trials = 100,
+                    clock_block_trials = 40, practice_trials = 5,
+                    catch_trials = 5, clock_period = 2.56,
+                    presentation_rate = 10., seed = None):
+    '''
+    Plans a session: a calibration block of (at most) `calibration_trials`
+    discrimination trials, then two masked and two unmasked clock blocks,
+    operant and baseline in the same random order for both.
+
+    Each clock block starts with `practice_trials` practice trials (with
+    feedback), followed by `clock_block_trials` trials; in masked blocks,
+    one practice trial and `catch_trials` of the rest, in random positions,
+    are catch trials.
+
+    Arguments
+    ----------
+    sub : str
+        The subject ID.
+    n_mondrians, n_masks : int
+        How many Mondrians and backward masks there are to choose from, as
+        in the window's `TextureCache`.
+    clock_period : float, default: 2.56
+        Period of the Libet clock, for timing catch stimuli.
+    presentation_rate : float, default: 10.
+        Rate of mask updates, for the length of mask sequences.
+    seed : int, default: None
+        Seed for the plan; if None, a fresh one is drawn (and recorded).
+
+    Returns
+    ----------
+    plan : SessionPlan
+    '''
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy)
+    rng = np.random.default_rng(seed)
+    # masks run 2 s on discrimination trials; clock trials run for however
+    # long the subject takes, so sequences start over if they're too short
+    n_discrim_masks = int(np.ceil(2. * presentation_rate))
+    n_clock_masks = int(np.ceil(4*clock_period * presentation_rate))
+    plan = SessionPlan(
+        sub = sub,
+        seed = seed,
+        stim_position = str(rng.choice(POSITIONS))
+        )
+
+    ## calibration block
+    block = BlockPlan('discrimination')
+    for trial in range(1, calibration_trials + 1):
+        block.trials.append(TrialPlan(
+            trial = trial,
+            stim_position = str(rng.choice(POSITIONS)),
+            stim_onset = float(rng.uniform(.25, 2. - .25)),
+            **_mask_plan(rng, n_mondrians, n_masks, n_discrim_masks)
+            ))
+    plan.blocks.append(block)
+
+    ## clock blocks
+    operant = [True, False]
+    rng.shuffle(operant)
+    for masked in (True, False):
+        for run in (1, 2):
+            block = BlockPlan(
+                'masked' if masked else 'unmasked', run,
+                masked = masked,
+                operant = operant[run - 1]
+                )
+            # figure out trial order (i.e. which will be catch trials)
+            if masked:
+                _catch = catch_trials*[True] + clock_block_trials*[False]
+                catch_practice = [True] + (practice_trials - 1)*[False]
+            else: # no catch trials needed if no masking
+                _catch = clock_block_trials*[False]
+                catch_practice = practice_trials*[False]
+            rng.shuffle(_catch)
+            rng.shuffle(catch_practice)
+            _catch = catch_practice + _catch
+            for trial, catch in enumerate(_catch, 1):
+                practice = trial <= practice_trials
+                block.trials.append(TrialPlan(
+                    trial = trial,
+                    practice = practice,
+                    catch = catch,
+                    feedback = practice,
+                    stim_position = plan.stim_position,
+                    catch_position = str(rng.choice(POSITIONS)),
+                    catch_t = float(rng.uniform(.5, clock_period - .5)),
+                    start_angle = float(rng.uniform(0, 2*np.pi)),
+                    **_mask_plan(rng, n_mondrians, n_masks, n_clock_masks)
+                    ))
+            plan.blocks.append(block)
+    return plan
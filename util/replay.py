@@ -0,0 +1,204 @@
+'''
+Re-renders trials from a session's logs, to check what a subject actually
+saw or to make figures without running the task again. Every frame is
+drawn from the state recorded for it by a FrameLogger, with positions and
+backward masks from the session plan and contrasts from the TSV log, so
+nothing is left to chance or to timing: frames are drawn to the back
+buffer and read out as fast as the GL context allows, in a pool of
+processes with a hidden window each. Run e.g.::
+
+    python -m util.replay logs/sub-01 masked --run 1 --trials 1 2 3
+
+which writes each trial's frames to `replay/sub-01_task-masked_run-1_trial-1.npy`
+etc., as (n_frames, height, width, 3) uint8 arrays.
+'''
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import argparse
+import os
+
+from .cfs import CFSMask, MaskedStimulus
+from .clock import LibetClock
+from .logging import read_frames
+from .plan import SessionPlan
+from .simulation import offscreen_window
+
+# settings from experiment.py
+SCREEN_SIZE = (1920, 1080)
+MASK_SIZE = 370
+MASK_COLOR = (1, 0, 0)
+STIM_COLOR = (0, 0, 1)
+
+def _task_fname(sub, task, run, suffix):
+    run = '' if run is None else '_run-%d'%run
+    return 'sub-%s_task-%s%s_%s'%(sub, task, run, suffix)
+
+def read_contrasts(fpath):
+    '''
+    Reads the contrast of each trial from a TSVLogger file.
+
+    Returns
+    ----------
+    contrasts : list[dict]
+        For each block in the file (a new block starts whenever the trial
+        number goes down), maps trial numbers to contrasts.
+    '''
+    with open(fpath) as f:
+        header, *rows = f.read().split('\n')
+    fields = header.split('\t')
+    trial_col, contrast_col = fields.index('trial'), fields.index('contrast')
+    contrasts = []
+    last_trial = np.inf
+    for row in rows:
+        vals = row.split('\t')
+        trial = int(vals[trial_col])
+        if trial <= last_trial:
+            contrasts.append(dict())
+        contrasts[-1][trial] = float(vals[contrast_col])
+        last_trial = trial
+    return contrasts
+
+class TrialRenderer:
+    '''
+    Draws logged frames of trials to a window, and reads them back.
+    '''
+
+    def __init__(self, win, mask_color = MASK_COLOR, mask_size = MASK_SIZE,
+                    stim_color = STIM_COLOR):
+        self.win = win
+        self.mask_color = mask_color
+        self.mask_size = mask_size
+        self.stim_color = stim_color
+        radius = np.sqrt(2*(mask_size/2)**2)
+        self.clock = LibetClock(win, None, radius, pos = (0, 0))
+        self.clock.close() # only drawn by hand
+
+    def render(self, frames, trial_plan, contrast, show_clock, out):
+        '''
+        Renders one trial's `frames` (from `read_frames`) into `out`, an
+        array of shape (len(frames), height, width, 3).
+        '''
+        mask = CFSMask(
+            self.win, self.mask_color,
+            size = self.mask_size,
+            autodraw = False,
+            backward_mask = trial_plan.backward_mask
+            )
+        stim = MaskedStimulus(
+            self.win, self.stim_color, self.mask_size,
+            contrast = contrast,
+            position = trial_plan.stim_position
+            )
+        catch_stim = MaskedStimulus(
+            self.win, self.stim_color, self.mask_size,
+            contrast = 1.,
+            position = trial_plan.catch_position
+            )
+        for i, frame in enumerate(frames):
+            mask.draw_frame(frame['mask_index'])
+            if frame['stim_visible']:
+                stim.circle.draw()
+            if frame['catch_visible']:
+                catch_stim.circle.draw()
+            if show_clock:
+                self.clock.draw_state(
+                    frame['hand_angle'], frame['cursor_angle'],
+                    frame['feedback_angle'], frame['trial_ended']
+                    )
+            out[i] = np.asarray(self.win.getMovieFrame(buffer = 'back'))
+            self.win.movieFrames = []
+            self.win.clearBuffer()
+        del mask
+
+_renderer = None # one per worker process
+
+def _init_worker(win_size, renderer_kwargs):
+    global _renderer
+    win = offscreen_window(size = win_size, units = 'pix')
+    _renderer = TrialRenderer(win, **renderer_kwargs)
+
+def _render_trial(frames_path, trial, trial_plan, contrast, show_clock, out_path):
+    frames = read_frames(frames_path, trial)
+    w, h = _renderer.win.size
+    out = np.lib.format.open_memmap(
+        out_path, mode = 'w+', dtype = np.uint8,
+        shape = (len(frames), h, w, 3)
+        )
+    _renderer.render(frames, trial_plan, contrast, show_clock, out)
+    out.flush()
+    return out_path
+
+def replay_trials(sub_dir, task, run = None, trials = None, out_dir = 'replay',
+                    workers = None, win_size = SCREEN_SIZE, **renderer_kwargs):
+    '''
+    Renders trials of one block of a session, in parallel.
+
+    Arguments
+    ----------
+    sub_dir : str
+        A subject's log directory, e.g. 'logs/sub-01', which must contain
+        the session plan and the block's TSV and frame logs.
+    task : str
+        'discrimination', 'masked' or 'unmasked'.
+    run : int, default: None
+        The block of the task, for clock tasks.
+    trials : list[int], default: None
+        Trial numbers to render, or None for all logged trials.
+    out_dir : str, default: 'replay'
+        Where to write each trial's frames, as a .npy file.
+    workers : int, default: None
+        Number of processes, each with its own window; by default, one per
+        CPU.
+    win_size : tuple, default: SCREEN_SIZE
+        Window size in pixels; the mask is drawn in the middle.
+    **renderer_kwargs
+        Colors and mask size, if not as in experiment.py (see TrialRenderer).
+
+    Returns
+    ----------
+    paths : list[str]
+        The .npy file of each trial, in order.
+    '''
+    beh_dir = os.path.join(sub_dir, 'beh')
+    sub = os.path.basename(os.path.normpath(sub_dir))[len('sub-'):]
+    plan = SessionPlan.load(os.path.join(beh_dir, 'sub-%s_plan.json'%sub))
+    block = plan.block(task, run)
+    contrasts = read_contrasts(
+        os.path.join(beh_dir, 'sub-%s_task-%s_beh.tsv'%(sub, task))
+        )[0 if run is None else run - 1]
+    frames_path = os.path.join(beh_dir, _task_fname(sub, task, run, 'frames.dat'))
+    if trials is None:
+        trials = sorted(contrasts)
+    plans = {trial_plan.trial: trial_plan for trial_plan in block.trials}
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    jobs = [
+        (
+            frames_path, trial, plans[trial], contrasts[trial],
+            task != 'discrimination',
+            os.path.join(out_dir, _task_fname(sub, task, run, 'trial-%d.npy'%trial))
+            )
+        for trial in trials]
+    with ProcessPoolExecutor(
+        workers or os.cpu_count(),
+        initializer = _init_worker,
+        initargs = (win_size, renderer_kwargs)
+        ) as pool:
+        return list(pool.map(_render_trial, *zip(*jobs)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.split('\n\n')[0])
+    parser.add_argument('sub_dir')
+    parser.add_argument('task')
+    parser.add_argument('--run', type = int, default = None)
+    parser.add_argument('--trials', type = int, nargs = '*', default = None)
+    parser.add_argument('--out', default = 'replay')
+    parser.add_argument('--workers', type = int, default = None)
+    args = parser.parse_args()
+    paths = replay_trials(
+        args.sub_dir, args.task, args.run, args.trials,
+        out_dir = args.out,
+        workers = args.workers
+        )
+    print('\n'.join(paths))
@@ -0,0 +1,183 @@
+'''
+Tools for running the whole protocol without a subject, in virtual time:
+
+- `install_virtual_time` replaces psychopy's clocks with ones that only
+  advance when the window flips (or `core.wait` is called), so sessions run
+  as fast as the machine can render, while every component still sees a
+  steady frame rate.
+- `offscreen_window` opens a hidden window that doesn't wait for vsync.
+- `SimulatedObserver` stands in for the keyboard, and answers like an
+  observer with a Weibull psychometric function and a simple intentional
+  binding model.
+
+See `python experiment.py --simulate` for how they fit together.
+'''
+from psychopy import core
+import numpy as np
+
+from .cfs import init_window, MaskedStimulus
+from .clock import LibetClock
+from .input.scripted import ScriptedKeyboard
+
+_now = [0.] # virtual time, in seconds
+
+def advance(secs):
+    _now[0] += secs
+
+class VirtualClock:
+    '''
+    drop-in for psychopy.core.Clock that reads virtual time
+    '''
+
+    def __init__(self):
+        self._timeAtLastReset = _now[0]
+
+    def getTime(self, applyZero = True):
+        return _now[0] - self._timeAtLastReset
+
+    def reset(self, newT = 0.):
+        self._timeAtLastReset = _now[0] + newT
+
+    def getLastResetTime(self):
+        return self._timeAtLastReset
+
+    def add(self, t):
+        self._timeAtLastReset += t
+
+def install_virtual_time():
+    '''
+    Makes every psychopy Clock created from now on virtual, and makes
+    `core.wait` advance virtual time instead of sleeping. Call this before
+    anything creates a clock.
+    '''
+    core.Clock = VirtualClock
+    core.wait = lambda secs, hogCPUperiod = .2: advance(secs)
+
+def offscreen_window(frame_rate = 60., **kwargs):
+    '''
+    Opens a hidden window (see `init_window`) that flips without waiting for
+    vsync, and advances virtual time by one frame on every flip, which is
+    also what `win.flip()` returns. Psychopy still needs a display (e.g.
+    Xvfb) to create the GL context.
+    '''
+    win = init_window(waitBlanking = False, **kwargs)
+    win.winHandle.set_visible(False)
+    win.monitorFramePeriod = 1. / frame_rate # what a Timeline will assume
+    flip = win.flip
+    def _flip(*args, **kwargs):
+        flip(*args, **kwargs)
+        advance(1. / frame_rate)
+        return _now[0]
+    win.flip = _flip
+    return win
+
+
+def weibull(log_contrast, threshold, beta, delta, gamma):
+    '''
+    probability of a correct/'yes' response, as parameterized for QUEST
+    '''
+    x = 10**(beta * (log_contrast - threshold))
+    return delta*gamma + (1 - delta)*(1 - (1 - gamma)*np.exp(-x))
+
+class SimulatedObserver(ScriptedKeyboard):
+    '''
+    A scripted keyboard that responds like an observer.
+
+    - Instructions: presses space.
+    - Discrimination trials: reports the side of the circle correctly with
+      probability `weibull(log10(contrast), threshold, beta, .01, .5)`,
+      and guesses otherwise.
+    - Clock trials: presses space at a random time after the first
+      rotation, then moves the cursor to where the press was perceived: the
+      true angle, shifted later by `binding` seconds if an operant stimulus
+      followed the press (plus `bias`), with Gaussian noise of `noise_sd`
+      seconds. Reports seeing a circle with probability given by the same
+      Weibull function for each circle shown, but with a `false_alarm` rate
+      at zero contrast in place of chance.
+
+    Call `install` so the observer knows what was presented.
+    '''
+
+    def __init__(self, threshold = -1., beta = 3.5, false_alarm = .02,
+                    binding = .03, bias = 0., noise_sd = .05,
+                    frame_rate = 60.):
+        ScriptedKeyboard.__init__(self, self._press_script, self._choose)
+        self.threshold = threshold
+        self.beta = beta
+        self.false_alarm = false_alarm
+        self.binding = binding
+        self.bias = bias
+        self.noise_sd = noise_sd
+        self.frame_rate = frame_rate
+        self._presented = [] # (position, contrast) since the last question
+        self._reported = 0 # how many of those were before a clock response
+        self._clock_trial = False
+
+    def install(self):
+        '''
+        hooks into stimulus presentation and the Libet clock's keypress
+        handling, so the observer can see them
+        '''
+        observer = self
+        present = MaskedStimulus.present
+        def _present(stim, *args, **kwargs):
+            observer._presented.append((stim.position, stim.circle.contrast))
+            return present(stim, *args, **kwargs)
+        MaskedStimulus.present = _present
+        critical_event = LibetClock.critical_event
+        def _critical_event(clock, t):
+            n = len(observer._presented)
+            critical_event(clock, t) # cues any operant stimulus
+            operant = any(c > 0 for _, c in observer._presented[n:])
+            observer._plan_report(clock, operant)
+        LibetClock.critical_event = _critical_event
+
+    def _press_script(self):
+        # a clock trial is starting, so forget what was shown on any
+        # previous one that didn't end with a question
+        self._presented = self._presented[self._reported:]
+        self._reported = 0
+        period = 2.56 # LibetClock's default
+        return [(np.random.uniform(period + .2, period + 1.5), 'space')]
+
+    def _plan_report(self, clock, operant):
+        self._clock_trial = True
+        self._reported = len(self._presented)
+        shift_t = self.bias + self.binding*operant
+        shift_t += np.random.normal(0, self.noise_sd)
+        target = clock._event_angle + shift_t / clock.period * 2*np.pi
+        delta = target - clock._resp_angle # from where the cursor starts
+        delta = (delta + np.pi) % (2*np.pi) - np.pi
+        speed = .5*np.pi / clock._n_positions # per frame, see update_cursor
+        hold = np.round(np.abs(delta) / speed) / self.frame_rate
+        t = clock._choice_t + .2
+        if hold > 0:
+            self.press(t, 'right' if delta > 0 else 'left', hold)
+        self.press(t + hold + .2, 'space')
+
+    def _choose(self, keys):
+        if keys == ['space']:
+            return 'space'
+        if self._clock_trial: # 'Did you see a circle?' left is yes
+            p_miss = 1. - self.false_alarm
+            for _, contrast in self._presented:
+                if contrast > 0:
+                    p_miss *= 1. - weibull(
+                        np.log10(contrast), self.threshold, self.beta, .01, 0.
+                        )
+            seen = np.random.uniform() > p_miss
+            resp = 'left' if seen else 'right'
+        else: # 'Which side was the circle on?'
+            position, contrast = self._presented[-1]
+            side = 'left' if 'left' in position else 'right'
+            p_correct = weibull(
+                np.log10(max(contrast, 1e-6)), self.threshold, self.beta, .01, .5
+                )
+            if np.random.uniform() < p_correct:
+                resp = side
+            else:
+                resp = 'right' if side == 'left' else 'left'
+        self._presented = []
+        self._reported = 0
+        self._clock_trial = False
+        return resp
@@ -0,0 +1,241 @@
+from psychopy import core
+import numpy as np
+
+# extra TSVLogger fields filled in by `Timeline.timing_summary`
+FRAME_TIMING_FIELDS = [
+    'n_flips', 'dropped_frames', 'max_flip_interval',
+    'flip_jitter_50th_perc', 'flip_jitter_95th_perc', 'flip_jitter_99th_perc'
+    ]
+
+class TimelineEvent:
+    '''
+    Something scheduled to be on screen from one flip until (but not
+    including) another. Created by `Timeline.schedule`.
+
+    Attributes
+    ----------
+    name : str
+    onset_flip : int
+        Index of the first flip the event should be visible on.
+    offset_flip : int | None
+        Index of the first flip it should no longer be visible on, or None
+        if it lasts until the end of the timeline.
+    planned_onset, planned_offset : float
+        When those flips should happen, in seconds since the timeline's
+        first flip.
+    actual_onset, actual_offset : float | None
+        When they did happen, on the same scale, or None if the event was
+        never shown (e.g. its whole window fell in a run of dropped frames)
+        or has not ended.
+    '''
+
+    def __init__(self, timeline, name, onset_flip, offset_flip):
+        self._timeline = timeline
+        self.name = name
+        self.onset_flip = onset_flip
+        self.offset_flip = offset_flip
+        self.planned_onset = onset_flip * timeline.frame_period
+        if offset_flip is None:
+            self.planned_offset = None
+        else:
+            self.planned_offset = offset_flip * timeline.frame_period
+        self.actual_onset = None
+        self.actual_offset = None
+
+    def covers(self, flip):
+        if flip < self.onset_flip:
+            return False
+        return self.offset_flip is None or flip < self.offset_flip
+
+    @property
+    def active(self):
+        '''
+        whether the event should be drawn for the upcoming flip
+        '''
+        return self.covers(self._timeline.next_flip)
+
+    @property
+    def completed(self):
+        if self.offset_flip is None:
+            return False
+        return self._timeline.next_flip >= self.offset_flip
+
+    def _on_flip(self, flip, t):
+        if self.actual_onset is None and self.covers(flip):
+            self.actual_onset = t
+        if self.actual_offset is None and self.actual_onset is not None:
+            if not self.covers(flip):
+                self.actual_offset = t
+
+
+class Timeline:
+    '''
+    A flip-locked schedule shared by everything drawn in a trial, so that
+    the CFS mask, masked stimuli and Libet clock all agree on which frame
+    is coming up next.
+
+    Every flip is assigned an index from its timestamp (as returned by
+    `win.flip()`) and the monitor's measured refresh interval, rather than
+    by counting flips, so after a dropped frame the index jumps ahead and
+    all scheduled events stay in sync with real time.
+
+    Usage
+    -------
+    Replace `win.flip()` in a trial loop with `timeline.flip()`::
+
+        timeline = Timeline(win)
+        stim_event = timeline.schedule(.5, duration = .2, name = 'stimulus')
+        while not stim_event.completed:
+            if stim_event.active:
+                stim.draw()
+            timeline.flip()
+        stim_event.actual_onset - stim_event.planned_onset # onset error
+
+    '''
+
+    def __init__(self, win, frame_rate = None, record = False):
+        '''
+        Arguments
+        ----------
+        win : psychopy.visual.Window
+        frame_rate : float, default: None
+            The refresh rate of the monitor. If None, it is taken from
+            `win.monitorFramePeriod` (which psychopy measures when the
+            window opens), or measured with `win.getActualFrameRate()`.
+            Only pass a nominal rate (e.g. 60.) if it's exact, since the
+            flip index drifts by the difference over a trial.
+        record : bool, default: False
+            Whether to keep the time and index of every flip, for
+            `timing_summary` and for writing out with a FlipTimingLogger.
+        '''
+        self.win = win
+        if frame_rate is None:
+            period = getattr(win, 'monitorFramePeriod', None)
+            if period is not None:
+                frame_rate = 1. / period
+            else:
+                frame_rate = win.getActualFrameRate()
+            if frame_rate is None:
+                raise Exception('Could not measure the refresh rate of %s!'%win)
+        self.frame_rate = frame_rate
+        self.frame_period = 1. / frame_rate
+        self.clock = core.Clock()
+        self.events = []
+        self.dropped_frames = 0
+        self.last_flip = -1 # index of the most recent flip
+        self._t0 = None # timestamp of flip 0, from `win.flip()`
+        self._clock_t0 = None # and `self.clock` reading just after it
+        self.record = record
+        self.flip_times = []
+        self.flip_indices = []
+
+    @property
+    def next_flip(self):
+        '''
+        index of the flip that whatever is drawn now will appear on
+        '''
+        return self.last_flip + 1
+
+    def flip_time(self, flip):
+        '''
+        scheduled time of a given flip, in seconds since flip 0
+        '''
+        return flip * self.frame_period
+
+    def now(self):
+        '''
+        current time, in seconds since flip 0
+        '''
+        return self.since_first_flip(self.clock.getTime())
+
+    def since_first_flip(self, t):
+        '''
+        Converts a reading of `self.clock` to seconds since flip 0. Before
+        the first flip, the first flip is assumed to be happening now.
+        '''
+        if self._clock_t0 is None:
+            return t - self.clock.getTime()
+        return t - self._clock_t0
+
+    def schedule(self, time_from_now, duration = None, name = None):
+        '''
+        Schedules an event relative to the upcoming flip.
+
+        Arguments
+        ----------
+        time_from_now : float
+            Delay in seconds; rounded to the nearest frame.
+        duration : float, default: None
+            How long the event lasts, also rounded to whole frames. If None,
+            it lasts until the end of the timeline.
+        name : str, default: None
+
+        Returns
+        ----------
+        event : TimelineEvent
+        '''
+        onset = self.next_flip + int(np.round(time_from_now / self.frame_period))
+        if duration is None:
+            offset = None
+        else:
+            offset = onset + max(1, int(np.round(duration / self.frame_period)))
+        event = TimelineEvent(self, name, onset, offset)
+        self.events.append(event)
+        return event
+
+    def flip(self):
+        '''
+        Flips the window and works out which flip index that was.
+
+        Returns
+        ----------
+        t : float
+            Time of the flip, in seconds since flip 0.
+        '''
+        t = self.win.flip()
+        if t is None: # not a psychopy window, so timestamp it ourselves
+            t = self.clock.getTime()
+        if self._t0 is None:
+            self._t0 = t
+            self._clock_t0 = self.clock.getTime()
+            flip = 0
+        else: # index from timestamp, but always at least one frame later
+            flip = int(np.round((t - self._t0) / self.frame_period))
+            flip = max(flip, self.last_flip + 1)
+            self.dropped_frames += flip - self.last_flip - 1
+        self.last_flip = flip
+        t -= self._t0
+        if self.record:
+            self.flip_times.append(t)
+            self.flip_indices.append(flip)
+        for event in self.events:
+            event._on_flip(flip, t)
+        return t
+
+    def timing_summary(self):
+        '''
+        Summarizes recorded flips for logging. Jitter is how far each
+        interval between flips strays from the measured frame period.
+
+        Returns
+        ----------
+        summary : dict
+            Values for each of FRAME_TIMING_FIELDS, in seconds where
+            applicable ('n/a' if fewer than two flips were recorded).
+        '''
+        intervals = np.diff(self.flip_times)
+        summary = dict(
+            n_flips = len(self.flip_times),
+            dropped_frames = self.dropped_frames
+            )
+        if intervals.size == 0:
+            for field in FRAME_TIMING_FIELDS[2:]:
+                summary[field] = 'n/a'
+            return summary
+        jitter = np.abs(intervals - self.frame_period)
+        summary['max_flip_interval'] = intervals.max()
+        percs = np.percentile(jitter, [50, 95, 99])
+        summary['flip_jitter_50th_perc'] = percs[0]
+        summary['flip_jitter_95th_perc'] = percs[1]
+        summary['flip_jitter_99th_perc'] = percs[2]
+        return summary
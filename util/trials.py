@@ -5,8 +5,169 @@ import numpy as np
 
 from .cfs import CFSMask, MaskedStimulus
 from .clock import LibetClock
+from .timeline import Timeline
 
-def _collect_2AFC_resp(win, kb, question, choices):
+_clocks = dict() # one LibetClock per window/keyboard/size, reused across trials
+
+def _clock_key(win, kb, radius, continuous):
+    return (id(win), id(kb), radius, continuous)
+
+def _get_clock(win, kb, radius, continuous = False, **trial_kwargs):
+    '''
+    Returns a LibetClock ready for a new trial, only building it the first
+    time it's needed. `trial_kwargs` are passed to LibetClock.reset.
+    '''
+    key = _clock_key(win, kb, radius, continuous)
+    if key not in _clocks:
+        _clocks[key] = LibetClock(
+            win, kb, radius,
+            pos = (0, 0),
+            continuous = continuous,
+            **trial_kwargs
+            )
+    else:
+        _clocks[key].reset(**trial_kwargs)
+    return _clocks[key]
+
+def prepare_trial(win, kb, mask_color, mask_size, stim_color,
+                    stim_position = None, catch_position = None,
+                    mask_sequence = None, backward_mask = None,
+                    frame_rate = 60., frame_timing = False,
+                    continuous_clock = False, **unused):
+    '''
+    Builds the stimuli for a discrimination or clock trial, without
+    putting anything on screen. Takes the same arguments as those
+    functions (any not needed to build stimuli are ignored), except that
+    the stimulus contrast is set when the trial starts, so it needn't be
+    known yet. Also builds the trial's LibetClock if it's the first.
+
+    Returns
+    ----------
+    timeline : util.timeline.Timeline
+    mask : CFSMask
+        Not yet shown; call `mask.show()` when the trial starts.
+    stim : MaskedStimulus
+    catch_stim : MaskedStimulus
+        A full-contrast stimulus at a random position, for catch trials.
+    '''
+    timeline = Timeline(win, record = frame_timing)
+    mask = CFSMask(
+        win, mask_color,
+        size = mask_size,
+        timeline = timeline,
+        autodraw = False,
+        sequence = mask_sequence,
+        backward_mask = backward_mask
+        )
+    stim = MaskedStimulus(
+        win, stim_color, mask_size,
+        contrast = 0.,
+        position = stim_position,
+        timeline = timeline
+        )
+    catch_stim = MaskedStimulus(
+        win, stim_color, mask_size,
+        contrast = 1.,
+        position = catch_position, # if None, chosen randomly
+        timeline = timeline
+        )
+    radius = np.sqrt(2*(mask_size/2)**2)
+    if _clock_key(win, kb, radius, continuous_clock) not in _clocks:
+        _get_clock(win, kb, radius, continuous_clock).close()
+    return timeline, mask, stim, catch_stim
+
+def _stimulus_key(win, kb, mask_color, mask_size, stim_color,
+                    stim_position = None, catch_position = None,
+                    mask_sequence = None, backward_mask = None,
+                    frame_rate = 60., frame_timing = False,
+                    continuous_clock = False, **unused):
+    '''
+    what `prepare_trial` builds from a set of trial arguments
+    '''
+    if mask_sequence is not None:
+        mask_sequence = tuple(mask_sequence)
+    return (id(win), id(kb), mask_color, mask_size, stim_color,
+            stim_position, catch_position, mask_sequence, backward_mask,
+            frame_rate, frame_timing, continuous_clock)
+
+class TrialPipeline:
+    '''
+    Builds the next trial's stimuli while the current trial is idle (i.e.
+    waiting for a response, or showing feedback), so that starting the
+    next trial only means switching to them.
+
+    Usage
+    -------
+    Before each trial, queue the arguments the following trial will be
+    run with, and pass the pipeline to the current trial::
+
+        pipeline = TrialPipeline()
+        for params, next_params in zip(trials, trials[1:] + [None]):
+            if next_params is not None:
+                pipeline.queue(**next_params)
+            clock_trial(pipeline = pipeline, **params)
+        pipeline.clear()
+
+    If a trial's arguments turn out not to match what was prepared for it,
+    its stimuli are just built on the spot.
+    '''
+
+    def __init__(self):
+        self._next = None # arguments of the trial to prepare
+        self._key = None # and what was prepared
+        self._prepared = None
+
+    def queue(self, **trial_kwargs):
+        '''
+        sets the arguments of the trial to prepare at the next idle period
+        '''
+        self._next = trial_kwargs
+
+    def prefetch(self):
+        '''
+        prepares the queued trial, if it isn't already
+        '''
+        if self._next is None:
+            return
+        self._key = _stimulus_key(**self._next)
+        self._prepared = prepare_trial(**self._next)
+        self._next = None
+
+    def take(self, **trial_kwargs):
+        '''
+        Returns stimuli for a trial with the given arguments, as from
+        `prepare_trial`, using the prepared ones if they match.
+        '''
+        prepared = self._prepared
+        if prepared is None or self._key != _stimulus_key(**trial_kwargs):
+            prepared = prepare_trial(**trial_kwargs)
+        self.clear(queued = False)
+        return prepared
+
+    def clear(self, queued = True):
+        '''
+        drops anything prepared (and, by default, queued) but not yet used
+        '''
+        self._key = None
+        self._prepared = None
+        if queued:
+            self._next = None
+
+def _start_trial(pipeline, stim_contrast, **trial_kwargs):
+    '''
+    gets stimuli from `pipeline` (or builds them, if None) and readies
+    them for the trial to start
+    '''
+    if pipeline is None:
+        prepared = prepare_trial(**trial_kwargs)
+    else:
+        prepared = pipeline.take(**trial_kwargs)
+    timeline, mask, stim, catch_stim = prepared
+    stim.circle.contrast = stim_contrast
+    mask.show()
+    return prepared
+
+def _collect_2AFC_resp(win, kb, question, choices, while_waiting = None):
     '''
     Arguments
     -----------
@@ -19,6 +180,11 @@ def _collect_2AFC_resp(win, kb, question, choices):
         subjects can press, and entry is the response that button
         corresponds to. Using an OrderedDict is recommended to ensure
         that presentation of choices is consistent across trials.
+    while_waiting : callable, default: None
+        Something to do (e.g. `TrialPipeline.prefetch`) once the question
+        is on screen, before waiting for a response. Keys pressed before
+        the question appears are discarded, but keys pressed in the
+        meantime are still collected.
     '''
     assert(len(choices) == 2)
     vbs = [key for key in choices] # valid buttons
@@ -32,13 +198,37 @@ def _collect_2AFC_resp(win, kb, question, choices):
     msg = question + "\n\nPress '%s' for '%s' or '%s' for '%s.'"%_fill_in
     txt = visual.TextStim(win, text = msg, font = 'Arial')
     txt.draw()
+    kb.clearEvents() # so leftover keys can't answer the question
     win.flip()
-    key = kb.waitKeys(keyList = vbs, clear = True)[0]
+    if while_waiting is not None:
+        while_waiting()
+    key = kb.waitKeys(keyList = vbs, clear = False)[0]
     win.flip() # clear screen
     return choices[key.name]
 
+def _add_frame_timing(trial_data, timeline):
+    '''
+    adds per-flip timing recorded by `timeline` to `trial_data`
+    '''
+    trial_data.update(timeline.timing_summary())
+    trial_data['flip_times'] = timeline.flip_times
+    trial_data['flip_indices'] = timeline.flip_indices
+
+def _stim_latency(clock, stim):
+    '''
+    time from the keypress to the first flip that showed the operant
+    stimulus (nominally the .15 s it was cued for), or 'n/a' if it never
+    appeared
+    '''
+    if stim.event is None or stim.event.actual_onset is None:
+        return 'n/a'
+    return stim.event.actual_onset - clock.to_timeline(clock.get_data()['event_t'])
+
 def discrimination_trial(win, kb, mask_color, mask_size, stim_color,
-                            stim_contrast, frame_rate = 60.):
+                            stim_contrast, stim_position = None, stim_onset = None,
+                            mask_sequence = None, backward_mask = None,
+                            frame_rate = 60., frame_timing = False,
+                            pipeline = None, frame_log = None):
     '''
     Arguments
     -----------
@@ -54,27 +244,64 @@ def discrimination_trial(win, kb, mask_color, mask_size, stim_color,
     stim_contrast : float
         Ranges from 0 to 1. For baseline trials, set to zero, and set to
         something non-zero for operant trials.
+    stim_position : str, default: None
+        Corner of the CFS mask to show the stimulus in (see `clock_trial`),
+        or None for a random one.
+    stim_onset : float, default: None
+        Seconds into the 2 s of masking to show the stimulus, or None for a
+        random time between .25 and 1.75 s.
+    mask_sequence : list[int], default: None
+        Order of Mondrians to show (see CFSMask's `sequence` argument), or
+        None for a random one.
+    backward_mask : int, default: None
+        Which backward mask to end with, or None for a random one.
     frame_rate : float, default: 60.
         The refresh rate of the monitor. This is set by the OS; you're merely
         providing it to the function so it knows how many frames should elapse
         before updating the CFS mask. (In other words, this does *not* change
         the refresh rate on its own.)
+    frame_timing : bool, default: False
+        Whether to record every flip while stimuli are on screen. If True,
+        `trial_data` gets the fields in util.timeline.FRAME_TIMING_FIELDS
+        plus raw 'flip_times' and 'flip_indices' for a FlipTimingLogger.
+    pipeline : TrialPipeline, default: None
+        If given, stimuli prepared during the previous trial are used, and
+        whatever is queued next is prepared while waiting for a response.
+    frame_log : util.logging.FrameLogger, default: None
+        If given, what was on screen on every flip is recorded there, under
+        the trial number last passed to its `begin_trial`.
     '''
     ## present masked stimulus
-    mask = CFSMask(win, mask_color, size = mask_size)
-    stim = MaskedStimulus(win, stim_color, mask_size, contrast = stim_contrast)
+    timeline, mask, stim, _ = _start_trial(
+        pipeline, stim_contrast,
+        win = win,
+        kb = kb,
+        mask_color = mask_color,
+        mask_size = mask_size,
+        stim_color = stim_color,
+        stim_position = stim_position,
+        mask_sequence = mask_sequence,
+        backward_mask = backward_mask,
+        frame_rate = frame_rate,
+        frame_timing = frame_timing
+        )
     cfs_duration = 2. # seconds
     cfs_frames = np.round(cfs_duration * frame_rate).astype(int)
-    count = 0
-    stim_onset = np.random.uniform(.25, cfs_duration - .25)
+    if stim_onset is None:
+        stim_onset = np.random.uniform(.25, cfs_duration - .25)
     stim_pos = stim.present(time_from_now = stim_onset, duration = .2)
     while not mask.completed:
-        count += 1
-        if count > cfs_frames:
+        if timeline.next_flip >= cfs_frames:
             mask.terminate()
         mask.draw() # update stimuli
         stim.draw()
-        win.flip()
+        t = timeline.flip()
+        if frame_log is not None:
+            frame_log.record(
+                timeline.last_flip, t,
+                mask_index = mask.mask_index,
+                stim_visible = stim.visible
+                )
     del mask
 
     ## ask subject what side of mask stimulus appeared on
@@ -82,18 +309,27 @@ def discrimination_trial(win, kb, mask_color, mask_size, stim_color,
     choices = OrderedDict()
     choices['left'] = 'left'
     choices['right'] = 'right'
-    resp = _collect_2AFC_resp(win, kb, question, choices)
+    resp = _collect_2AFC_resp(
+        win, kb, question, choices,
+        while_waiting = pipeline.prefetch if pipeline is not None else None
+        )
     trial_data = dict(
         stimulus_position = stim_pos,
         contrast = stim_contrast,
         response = resp,
         correct = resp in stim_pos,
     )
+    if frame_timing:
+        _add_frame_timing(trial_data, timeline)
     return trial_data
 
 def clock_trial(win, kb, mask_color, mask_size, stim_color,
                     stim_contrast, stim_position = None, feedback = True,
-                    show_mask = True, catch = False, frame_rate = 60.):
+                    show_mask = True, catch = False, catch_position = None,
+                    catch_t = None, start_angle = None, mask_sequence = None,
+                    backward_mask = None, frame_rate = 60.,
+                    frame_timing = False, continuous_clock = False,
+                    pipeline = None, frame_log = None):
     '''
     Measures action binding with a masked operant stimulus.
 
@@ -131,11 +367,38 @@ def clock_trial(win, kb, mask_color, mask_size, stim_color,
         Whether this is a catch trial. On catch trials, an additional masked
         stimulus will be presented, at maximum contrast, during the first
         rotation of the Libet clock.
+    catch_position : str, default: None
+        Corner for the catch trial's stimulus, or None for a random one.
+    catch_t : float, default: None
+        When to show the catch trial's stimulus, in seconds into the first
+        rotation, or None for a random time.
+    start_angle : float, default: None
+        Where the clock hand starts, in radians, or None for a random angle.
+    mask_sequence : list[int], default: None
+        Order of Mondrians to show (see CFSMask's `sequence` argument), or
+        None for a random one.
+    backward_mask : int, default: None
+        Which backward mask to end with, or None for a random one.
     frame_rate : float, default: 60.
         The refresh rate of the monitor. This is set by the OS; you're merely
         providing it to the function so it knows how many frames should elapse
         before updating the CFS mask. (In other words, this does *not* change
         the refresh rate on its own.)
+    frame_timing : bool, default: False
+        Whether to record every flip while stimuli are on screen. If True,
+        `trial_data` gets the fields in util.timeline.FRAME_TIMING_FIELDS
+        plus raw 'flip_times' and 'flip_indices' for a FlipTimingLogger.
+    continuous_clock : bool, default: False
+        Whether to draw the clock hand at its exact angle for the next flip
+        and report the angle that was on screen at the keypress (see
+        LibetClock's `continuous` argument).
+    pipeline : TrialPipeline, default: None
+        If given, stimuli prepared during the previous trial are used, and
+        whatever is queued next is prepared while feedback is shown or
+        while waiting for the awareness response.
+    frame_log : util.logging.FrameLogger, default: None
+        If given, what was on screen on every flip is recorded there, under
+        the trial number last passed to its `begin_trial`.
 
     Returns
     ----------
@@ -143,29 +406,35 @@ def clock_trial(win, kb, mask_color, mask_size, stim_color,
         Dictionary containing information about trial/subject responses.
     '''
     ## setup stimuli
-    mask = CFSMask(win, mask_color, size = mask_size)
-    stim = MaskedStimulus(
-        win, stim_color, mask_size,
-        contrast = stim_contrast,
-        position = stim_position
-        )
-    catch_stim = MaskedStimulus(
-        win, stim_color, mask_size,
-        contrast = 1.,
-        position = None # i.e. choose randomly
+    timeline, mask, stim, catch_stim = _start_trial(
+        pipeline, stim_contrast,
+        win = win,
+        kb = kb,
+        mask_color = mask_color,
+        mask_size = mask_size,
+        stim_color = stim_color,
+        stim_position = stim_position,
+        catch_position = catch_position,
+        mask_sequence = mask_sequence,
+        backward_mask = backward_mask,
+        frame_rate = frame_rate,
+        frame_timing = frame_timing,
+        continuous_clock = continuous_clock
         )
     cue_stim = partial(stim.present, time_from_now = .15, duration = .2)
     radius = np.sqrt(2*(mask_size/2)**2)
-    clock = LibetClock(
-        win, kb,
-        pos = (0, 0),
-        radius = radius,
+    clock = _get_clock(
+        win, kb, radius,
+        continuous = continuous_clock,
         on_event = cue_stim, # executes on keypress,
-        feedback = feedback
+        feedback = feedback,
+        timeline = timeline,
+        start_angle = start_angle
         )
-    if catch: # pick a random time to present during first rotation
+    if catch: # pick a time to present during first rotation, if not given
         assert(.5 < clock.period - .5)
-        catch_t = np.random.uniform(.5, clock.period - .5)
+        if catch_t is None:
+            catch_t = np.random.uniform(.5, clock.period - .5)
         catch_stim.present(time_from_now = catch_t, duration = .2)
 
     ## main trial loop
@@ -178,16 +447,41 @@ def clock_trial(win, kb, mask_color, mask_size, stim_color,
         stim.draw()
         catch_stim.draw()
         clock.draw(frame_rate)
-        win.flip()
+        t = timeline.flip()
+        if frame_log is not None:
+            frame_log.record(
+                timeline.last_flip, t,
+                mask_index = mask.mask_index,
+                hand_index = clock.hand_index,
+                hand_angle = clock.hand_angle,
+                cursor_angle = clock.cursor_angle,
+                feedback_angle = clock.feedback_angle,
+                trial_ended = clock.trial_ended,
+                stim_visible = stim.visible,
+                catch_visible = catch_stim.visible
+                )
     win.flip() # to show feedback
+    if frame_log is not None: # just the clock, and the mask's border and fixation
+        frame_log.record(
+            timeline.last_flip + 1, timeline.now(),
+            cursor_angle = clock.cursor_angle,
+            feedback_angle = clock.feedback_angle,
+            trial_ended = True
+            )
     if feedback:
-        core.wait(2.)
+        waited = core.Clock()
+        if pipeline is not None: # make use of the time
+            pipeline.prefetch()
+        core.wait(max(0., 2. - waited.getTime()))
     trial_data = clock.get_data()
     trial_data['stimulus_position'] = stim.position
     trial_data['catch'] = catch
     trial_data['contrast'] = stim_contrast
     trial_data['masked'] = show_mask
-    del clock
+    trial_data['stim_latency'] = _stim_latency(clock, stim)
+    if frame_timing:
+        _add_frame_timing(trial_data, timeline)
+    clock.close() # stop autodrawing, but keep it for the next trial
     del mask
 
     if show_mask: # ask subject whether they saw a circle stimulus
@@ -195,6 +489,9 @@ def clock_trial(win, kb, mask_color, mask_size, stim_color,
         choices = OrderedDict()
         choices['left'] = 'yes'
         choices['right'] = 'no'
-        resp = _collect_2AFC_resp(win, kb, question, choices)
+        resp = _collect_2AFC_resp(
+            win, kb, question, choices,
+            while_waiting = pipeline.prefetch if pipeline is not None else None
+            )
         trial_data['aware'] = True if resp == 'yes' else False
     return trial_data
@@ -0,0 +1,130 @@
+'''
+Frame access for recorded videos such as demo.py's `side-by-side.mp4`.
+A video is decoded once into a raw RGB frame file next to it (with a
+.frames.json index), which is then memory-mapped, so figures can pick frames by index
+without decoding or re-reading images from disk. Halves and mask-sized
+crops of frames are computed for whole batches of frames at once and kept
+in memory for the next figure.
+'''
+import numpy as np
+import json
+import os
+
+SQR_SIZE = 370 # size of mondrian mask in pixels
+
+def split_frame(images):
+    '''
+    splits side-by-side image(s) into two images
+    (works on a single frame or on a batch of them)
+    '''
+    w = images.shape[-2]
+    return images[..., :w//2, :], images[..., w//2:, :]
+
+def crop_to_square(images, size = SQR_SIZE):
+    '''
+    returns image(s) cropped to size of mask, and the ratio of the mask
+    to the image width
+    '''
+    w = images.shape[-2]
+    x = (w - size) // 2
+    return images[..., x:(x + size), x:(x + size), :], size/w
+
+def _index_path(fpath):
+    return fpath + '.json'
+
+def decode_video(video_path, fpath = None):
+    '''
+    Decodes a video into a raw RGB frame file, unless it already has
+    been since the video last changed.
+
+    Returns
+    ----------
+    fpath : str
+        The frame file; by default, the video's path with a '.frames'
+        extension.
+    '''
+    if fpath is None:
+        fpath = os.path.splitext(video_path)[0] + '.frames'
+    index_path = _index_path(fpath)
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+        if index['mtime'] == os.path.getmtime(video_path):
+            return fpath
+    import cv2
+    vidcap = cv2.VideoCapture(video_path)
+    n_frames = 0
+    shape = None
+    with open(fpath, 'wb') as f:
+        success, image = vidcap.read()
+        while success:
+            f.write(cv2.cvtColor(image, cv2.COLOR_BGR2RGB).tobytes())
+            shape = image.shape
+            n_frames += 1
+            success, image = vidcap.read()
+    vidcap.release()
+    if shape is None:
+        raise Exception("Couldn't read any frames from %s!"%video_path)
+    with open(index_path, 'w') as f:
+        json.dump(dict(
+            n_frames = n_frames,
+            shape = list(shape),
+            mtime = os.path.getmtime(video_path)
+            ), f)
+    return fpath
+
+class VideoFrames:
+    '''
+    A decoded video, as a (n_frames, height, width, 3) uint8 array that
+    can be indexed like one (`frames[i]`, `frames[10:20]`, ...).
+
+    `split` and `crop` take a batch of frame indices and return stacked
+    frames; each distinct frame they compute is cached, so drawing the
+    same frames again (e.g. in the next figure) doesn't touch the file.
+    '''
+
+    def __init__(self, video_path, fpath = None):
+        self.fpath = decode_video(video_path, fpath)
+        with open(_index_path(self.fpath)) as f:
+            index = json.load(f)
+        self.frames = np.memmap(
+            self.fpath, dtype = np.uint8, mode = 'r',
+            shape = tuple([index['n_frames']] + index['shape'])
+            )
+        self._cache = dict() # (side, cropped) -> {frame index: image}
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, idx):
+        return self.frames[idx]
+
+    def _get(self, indices, side, cropped):
+        assert(side in ('left', 'right'))
+        indices = np.atleast_1d(np.asarray(indices)) % len(self.frames)
+        cache = self._cache.setdefault((side, cropped), dict())
+        missing = np.unique([i for i in indices if i not in cache])
+        if len(missing):
+            images = self.frames[missing]
+            images = split_frame(images)[0 if side == 'left' else 1]
+            if cropped:
+                images, _ = crop_to_square(images)
+            images = np.ascontiguousarray(images)
+            cache.update(zip(missing.tolist(), images))
+        return np.stack([cache[i] for i in indices.tolist()])
+
+    def split(self, indices, side):
+        '''
+        the `side` ('left' or 'right') half of each frame in `indices`
+        '''
+        return self._get(indices, side, False)
+
+    def crop(self, indices, side):
+        '''
+        mask-sized crops of the `side` half of each frame in `indices`
+        (see `crop_to_square`)
+        '''
+        return self._get(indices, side, True)
+
+    def clear_cache(self):
+        self._cache = dict()